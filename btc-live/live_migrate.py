@@ -0,0 +1,4 @@
+from live_db_utils import create_database
+
+# Upgrades an existing database in place (text timestamps -> epoch milliseconds, indexes)
+create_database()
@@ -0,0 +1,7 @@
+apt install python3-requests
+apt install python3-numpy
+
+# The storage layer and the trading functions are shared with the demo bot
+export PYTHONPATH=../btc
+
+python3 live_migrate.py
@@ -0,0 +1,215 @@
+import argparse
+import json
+import threading
+import numpy as np
+import storage
+import demo_db_utils
+
+# Crypto trades every day of the year
+PERIODS_PER_YEAR = 365
+
+
+def equity_curve(trades, accounts):
+    '''
+    Computes the realised equity after every Account entry: the balance, or while a position is open, the money put into it.
+
+    :param trades:      As returned by `db_utils.read_trade_array()`
+    :param accounts:    As returned by `db_utils.read_account_array()`
+    :rtype:             Dictionary with 'timestamp' and 'equity' arrays
+    '''
+    equity = accounts['balance'].copy()
+    # A buy empties the balance, so its entry is valued at the amount spent instead
+    bought = (equity == 0.0) & (accounts['trade_id'] > 0)
+    if len(trades['id']):
+        index = np.minimum(np.searchsorted(trades['id'], accounts['trade_id'][bought]), len(trades['id']) - 1)
+        equity[bought] = trades['amount'][index]
+    return {'timestamp': accounts['timestamp'], 'equity': equity}
+
+
+def drawdown(curve):
+    '''
+    Computes how far the equity is below its running peak, and for how long it has been, at every point of an equity curve.
+
+    :param curve:   As returned by `equity_curve()`
+    :rtype:         Dictionary with 'timestamp', 'drawdown' (fraction below the peak, <= 0) and 'duration' (seconds since the peak) arrays
+    '''
+    equity = curve['equity']
+    if not len(equity):
+        return {'timestamp': curve['timestamp'], 'drawdown': np.zeros(0), 'duration': np.zeros(0, dtype=np.int64)}
+    peak = np.maximum.accumulate(equity)
+    # Index of the latest peak at every point
+    at_peak = np.maximum.accumulate(np.where(equity >= peak, np.arange(len(equity)), 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(peak > 0, equity / peak - 1.0, 0.0)
+    seconds = (curve['timestamp'] - curve['timestamp'][at_peak]).astype(np.int64)
+    return {'timestamp': curve['timestamp'], 'drawdown': fraction, 'duration': seconds}
+
+
+def daily_returns(curve):
+    '''
+    Computes the returns of an equity curve between consecutive days' closing equity (UTC), counting days without entries as flat.
+
+    :param curve:   As returned by `equity_curve()`
+    :rtype:         numpy.ndarray of floats
+    '''
+    timestamps, equity = curve['timestamp'], curve['equity']
+    if len(equity) < 2:
+        return np.zeros(0)
+    days = timestamps.astype('datetime64[D]')
+    # Equity at the end of every day from the first entry's day to the last's, after the opening balance
+    ends = np.arange(days[0], days[-1] + np.timedelta64(1, 'D')) + np.timedelta64(1, 'D')
+    closes = equity[np.searchsorted(timestamps, ends, side='left') - 1]
+    closes = np.concatenate(([equity[0]], closes))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(closes) / closes[:-1]
+    return np.where(np.isfinite(returns), returns, 0.0)
+
+
+def _number(x):
+    # Undefined results are reported as None rather than NaN, which is not valid JSON
+    x = float(x)
+    return x if np.isfinite(x) else None
+
+
+class Analytics:
+    '''
+    Performance analytics for one symbol over the Trade and Account tables: P&L, equity curve, drawdowns, trade durations and risk ratios.
+    The tables are held as NumPy arrays and only the entries added since the last call are read. Results are cached until then,
+    so polling costs one query while nothing has been traded.
+
+    :param symbol:              Trading pair, as a string
+    :param periods_per_year:    Days per year, for annualising daily returns, as an integer
+    :param db_utils:            Where the tables are read from: a storage (see storage.py), or a module of storage functions
+                                (defaults to demo_db_utils, the demo database)
+    '''
+    def __init__(self, symbol=storage.DEFAULT_SYMBOL, periods_per_year=PERIODS_PER_YEAR, db_utils=demo_db_utils):
+        self.symbol = symbol
+        self.db_utils = db_utils
+        self.periods_per_year = periods_per_year
+        self._trades = {column: np.empty(0, dtype=dtype) for column, dtype in storage.TRADE_COLUMNS.items()}
+        self._accounts = {column: np.empty(0, dtype=dtype) for column, dtype in storage.ACCOUNT_COLUMNS.items()}
+        self._last_ids = None
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        '''
+        Reads the entries added since the last refresh, and clears the cached results if there were any.
+
+        :rtype:     True if anything was read, as a boolean
+        '''
+        with self._lock:
+            ids = self.db_utils.read_last_ids()
+            last_ids = (ids['trade'], ids['account'])
+            if last_ids == self._last_ids:
+                return False
+            # Trades are only changed once, when sold, so everything from the oldest open one onwards is read again
+            trades = self._trades
+            open_trades = np.flatnonzero(trades['sell_advice_id'] == 0)
+            keep = int(open_trades[0]) if len(open_trades) else len(trades['id'])
+            new = self.db_utils.read_trade_array(trades['id'][keep - 1] if keep else 0, symbol=self.symbol)
+            self._trades = {column: np.concatenate((trades[column][:keep], new[column])) for column in trades}
+            # Account entries are never changed
+            accounts = self._accounts
+            new = self.db_utils.read_account_array(accounts['id'][-1] if len(accounts['id']) else 0, symbol=self.symbol)
+            self._accounts = {column: np.concatenate((accounts[column], new[column])) for column in accounts}
+            self._last_ids = last_ids
+            self._cache.clear()
+            return True
+
+    def _cached(self, name, compute):
+        with self._lock:
+            self.refresh()
+            if name not in self._cache:
+                self._cache[name] = compute()
+            return self._cache[name]
+
+    def trades(self):
+        '''
+        :rtype:     Every trade of the symbol, as a dictionary of column name to numpy.ndarray (see `db_utils.read_trade_array()`)
+        '''
+        return self._cached('trades', lambda: self._trades)
+
+    def accounts(self):
+        '''
+        :rtype:     Every Account entry of the symbol, as a dictionary of column name to numpy.ndarray (see `db_utils.read_account_array()`)
+        '''
+        return self._cached('accounts', lambda: self._accounts)
+
+    def equity_curve(self):
+        return self._cached('equity_curve', lambda: equity_curve(self._trades, self._accounts))
+
+    def drawdown(self):
+        return self._cached('drawdown', lambda: drawdown(self.equity_curve()))
+
+    def daily_returns(self):
+        return self._cached('daily_returns', lambda: daily_returns(self.equity_curve()))
+
+    def closed_trades(self):
+        '''
+        :rtype:     Trades that were sold, with 'return' (profit multiplier - 1) and 'duration' (seconds held) added
+        '''
+        def compute():
+            closed = self._trades['sell_advice_id'] > 0
+            trades = {column: values[closed] for column, values in self._trades.items()}
+            trades['return'] = trades['profit_multiplier'] - 1.0
+            trades['duration'] = (trades['sell_timestamp'] - trades['buy_timestamp']).astype(np.int64)
+            return trades
+        return self._cached('closed_trades', compute)
+
+    def report(self):
+        '''
+        Summarises the symbol's performance. Returns and drawdowns are fractions (0.05 is 5%), durations are in seconds,
+        and ratios are annualised from daily returns. Anything that cannot be computed yet is None.
+
+        :rtype:     Dictionary
+        '''
+        def compute():
+            equity = self.equity_curve()['equity']
+            closed = self.closed_trades()
+            returns = closed['return']
+            durations = closed['duration']
+            drawdowns = self.drawdown()
+            daily = self.daily_returns()
+            wins, losses = returns[returns > 0], returns[returns <= 0]
+            mean, volatility, downside = np.nan, np.nan, np.nan
+            if len(daily) > 1:
+                mean, volatility = daily.mean(), daily.std()
+                downside = np.sqrt(np.mean(np.minimum(daily, 0.0) ** 2))
+            duration = None
+            if len(durations):
+                duration = dict(zip(('min', 'p25', 'median', 'p75', 'max'), np.percentile(durations, [0, 25, 50, 75, 100]).tolist()))
+                duration['mean'] = float(durations.mean())
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return {
+                    'symbol': self.symbol,
+                    'trades': len(returns),
+                    'open_position': bool(len(self._trades['id']) and self._trades['sell_advice_id'][-1] == 0),
+                    'start_balance': _number(equity[0]) if len(equity) else None,
+                    'equity': _number(equity[-1]) if len(equity) else None,
+                    'pnl': _number(equity[-1] - equity[0]) if len(equity) else None,
+                    'return': _number(equity[-1] / equity[0] - 1.0) if len(equity) else None,
+                    'win_rate': _number(len(wins) / len(returns)) if len(returns) else None,
+                    'average_return': _number(returns.mean()) if len(returns) else None,
+                    'best_trade': _number(returns.max()) if len(returns) else None,
+                    'worst_trade': _number(returns.min()) if len(returns) else None,
+                    'profit_factor': _number(wins.sum() / -losses.sum()) if len(losses) and losses.sum() < 0 else None,
+                    'max_drawdown': _number(drawdowns['drawdown'].min()) if len(equity) else None,
+                    'max_drawdown_duration': int(drawdowns['duration'].max()) if len(equity) else None,
+                    'volatility': _number(volatility * np.sqrt(self.periods_per_year)),
+                    'sharpe': _number(mean / volatility * np.sqrt(self.periods_per_year)),
+                    'sortino': _number(mean / downside * np.sqrt(self.periods_per_year)),
+                    'duration': duration
+                }
+        return self._cached('report', compute)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report trading performance from the Trade and Account tables.")
+    parser.add_argument('--database', default=demo_db_utils.DATABASE, help="Database file to read (defaults to the demo database)")
+    parser.add_argument('--symbol', default=storage.DEFAULT_SYMBOL)
+    args = parser.parse_args()
+
+    database = storage.SQLiteStorage(args.database)
+    print(json.dumps(Analytics(args.symbol, db_utils=database).report(), indent=2))
+    database.close()
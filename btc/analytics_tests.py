@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import storage
+import demo_db_utils
+from analytics import *
+
+START = 1577836800 # 2020-01-01 00:00:00 UTC
+DAY = 86400
+
+
+class AnalyticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = START
+        self.previous_clock = storage.set_clock(lambda: self.now)
+        self.previous_storage = demo_db_utils.use_storage(storage.MemoryStorage())
+        demo_db_utils.create_seed_funds(100.0)
+
+    def tearDown(self):
+        demo_db_utils.use_storage(self.previous_storage)
+        storage.set_clock(self.previous_clock)
+
+    def trade(self, day, price, sell_day, sell_price):
+        # Same bookkeeping as funcs.buy() and funcs.sell(), on given days
+        self.now = START + day * DAY
+        balance = demo_db_utils.read_account_balances(1)[0]['balance']
+        trade = demo_db_utils.create_buy(balance * 0.999, 1, price)[0]
+        demo_db_utils.update_funds(trade['id'], 0.0)
+        if sell_day is not None:
+            self.now = START + sell_day * DAY
+            demo_db_utils.create_sell(trade['id'], 2, sell_price, sell_price / price)
+            demo_db_utils.update_funds(trade['id'], sell_price / price * trade['amount'] * 0.999)
+        return trade
+
+    def test_report(self):
+        self.trade(1, 10.0, 3, 12.0)
+        self.trade(4, 12.0, 5, 9.0)
+        self.trade(7, 9.0, None, None)
+        analytics = Analytics()
+        curve = analytics.equity_curve()
+        first = 100 * 0.999 * 1.2 * 0.999
+        second = first * 0.999 * 0.75 * 0.999
+        np.testing.assert_allclose(curve['equity'], [100.0, 99.9, first, first * 0.999, second, second * 0.999])
+        report = analytics.report()
+        self.assertEqual((report['trades'], report['open_position']), (2, True))
+        self.assertAlmostEqual(report['pnl'], second * 0.999 - 100.0)
+        self.assertEqual(report['win_rate'], 0.5)
+        self.assertAlmostEqual(report['best_trade'], 0.2)
+        self.assertAlmostEqual(report['profit_factor'], 0.2 / 0.25)
+        self.assertAlmostEqual(report['max_drawdown'], second * 0.999 / first - 1.0)
+        # From the peak on day 3 to the last entry on day 7
+        self.assertEqual(report['max_drawdown_duration'], 4 * DAY)
+        self.assertEqual(report['duration']['median'], 1.5 * DAY)
+        # One return per day from day 0 to day 7; only the days with a buy or a sell moved
+        daily = analytics.daily_returns()
+        self.assertEqual(len(daily), 8)
+        self.assertEqual(int((daily != 0).sum()), 5)
+        self.assertLess(report['sharpe'], 0)
+
+    def test_cache(self):
+        analytics = Analytics()
+        empty = analytics.report()
+        self.assertEqual(empty['trades'], 0)
+        self.assertIsNone(empty['win_rate'])
+        self.assertIsNone(empty['sharpe'])
+        self.assertEqual(json.loads(json.dumps(empty)), empty)
+        trade = self.trade(1, 10.0, None, None)
+        report = analytics.report()
+        self.assertTrue(report['open_position'])
+        # Nothing new: the cached report is returned without reading the tables
+        with mock.patch('demo_db_utils.read_trade_array', side_effect=AssertionError):
+            self.assertIs(analytics.report(), report)
+            self.assertFalse(analytics.refresh())
+        # Selling the open trade is picked up
+        self.now += DAY
+        demo_db_utils.create_sell(trade['id'], 2, 11.0, 1.1)
+        demo_db_utils.update_funds(trade['id'], 1.1 * trade['amount'] * 0.999)
+        report = analytics.report()
+        self.assertEqual((report['trades'], report['open_position']), (1, False))
+        self.assertEqual(analytics.trades()['id'].tolist(), [trade['id']])
+        self.assertEqual(len(analytics.accounts()['id']), 3)
+
+    def test_database_file(self):
+        # Reads the database it is given, not the one demo_db_utils is using
+        with tempfile.TemporaryDirectory() as directory:
+            database = storage.SQLiteStorage(os.path.join(directory, "analytics.db"))
+            try:
+                database.create_database()
+                database.create_seed_funds(100.0)
+                trade = database.create_buy(99.9, 1, 10.0)[0]
+                database.update_funds(trade['id'], 0.0)
+                self.now += DAY
+                database.create_sell(trade['id'], 2, 12.0, 1.2)
+                database.update_funds(trade['id'], 1.2 * 99.9 * 0.999)
+                report = Analytics(db_utils=database).report()
+            finally:
+                database.close()
+        self.assertEqual((report['trades'], report['open_position']), (1, False))
+        self.assertAlmostEqual(report['pnl'], 1.2 * 99.9 * 0.999 - 100.0)
+        self.assertEqual(Analytics().report()['trades'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import argparse
+import numpy as np
+import demo_db_utils as db_utils
+
+FEE = 0.999 # Simulate Binance 0.1% fee
+
+# Ticks per cumulative-sum block; each block is re-centred on its own mean to keep the sums accurate
+BLOCK_SIZE = 1 << 16
+
+
+def load_prices(path=None):
+    '''
+    Loads a BTC price series in chronological order. Used as the input to `run_backtest()`.
+
+    :param path:    A .npy file, or a CSV file with a header and a 'price' column (defaults to the whole Price table)
+    :rtype:         numpy.ndarray of floats
+    '''
+    if path is None:
+        return db_utils.read_price_array(db_utils.count_prices(), order='asc')['price']
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with open(path) as f:
+        header = f.readline().strip().split(',')
+    return np.loadtxt(path, delimiter=',', skiprows=1, usecols=header.index('price'), dtype=np.float64, ndmin=1)
+
+
+def rolling_stats(prices, window_size):
+    '''
+    Computes the SMA and standard deviation of every full window in one pass, using cumulative sums.
+    Element i covers prices[i : i + window_size], i.e. the window ending at tick i + window_size - 1.
+
+    :param prices:          BTC prices in chronological order, as a numpy.ndarray
+    :param window_size:     Number of prices in each window, as an integer
+    :rtype:                 Tuple of numpy.ndarray (sma, standard_deviation)
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    window_size = int(window_size)
+    size = len(prices) - window_size + 1
+    if size <= 0:
+        return np.empty(0), np.empty(0)
+    sma = np.empty(size)
+    standard_deviation = np.empty(size)
+    step = max(BLOCK_SIZE, window_size)
+    for start in range(0, size, step):
+        stop = min(start + step, size)
+        segment = prices[start:stop + window_size - 1]
+        base = segment.mean()
+        x = segment - base
+        c1 = np.concatenate(([0.0], np.cumsum(x)))
+        c2 = np.concatenate(([0.0], np.cumsum(x * x)))
+        mean = (c1[window_size:] - c1[:-window_size]) / window_size
+        variance = (c2[window_size:] - c2[:-window_size]) / window_size - mean * mean
+        sma[start:stop] = mean + base
+        standard_deviation[start:stop] = np.sqrt(np.maximum(variance, 0.0))
+    return sma, standard_deviation
+
+
+def _first_sell(prices, sell_ticks, after, threshold):
+    # First SELL tick after `after` whose price clears the profit threshold, scanned in chunks
+    j = np.searchsorted(sell_ticks, after, side='right')
+    while j < len(sell_ticks):
+        chunk = sell_ticks[j:j + 4096]
+        ok = prices[chunk] >= threshold
+        if ok.any():
+            return int(chunk[np.argmax(ok)])
+        j += 4096
+    return None
+
+
+def simulate(prices, sma, standard_deviation, k=2, desired_profit=1.00, start_balance=200.0):
+    '''
+    Runs the same BUY / SELL / HOLD logic as `get_bsh()`, `buy()` and `sell()` over precomputed bands.
+
+    :param prices:              BTC prices in chronological order, as a numpy.ndarray
+    :param sma:                 SMA per window, as returned by `rolling_stats()`
+    :param standard_deviation:  Standard deviation per window, as returned by `rolling_stats()`
+    :param k:                   Width of the bands in standard deviations, as a float
+    :param desired_profit:      Minimum (sell price) / (buy price) to sell at, as a float
+    :param start_balance:       Seed money, as a float
+    :rtype:                     Dictionary
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    offset = len(prices) - len(sma)
+    window_prices = prices[offset:]
+    upper_band = sma + (standard_deviation * k)
+    lower_band = sma - (standard_deviation * k)
+    is_buy = window_prices <= lower_band
+    buy_ticks = np.flatnonzero(is_buy) + offset
+    sell_ticks = np.flatnonzero(~is_buy & (window_prices >= upper_band)) + offset
+
+    balance = float(start_balance)
+    equity = np.full(len(window_prices), balance)
+    trades = []
+    tick = offset
+    while balance != 0.0:
+        i = np.searchsorted(buy_ticks, tick)
+        if i == len(buy_ticks):
+            break
+        buy_tick = int(buy_ticks[i])
+        buy_price = float(prices[buy_tick])
+        amount = balance * FEE
+        balance = 0.0
+        sell_tick = _first_sell(prices, sell_ticks, buy_tick, buy_price * float(desired_profit))
+        end = len(prices) if sell_tick is None else sell_tick
+        # Mark the open position to market while it is held
+        equity[buy_tick - offset:end - offset] = amount * prices[buy_tick:end] / buy_price
+        trade = {
+            'amount': amount,
+            'buy_tick': buy_tick,
+            'buy_price': buy_price,
+            'sell_tick': sell_tick,
+            'sell_price': None,
+            'profit_multiplier': None
+        }
+        trades.append(trade)
+        if sell_tick is None:
+            break
+        profit_multiplier = float(prices[sell_tick]) / buy_price
+        balance = profit_multiplier * amount * FEE
+        equity[sell_tick - offset:] = balance
+        trade['sell_price'] = float(prices[sell_tick])
+        trade['profit_multiplier'] = profit_multiplier
+        tick = sell_tick + 1
+
+    return {
+        'trades': trades,
+        'final_balance': float(equity[-1]) if len(equity) else balance,
+        'open_position': bool(trades) and trades[-1]['sell_tick'] is None,
+        'equity': equity
+    }
+
+
+def run_backtest(prices, window_size=57600, k=2, desired_profit=1.00, start_balance=200.0):
+    '''
+    Backtests the Bollinger strategy over a whole price series at once. Same parameters as `demo_main.main()`.
+
+    :param prices:  BTC prices in chronological order, as a numpy.ndarray
+    :rtype:         Dictionary with 'trades', 'final_balance', 'open_position' and 'equity' (one value per tick with a full window)
+    '''
+    sma, standard_deviation = rolling_stats(prices, window_size)
+    return simulate(prices, sma, standard_deviation, k, desired_profit, start_balance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backtest the Bollinger strategy over historical prices.")
+    parser.add_argument('--file', help="Price file (.npy or CSV with a 'price' column); defaults to the database")
+    parser.add_argument('--window-size', type=int, default=57600)
+    parser.add_argument('--k', type=float, default=2)
+    parser.add_argument('--desired-profit', type=float, default=1.00)
+    parser.add_argument('--start-balance', type=float, default=200.0)
+    args = parser.parse_args()
+
+    result = run_backtest(
+        prices=load_prices(args.file),
+        window_size=args.window_size,
+        k=args.k,
+        desired_profit=args.desired_profit,
+        start_balance=args.start_balance
+    )
+    print(f"Trades: {len(result['trades'])}")
+    print(f"Final balance: {result['final_balance']}")
+    print(f"Open position: {result['open_position']}")
@@ -0,0 +1,97 @@
+import unittest
+from demo_backtest import *
+import demo_sweep
+import os
+import tempfile
+
+
+class BacktestTestCase(unittest.TestCase):
+
+    def test_rolling_stats(self):
+        prices = 60000.0 + np.cumsum(np.random.default_rng(1).normal(0, 50, 5000))
+        sma, standard_deviation = rolling_stats(prices, 20)
+        self.assertEqual(len(sma), 4981)
+        for i in (0, 1, 2500, 4980):
+            window = prices[i:i + 20]
+            self.assertAlmostEqual(sma[i], np.mean(window), places=6)
+            self.assertAlmostEqual(standard_deviation[i], np.std(window), places=6)
+        self.assertEqual(len(rolling_stats(prices[:10], 20)[0]), 0)
+
+    def test_simulate(self):
+        # Window of 3: the dip to 1.8 is a BUY, the rally to 4.0 is a SELL
+        prices = np.array([2.0, 2.2, 1.8, 1.0, 2.0, 4.0, 2.0])
+        result = run_backtest(prices, window_size=3, k=1, desired_profit=1.05)
+        self.assertEqual(len(result['trades']), 1)
+        trade = result['trades'][0]
+        self.assertEqual(trade['buy_tick'], 2)
+        self.assertEqual(trade['buy_price'], 1.8)
+        self.assertAlmostEqual(trade['amount'], 199.8)
+        self.assertEqual(trade['sell_tick'], 5)
+        self.assertEqual(trade['sell_price'], 4.0)
+        self.assertAlmostEqual(result['final_balance'], (4.0 / 1.8) * 199.8 * 0.999)
+        self.assertFalse(result['open_position'])
+        self.assertEqual(len(result['equity']), 5)
+        self.assertAlmostEqual(result['equity'][1], 199.8 * 1.0 / 1.8)
+
+        # Profit threshold not reached: the position stays open
+        result = run_backtest(prices, window_size=3, k=1, desired_profit=3.0)
+        self.assertTrue(result['open_position'])
+        self.assertAlmostEqual(result['final_balance'], 199.8 * 2.0 / 1.8)
+
+    def test_simulate_matches_tick_loop(self):
+        prices = 100.0 + np.cumsum(np.random.default_rng(2).normal(0, 1, 3000))
+        result = run_backtest(prices, window_size=50, k=1.5, desired_profit=1.01)
+
+        # Same decisions, one tick at a time, the way demo_main.main() makes them
+        balance = 200.0
+        trade = None
+        trades = []
+        for tick in range(49, len(prices)):
+            window = prices[tick - 49:tick + 1]
+            sma, standard_deviation = np.mean(window), np.std(window)
+            if prices[tick] <= sma - 1.5 * standard_deviation:
+                if balance != 0.0:
+                    trade = (tick, balance * 0.999)
+                    balance = 0.0
+            elif prices[tick] >= sma + 1.5 * standard_deviation:
+                if trade and prices[tick] / prices[trade[0]] >= 1.01:
+                    balance = prices[tick] / prices[trade[0]] * trade[1] * 0.999
+                    trades.append((trade[0], tick))
+                    trade = None
+
+        self.assertGreater(len(trades), 0)
+        self.assertEqual([(x['buy_tick'], x['sell_tick']) for x in result['trades'] if x['sell_tick']], trades)
+        if not result['open_position']:
+            self.assertAlmostEqual(result['final_balance'], balance)
+
+    def test_load_prices(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "prices.csv")
+            with open(path, 'w') as f:
+                f.write("timestamp,price\n1,10.5\n2,11.5\n")
+            self.assertEqual(list(load_prices(path)), [10.5, 11.5])
+
+    def test_sweep(self):
+        prices = 100.0 + np.cumsum(np.random.default_rng(3).normal(0, 1, 2000))
+        results = demo_sweep.run_sweep(prices, [20, 50], [1.0, 2.0], [1.0, 1.02], workers=2)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(results, sorted(results, key=lambda x: x['final_balance'], reverse=True))
+        for x in results:
+            expected = run_backtest(prices, x['window_size'], x['k'], x['desired_profit'])
+            self.assertAlmostEqual(x['final_balance'], expected['final_balance'])
+            self.assertEqual(x['trades'], len(expected['trades']))
+        # More workers than window sizes: each window's grid is split, and its bands are computed once and shared
+        split = demo_sweep.run_sweep(prices, [20, 50], [1.0, 2.0], [1.0, 1.02], workers=4)
+        key = lambda x: (x['window_size'], x['k'], x['desired_profit'])
+        self.assertEqual(sorted(split, key=key), sorted(results, key=key))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.csv")
+            demo_sweep.write_results(results, path)
+            with open(path) as f:
+                self.assertEqual(f.readline().strip(), "rank,window_size,k,desired_profit,final_balance,trades,open_position")
+                self.assertTrue(f.readline().startswith("1,"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import demo_db_utils as db_utils
+import funcs
+import demo_main
+
+TICK_MS = 30000 # One price per 30 seconds, as in production
+
+
+class FakePriceClient:
+    '''
+    Stands in for `funcs.price_client` with a seeded random walk, so ticks are reproducible and never touch the network.
+    '''
+    def __init__(self, price=30000.0, seed=0):
+        self.price = price
+        self.random = np.random.default_rng(seed)
+
+    def get_prices(self, symbols):
+        quotes = {}
+        for symbol in symbols:
+            self.price *= 1 + self.random.normal(0, 0.001)
+            quotes[symbol] = funcs.PriceQuote(symbol, self.price, db_utils.now_ms(), 0.0)
+        return quotes
+
+    def get_price(self, symbol='BTCUSDT'):
+        return self.get_prices([symbol])[symbol]
+
+
+def seed_database(prices=57600, days=90, trades_per_day=4, seed=0):
+    '''
+    Fills the current storage with realistic row counts: `prices` recent prices, one advice per tick for `days` days,
+    and closed trades with their account entries spread over the same period.
+
+    :param prices:          Number of Price rows, as an integer
+    :param days:            Days of Advice history, as an integer
+    :param trades_per_day:  Closed trades per day, as an integer
+    :param seed:            Random seed, as an integer
+    '''
+    random = np.random.default_rng(seed)
+    now = db_utils.now_ms()
+    ticks = days * 86400000 // TICK_MS
+    walk = 30000.0 * np.exp(np.cumsum(random.normal(0, 0.001, max(prices, ticks))))
+    walk_timestamps = now - TICK_MS * np.arange(len(walk))[::-1]
+
+    db_utils.create_database()
+    db_utils.create_seed_funds(200.0)
+    db_utils.create_prices(zip(walk[-prices:].tolist(), walk_timestamps[-prices:].tolist()))
+
+    advice_prices = walk[-ticks:]
+    advice = np.where(random.random(ticks) < 0.05, 'BUY', np.where(random.random(ticks) < 0.05, 'SELL', 'HOLD'))
+    with db_utils.transaction():
+        db_utils.create_advices(zip(
+            advice_prices.tolist(),
+            advice_prices.tolist(),
+            (advice_prices * 0.01).tolist(),
+            (advice_prices * 1.02).tolist(),
+            (advice_prices * 0.98).tolist(),
+            advice.tolist(),
+            walk_timestamps[-ticks:].tolist()
+        ))
+        balance = 200.0
+        for i in range(days * trades_per_day):
+            buy_price = float(walk[-ticks + i])
+            amount = balance * 0.999
+            trade_id = db_utils.create_buy(amount, i + 1, buy_price)[0]['id']
+            db_utils.create_sell(trade_id, i + 2, buy_price * 1.01, 1.01)
+            db_utils.update_funds(trade_id, 0.0)
+            balance = amount * 1.01 * 0.999
+            db_utils.update_funds(trade_id, balance)
+
+
+def _summary(name, latencies, peak_memory):
+    latencies = np.asarray(latencies)
+    total = float(latencies.sum())
+    return {
+        'name': name,
+        'runs': len(latencies),
+        'total_seconds': total,
+        'ops_per_second': len(latencies) / total if total else None,
+        'mean_seconds': float(latencies.mean()),
+        'p50_seconds': float(np.percentile(latencies, 50)),
+        'p99_seconds': float(np.percentile(latencies, 99)),
+        'max_seconds': float(latencies.max()),
+        'peak_memory_bytes': peak_memory
+    }
+
+
+def _peak_memory(func):
+    # Measured on one extra call, since tracing allocations would distort the timings
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name, func, runs, memory=True):
+    '''
+    Times `func()` `runs` times, then measures the peak Python memory of one more call.
+
+    :param name:    Benchmark name, as a string
+    :param func:    Function taking no arguments
+    :param runs:    Number of timed calls, as an integer
+    :param memory:  Whether to measure memory (skip for functions that cannot be repeated), as a boolean
+    :rtype:         Dictionary
+    '''
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return _summary(name, latencies, _peak_memory(func) if memory else None)
+
+
+def bench_trades(runs):
+    # buy() only buys with a non-zero balance and sell() only sells an open trade, so they are timed in pairs
+    buy_advice = db_utils.create_advice(30000.0, 30100.0, 50.0, 30200.0, 30000.0, 'BUY')[0]
+    sell_advice = db_utils.create_advice(31000.0, 30100.0, 50.0, 31000.0, 30000.0, 'SELL')[0]
+    ledger = funcs.Ledger.from_database(db_utils)
+    buys = []
+    sells = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        funcs.buy(db_utils, buy_advice, ledger)
+        buys.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        funcs.sell(db_utils, sell_advice, 1.00, ledger)
+        sells.append(time.perf_counter() - start)
+    return [_summary('buy', buys, None), _summary('sell', sells, None)]
+
+
+def run_benchmarks(prices=57600, days=90, runs=20, ticks=200, backend='sqlite'):
+    '''
+    Seeds a temporary storage and benchmarks the hot paths at production window sizes.
+    The storage and price client in use are restored afterwards.
+
+    :param prices:  Number of Price rows and the window size, as an integer
+    :param days:    Days of Advice / Trade history, as an integer
+    :param runs:    Timed calls per read / advice / trade benchmark, as an integer
+    :param ticks:   Timed `demo_main.main()` ticks, as an integer
+    :param backend: Storage to benchmark: 'sqlite', 'log' (SQLite with a price log) or 'memory' (MemoryStorage), as a string
+    :rtype:         Dictionary with environment details and a list of results
+    '''
+    price_client = funcs.price_client
+    results = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        if backend == 'memory':
+            storage = db_utils.MemoryStorage()
+        else:
+            storage = db_utils.SQLiteStorage(os.path.join(directory, "benchmark.db"), backend, os.path.join(directory, "prices"))
+        previous = db_utils.use_storage(storage)
+        funcs.price_client = FakePriceClient()
+        demo_main.feeds.clear()
+        demo_main.strategies_by_symbol.clear()
+        demo_main.ledgers.clear()
+        try:
+            start = time.perf_counter()
+            seed_database(prices, days)
+            results.append(_summary('seed_database', [time.perf_counter() - start], None))
+
+            results.append(bench('read_prices', lambda: db_utils.read_prices(prices), runs))
+            results.append(bench('read_price_array', lambda: db_utils.read_price_array(prices), runs))
+            results.append(bench('load_price_data', lambda: funcs.load_price_data(db_utils, prices), runs))
+            data = funcs.load_price_data(db_utils, prices)
+            results.append(bench('make_advice', lambda: funcs.make_advice(db_utils, data), runs))
+            results.extend(bench_trades(runs))
+
+            tick = lambda: demo_main.main(window_size=prices)
+            results.append(bench('main_first_tick', tick, 1, memory=False))
+            results.append(bench('main', tick, ticks))
+
+            results.append(bench('purge', demo_main.purge, 1, memory=False))
+            results.append(bench('purge_nothing_to_delete', demo_main.purge, runs))
+        finally:
+            demo_main.feeds.clear()
+            demo_main.strategies_by_symbol.clear()
+            demo_main.ledgers.clear()
+            funcs.price_client = price_client
+            db_utils.use_storage(previous)
+            storage.close()
+
+    return {
+        'time': datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'parameters': {'prices': prices, 'days': days, 'runs': runs, 'ticks': ticks, 'backend': backend},
+        'max_rss_kilobytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark db_utils and funcs against a seeded temporary database.")
+    parser.add_argument('--prices', type=int, default=57600)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--ticks', type=int, default=200)
+    parser.add_argument('--backend', choices=['sqlite', 'log', 'memory'], default='sqlite')
+    parser.add_argument('--output', help="JSON file to write (defaults to stdout)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.prices, args.days, args.runs, args.ticks, args.backend)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    for x in report['results']:
+        print(f"{x['name']:>24}: p50 {x['p50_seconds'] * 1000:9.3f} ms  p99 {x['p99_seconds'] * 1000:9.3f} ms", file=sys.stderr)
@@ -0,0 +1,30 @@
+import json
+import unittest
+from demo_benchmarks import *
+from demo_db_utils import get_storage
+
+
+class BenchmarksTestCase(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        database = db_utils.DATABASE
+        price_client = funcs.price_client
+        report = run_benchmarks(prices=100, days=1, runs=2, ticks=3)
+        json.dumps(report)
+        self.assertEqual(db_utils.DATABASE, database)
+        self.assertIs(funcs.price_client, price_client)
+        results = {x['name']: x for x in report['results']}
+        for name in ['read_prices', 'load_price_data', 'make_advice', 'buy', 'sell', 'main', 'purge']:
+            self.assertIn(name, results)
+        self.assertEqual(results['main']['runs'], 3)
+        self.assertGreater(results['read_prices']['peak_memory_bytes'], 0)
+
+    def test_run_benchmarks_memory(self):
+        storage = get_storage()
+        report = run_benchmarks(prices=100, days=1, runs=2, ticks=3, backend='memory')
+        self.assertIs(get_storage(), storage)
+        self.assertEqual(len(report['results']), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
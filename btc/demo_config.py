@@ -0,0 +1,3 @@
+# Trading pairs to run the strategy on; each needs seed funds (see demo_startup.py)
+# Kept apart from demo_main.py, which sets up the scheduler, stream and pipeline when imported
+SYMBOLS = ['BTCUSDT']
@@ -1,12 +1,35 @@
 import unittest
 from demo_db_utils import *
+from storage import CANDLE_INTERVALS
+import demo_import
+import datetime
 import os
+import sqlite3
+import tempfile
+import numpy as np
 
 class DatabaseTestCase(unittest.TestCase):
 
     def setUp(self):
+        # Every test gets a database of its own in a temporary folder
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.previous = use_storage(None)
+        self.use_database("demo_database.db")
         create_database()
 
+    def tearDown(self):
+        use_storage(self.previous).close()
+
+    def use_database(self, name, price_backend='sqlite'):
+        # Points the module-level functions at another database in the test's folder
+        storage = SQLiteStorage(os.path.join(self.directory, name), price_backend, os.path.join(self.directory, "prices"))
+        previous = use_storage(storage)
+        if previous is not None:
+            previous.close()
+        return storage
+
     def test_price(self):
         create_price(12345.67)
         create_price(76543.21)
@@ -17,6 +40,19 @@ class DatabaseTestCase(unittest.TestCase):
         self.assertEqual(results[1]['id'], 1)
         self.assertEqual(results[1]['price'], 12345.67)
 
+        results = read_price_array(20, columns=('id', 'price'))
+        self.assertEqual(list(results['id']), [2, 1])
+        self.assertEqual(list(results['price']), [76543.21, 12345.67])
+        results = read_price_array(20, columns=('price', 'timestamp'), order='asc')
+        self.assertEqual(list(results['price']), [12345.67, 76543.21])
+        self.assertEqual(results['timestamp'].dtype, np.dtype('datetime64[ms]'))
+
+        timestamp = results['timestamp'][0].item()
+        results = read_price_range(timestamp, timestamp + datetime.timedelta(seconds=60))
+        self.assertEqual(list(results['price']), [12345.67, 76543.21])
+        results = read_price_range(timestamp + datetime.timedelta(seconds=60), timestamp + datetime.timedelta(seconds=120))
+        self.assertEqual(len(results['price']), 0)
+
     def test_advice(self):
         create_advice(
             price=5.0,
@@ -51,6 +87,46 @@ class DatabaseTestCase(unittest.TestCase):
         self.assertEqual(results[0]['lower_band'], 9500.0)
         self.assertEqual(results[0]['advice'], 'SELL')
 
+    def test_use_storage(self):
+        memory = MemoryStorage()
+        previous = use_storage(memory)
+        try:
+            self.assertIs(get_storage(), memory)
+            create_price(1.0, 1000)
+            self.assertEqual(count_prices(), 1)
+            self.assertEqual(memory.count_prices(), 1)
+            # None goes back to the demo database
+            use_storage(None)
+            self.assertEqual(get_storage().database, DATABASE)
+        finally:
+            use_storage(previous)
+
+    def test_advice_modes(self):
+        sequence = ['HOLD', 'HOLD', 'HOLD', 'BUY', 'BUY', 'HOLD', 'HOLD', 'SELL']
+        expected = {
+            'full': (8, [1, 1, 1, 1, 1, 1, 1, 1]),
+            'changes': (5, [1, 1, 1, 1, 1]),
+            'rle': (5, [3, 1, 1, 2, 1])
+        }
+        for mode, (rows, run_lengths) in expected.items():
+            get_storage().advice_mode = mode
+            symbol = mode.upper()
+            ids = []
+            for i, advice in enumerate(sequence):
+                ids.append(create_advice(float(i), 1.0, 1.0, 2.0, 0.0, advice, symbol=symbol)[0]['id'])
+            stored = get_connection().execute(
+                "SELECT advice, run_length FROM advice WHERE symbol = ? ORDER BY id", (symbol,)
+            ).fetchall()
+            self.assertEqual(len(stored), rows)
+            self.assertEqual([x[1] for x in stored], run_lengths)
+            # BUY and SELL rows always get their own entry
+            self.assertEqual(len(set(ids[3:5])), 2)
+            self.assertEqual(read_last_advice(symbol=symbol)[0]['advice'], 'SELL')
+            self.assertEqual(read_last_advice(symbol=symbol)[0]['price'], 7.0)
+        get_storage().advice_mode = 'squash'
+        with self.assertRaises(ValueError):
+            create_advice(1.0, 1.0, 1.0, 2.0, 0.0, 'HOLD')
+
     def test_buy_sell(self):
         results = read_last_trade()
         self.assertEqual(len(results), 0)
@@ -83,6 +159,175 @@ class DatabaseTestCase(unittest.TestCase):
         self.assertEqual(results[0]['sell_price'], 12345.67)
         self.assertEqual(results[0]['profit_multiplier'], 2469.134)
         
+    def test_connection(self):
+        con = get_connection()
+        self.assertIs(get_connection(), con)
+        self.assertEqual(con.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        read_prices(1)
+        read_last_trade()
+        self.assertIs(get_connection(), con)
+
+    def test_migration(self):
+        # Build a database with the old text timestamps, then upgrade it
+        path = os.path.join(self.directory, "old_database.db")
+        con = sqlite3.connect(path)
+        con.execute("CREATE TABLE price(id INTEGER PRIMARY KEY AUTOINCREMENT, price REAL, timestamp TEXT)")
+        con.execute("INSERT INTO price (price, timestamp) VALUES (?,?)", (5.0, '2024-01-01 00:00:30'))
+        con.execute("CREATE TABLE advice(id INTEGER PRIMARY KEY AUTOINCREMENT, price REAL, sma REAL, standard_deviation REAL, upper_band REAL, lower_band REAL, advice TEXT, timestamp TEXT)")
+        con.execute("INSERT INTO advice (price, advice, timestamp) VALUES (?,?,?)", (5.0, 'HOLD', '2024-01-01 00:00:30'))
+        con.commit()
+        con.close()
+
+        self.use_database("old_database.db")
+        create_database()
+        results = read_prices(20)
+        self.assertEqual(results[0]['id'], 1)
+        self.assertEqual(results[0]['price'], 5.0)
+        self.assertEqual(results[0]['timestamp'], 1704067230000)
+        self.assertEqual(create_price(6.0), 2)
+        self.assertEqual(read_last_advice()[0]['run_length'], 1)
+        self.assertEqual(create_advice(6.0, 5.0, 1.0, 7.0, 3.0, 'HOLD')[0]['run_length'], 2)
+        create_database()
+        self.assertEqual(len(read_prices(20)), 2)
+
+    def test_import(self):
+        path = os.path.join(self.directory, "prices.csv")
+        with open(path, 'w') as f:
+            f.write("timestamp,price\n2024-01-01 00:00:00,10.5\n2024-01-01 00:00:30,11.5\n")
+        self.assertEqual(demo_import.import_prices(path), 2)
+
+        path = os.path.join(self.directory, "klines.csv")
+        with open(path, 'w') as f:
+            f.write("open_time,open,high,low,close,volume,close_time\n")
+            f.write("1704067260000,11.5,12.0,11.0,12.5,3.0,1704067319999\n")
+            f.write("1704067320000000,12.5,13.0,12.0,13.5,3.0,1704067379999999\n")
+        self.assertEqual(demo_import.import_prices(path, 'kline'), 2)
+
+        results = read_price_array(20, columns=('price', 'timestamp'), order='asc')
+        self.assertEqual(list(results['price']), [10.5, 11.5, 12.5, 13.5])
+        self.assertEqual(list(results['timestamp'].astype(np.int64)), [1704067200000, 1704067230000, 1704067319999, 1704067379999])
+
+        # Older data would break the id order, so it is refused
+        with self.assertRaises(ValueError):
+            demo_import.import_prices(path, 'kline')
+        self.assertEqual(count_prices(), 4)
+
+    def test_symbols(self):
+        create_price(60000.0)
+        create_price(3000.0, symbol='ETHUSDT')
+        create_price(61000.0)
+        self.assertEqual([x['price'] for x in read_prices(20)], [61000.0, 60000.0])
+        self.assertEqual([x['price'] for x in read_prices(20, symbol='ETHUSDT')], [3000.0])
+        self.assertEqual(list(read_price_array(20, symbol='ETHUSDT')['price']), [3000.0])
+        self.assertEqual(count_prices(symbol=None), 3)
+
+        create_seed_funds(200.0)
+        create_seed_funds(50.0, symbol='ETHUSDT')
+        self.assertEqual(read_account_balances(1)[0]['balance'], 200.0)
+        self.assertEqual(read_account_balances(1, symbol='ETHUSDT')[0]['balance'], 50.0)
+
+        create_buy(amount=49.95, buy_advice_id=1, buy_price=3000.0, symbol='ETHUSDT')
+        self.assertEqual(len(read_last_trade()), 0)
+        self.assertEqual(read_last_trade(symbol='ETHUSDT')[0]['symbol'], 'ETHUSDT')
+
+    def test_candles(self):
+        hour = 3600 * 1000
+        prices = [10.0, 12.0, 9.0, 11.0, 20.0, 18.0, 19.0]
+        timestamps = [0, 60000, 61000, hour - 1, hour, hour + 1000, 86400 * 1000 + 5]
+        for price, timestamp in zip(prices[:3], timestamps[:3]):
+            create_price(price, timestamp)
+        create_prices(zip(prices[3:], timestamps[3:]))
+
+        candles = read_candles('1h', 10, order='asc')
+        self.assertEqual(list(candles['bucket']), [0, hour, 24 * hour])
+        self.assertEqual(list(candles['open']), [10.0, 20.0, 19.0])
+        self.assertEqual(list(candles['high']), [12.0, 20.0, 19.0])
+        self.assertEqual(list(candles['low']), [9.0, 18.0, 19.0])
+        self.assertEqual(list(candles['close']), [11.0, 18.0, 19.0])
+        self.assertEqual(list(candles['count']), [4, 2, 1])
+        self.assertEqual(candles['sum'][0], 42.0)
+        self.assertEqual(candles['sum_sq'][1], 724.0)
+        self.assertEqual(list(read_candles('1m', 2)['bucket']), [24 * hour, hour])
+        day = read_candles('1d', 10)
+        self.assertEqual(list(day['count']), [1, 6])
+        self.assertEqual(day['close'][1], 18.0)
+
+        # Rebuilding from raw prices gives the same candles
+        before = {x: read_candles(x, 100) for x in CANDLE_INTERVALS}
+        rebuild_candles()
+        for interval, columns in before.items():
+            after = read_candles(interval, 100)
+            for column in columns:
+                self.assertTrue((after[column] == columns[column]).all())
+
+        # Purged history survives a rebuild
+        get_connection().execute("DELETE FROM price WHERE timestamp < ?", (hour + 500,))
+        rebuild_candles()
+        self.assertEqual(list(read_candles('1h', 10)['count']), [1, 2, 4])
+        self.assertEqual(list(read_candles('1d', 10)['count']), [1, 6])
+
+        with self.assertRaises(ValueError):
+            read_candles('5m', 10)
+
+    def test_price_log_backend(self):
+        self.use_database("log_database.db", 'log')
+        create_database()
+        now = now_ms()
+        old = now - 30 * 86400 * 1000
+        self.assertEqual(create_prices([(1.0, old), (2.0, old + 1000)]), 2)
+        self.assertEqual(create_price(3.0, now - 2000), 3)
+        self.assertEqual(create_price(4.0, symbol='ETHUSDT'), 1)
+        self.assertEqual(create_price(5.0, now - 1000), 4)
+        self.assertEqual(get_connection().execute("SELECT COUNT(*) FROM price").fetchone()[0], 0)
+
+        self.assertEqual([x['price'] for x in read_prices(3)], [5.0, 3.0, 2.0])
+        self.assertEqual(read_prices(1)[0]['id'], 4)
+        self.assertEqual(list(read_price_array(3)['price']), [5.0, 3.0, 2.0])
+        arrays = read_price_array(2, columns=('id', 'price', 'timestamp'), order='asc')
+        self.assertEqual(list(arrays['id']), [3, 4])
+        self.assertEqual(arrays['timestamp'].dtype, np.dtype('datetime64[ms]'))
+        self.assertEqual(list(read_price_range(now - 5000, now)['price']), [3.0, 5.0])
+        self.assertEqual(read_last_price_timestamp(), now - 1000)
+        self.assertEqual(count_prices(), 4)
+        self.assertEqual(count_prices(symbol=None), 5)
+
+        # Candles are still kept in SQLite
+        self.assertEqual(read_candles('1d', 10)['count'].sum(), 4)
+        self.assertEqual(rebuild_candles() > 0, True)
+        self.assertEqual(read_candles('1d', 10)['count'].sum(), 4)
+
+        self.assertEqual(purge_old_prices(528), 2)
+        self.assertEqual(count_prices(), 2)
+
+    def test_purge(self):
+        con = get_connection()
+        con.execute("INSERT INTO price (price, timestamp) VALUES (?,?)", (1.0, 0))
+        con.execute("INSERT INTO price (price, timestamp) VALUES (?,?)", (2.0, now_ms() - 600 * 3600 * 1000))
+        con.commit()
+        create_price(3.0)
+        self.assertEqual(purge_old_prices(528, batch_size=1), 2)
+        results = read_prices(20)
+        self.assertEqual(results[0]['price'], 3.0)
+        self.assertNotIn(1.0, [x['price'] for x in results])
+        self.assertNotIn(2.0, [x['price'] for x in results])
+        self.assertEqual(purge_old_prices(528), 0)
+
+    def test_transaction(self):
+        before = len(read_prices(100))
+        with self.assertRaises(ValueError):
+            with transaction():
+                create_price(1.0)
+                create_price(2.0)
+                self.assertTrue(get_connection().in_transaction)
+                raise ValueError("rolled back")
+        self.assertEqual(len(read_prices(100)), before)
+
+        with transaction():
+            price_id = create_price(3.0)
+            self.assertTrue(get_connection().in_transaction)
+        self.assertFalse(get_connection().in_transaction)
+        self.assertEqual(read_prices(1)[0]['id'], price_id)
+
     def test_funds(self):
         results = read_account_balances(1)
         self.assertEqual(len(results), 0)
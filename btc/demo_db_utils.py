@@ -1,302 +1,176 @@
-import sqlite3
-import datetime
+import atexit
+import threading
+import storage
+from storage import DEFAULT_SYMBOL, CANDLE_COLUMNS, TRADE_COLUMNS, ACCOUNT_COLUMNS, PURGE_BATCH_SIZE, SQLiteStorage, MemoryStorage, set_clock, now_ms
 
-def create_database():
-    '''
-    Generates tables for database. Use once.
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS price(
-        id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        price REAL, 
-        timestamp TEXT
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS advice(
-        id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        price REAL, 
-        sma REAL, 
-        standard_deviation REAL, 
-        upper_band REAL, 
-        lower_band REAL, 
-        advice TEXT, 
-        timestamp TEXT
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS trade(
-        id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        amount REAL, 
-        buy_advice_id INTEGER,
-        buy_price REAL, 
-        buy_timestamp TEXT, 
-        sell_advice_id INTEGER,
-        sell_price REAL, 
-        sell_timestamp TEXT, 
-        profit_multiplier REAL
-    )
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS account(
-        id INTEGER PRIMARY KEY AUTOINCREMENT, 
-        trade_id INTEGER,
-        balance REAL, 
-        timestamp TEXT
-    )
-    """)
-    con.close()
-
-
-def create_price(price):
-    '''
-    Creates an entry in the Price table. Used to record BTC prices in SQLite database.
+# The demo bot's database; live_db_utils.py has its own
+DATABASE = "demo_database.db"
+PRICE_LOG_DIRECTORY = "demo_prices"
 
-    :param price:   BTC price, as a float
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "INSERT INTO price VALUES (?,?,?)", 
-        (None, float(price), str(timestamp))
-    )
-    con.commit()
-    con.close()
-
-
-def read_prices(limit):
-    '''
-    Returns the last n BTC prices, in reverse chronological order (newest is first). Used to read historical BTC price data.
+_database = SQLiteStorage(DATABASE, price_log_directory=PRICE_LOG_DIRECTORY)
+_storage = _database
+_lock = threading.Lock()
 
-    :param limit:   Number of entries to retrieve, as an integer
-    :rtype:         List of dictionaries
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    res = cur.execute(f"SELECT * FROM price ORDER BY id DESC LIMIT {int(limit)}")
-    raw_data = res.fetchall()
-    con.close()
-    data_list = []
-    for x in raw_data:
-        data_dict = {
-            'id': x[0],
-            'price': x[1],
-            'timestamp': x[2]
-        }
-        data_list.append(data_dict)
-    return data_list
-
-
-def create_advice(price, sma, standard_deviation, upper_band, lower_band, advice):
-    '''
-    Creates an entry in the Advice table. Used to record calculations and buy/sell recommendations.
-
-    :param price:               Price of BTC at a given point, as a float.
-    :param sma:                 Simple Moving Average of historic price data, as a float.
-    :param standard_deviation:  Standard deviation of historic price data, as a float.
-    :param upper_band:          Upper Bollinger band for historic price data, as a float.
-    :param lower_band:          Lower Bollinger band for historic price data, as a float.
-    :param advice:              BUY / SELL / HOLD, as a string.
+
+def __getattr__(name):
+    # The clock is shared by every storage, so it is always the one `storage.set_clock()` installed last
+    if name == 'clock':
+        return storage.clock
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_storage():
     '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "INSERT INTO advice VALUES (?,?,?,?,?,?,?,?)", 
-        (None, float(price), float(sma), float(standard_deviation), float(upper_band), float(lower_band), str(advice), str(timestamp))
-    )
-    con.commit()
-    con.close()
-
-
-def read_last_advice():
+    Returns the storage this module's functions run on: the demo database, unless `use_storage()` installed another one.
+
+    :rtype:     SQLiteStorage or MemoryStorage
     '''
-    Retrieves the last entry from the Advice table. Used to make buy/sell decisions.
+    return _storage
+
 
-    :rtype:     List of dictionaries
+def use_storage(new_storage):
     '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    res = cur.execute("SELECT * FROM advice ORDER BY id DESC LIMIT 1")
-    results = res.fetchall()
-    data_list = []
-    for x in results:
-        data_dict = {
-            'id': x[0],
-            'price': x[1],
-            'sma': x[2],
-            'standard_deviation': x[3],
-            'upper_band': x[4],
-            'lower_band': x[5],
-            'advice': x[6],
-            'timestamp': x[7]
-        }
-        data_list.append(data_dict)
-    return data_list
-
-
-def create_buy(amount, buy_advice_id, buy_price):
+    Makes this module's functions run on another storage, e.g. `use_storage(MemoryStorage())` in tests and backtests.
+
+    :param new_storage: SQLiteStorage or MemoryStorage (None goes back to the demo database)
+    :rtype:             The storage that was in use before
     '''
-    Creates a buy entry in the Trades table. Used to simulate buys.
+    global _storage
+    with _lock:
+        previous, _storage = _storage, (_database if new_storage is None else new_storage)
+    return previous
+
 
-    :param amount:          How much money did we spend on this buy, as a float?
-    :param buy_advice_id:   What is the primary key of the Advice that prompted this buy, as an integer?
-    :param buy_price:       What price did we buy BTC at, as a float?
+def close_connections():
     '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    buy_timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "INSERT INTO trade VALUES (?,?,?,?,?,?,?,?,?)", 
-        (None, float(amount), int(buy_advice_id), float(buy_price), str(buy_timestamp), None, None, None, None)
-    )
-    con.commit()
-    con.close()
-
-
-def read_last_trade():
+    Closes the connections of the storage in use; it reopens on next use. Runs automatically at exit.
     '''
-    Retrieves the last entry in the Trade table. Used to get both buy and sell data.
+    _storage.close()
 
-    :rtype:     List of dictionaries
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    res = cur.execute("SELECT * FROM trade ORDER BY id DESC LIMIT 1")
-    results = res.fetchall()
-    data_list = []
-    for x in results:
-        data_dict = {
-            'id': x[0],
-            'amount': x[1],
-            'buy_advice_id': x[2],
-            'buy_price': x[3],
-            'buy_timestamp': x[4],
-            'sell_advice_id': x[5],
-            'sell_price': x[6],
-            'sell_timestamp': x[7],
-            'profit_multiplier': x[8]
-        }
-        data_list.append(data_dict)
-    return data_list
+
+atexit.register(close_connections)
+
+
+# The storage methods (see storage.SQLiteStorage), run on the storage in use
+def get_connection():
+    return get_storage().get_connection()
+
+
+def transaction():
+    return get_storage().transaction()
+
+
+def bulk_load():
+    return get_storage().bulk_load()
+
+
+def price_log(symbol=DEFAULT_SYMBOL):
+    return get_storage().price_log(symbol)
+
+
+def create_database():
+    return get_storage().create_database()
+
+
+def create_indexes():
+    return get_storage().create_indexes()
+
+
+def drop_indexes():
+    return get_storage().drop_indexes()
+
+
+def migrate_database():
+    return get_storage().migrate_database()
+
+
+def create_price(price, timestamp=None, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_price(price, timestamp, symbol)
+
+
+def create_prices(rows, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_prices(rows, symbol)
+
+
+def rebuild_candles(symbol=None):
+    return get_storage().rebuild_candles(symbol)
+
+
+def read_candles(interval, limit, columns=tuple(CANDLE_COLUMNS), order='desc', symbol=DEFAULT_SYMBOL):
+    return get_storage().read_candles(interval, limit, columns, order, symbol)
+
+
+def read_last_price_timestamp(symbol=DEFAULT_SYMBOL):
+    return get_storage().read_last_price_timestamp(symbol)
+
+
+def read_prices(limit, symbol=DEFAULT_SYMBOL):
+    return get_storage().read_prices(limit, symbol)
+
+
+def count_prices(symbol=DEFAULT_SYMBOL):
+    return get_storage().count_prices(symbol)
+
+
+def read_price_array(limit, columns=('price',), order='desc', symbol=DEFAULT_SYMBOL):
+    return get_storage().read_price_array(limit, columns, order, symbol)
+
+
+def read_price_range(start, end, columns=('price',), order='asc', symbol=DEFAULT_SYMBOL):
+    return get_storage().read_price_range(start, end, columns, order, symbol)
+
+
+def create_advice(price, sma, standard_deviation, upper_band, lower_band, advice, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_advice(price, sma, standard_deviation, upper_band, lower_band, advice, symbol)
+
+
+def create_advices(rows, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_advices(rows, symbol)
+
+
+def read_last_advice(symbol=DEFAULT_SYMBOL):
+    return get_storage().read_last_advice(symbol)
+
+
+def create_buy(amount, buy_advice_id, buy_price, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_buy(amount, buy_advice_id, buy_price, symbol)
+
+
+def read_last_trade(symbol=DEFAULT_SYMBOL):
+    return get_storage().read_last_trade(symbol)
 
 
 def create_sell(trade_id, sell_advice_id, sell_price, profit_multiplier):
-    '''
-    Creates a sell entry in the Trades table. Used to update buy entries and simulate trades.
+    return get_storage().create_sell(trade_id, sell_advice_id, sell_price, profit_multiplier)
 
-    :param trade_id:            What is the primary key of the Trade this is linked to, as an integer? (You need to buy before you can sell.)
-    :param sell_advice_id:      What is the primary key of the Advice that prompted this sell, as an integer?
-    :param sell_price:          How much did we sell at, as a float?
-    :param profit_multiplier:   (Sell price) / (Buy price), as a float.
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    sell_timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "UPDATE trade SET sell_advice_id = ?, sell_price = ?, sell_timestamp = ?, profit_multiplier = ? WHERE id = ?",
-        (int(sell_advice_id), float(sell_price), str(sell_timestamp), float(profit_multiplier), int(trade_id))
-    )
-    con.commit()
 
+def create_seed_funds(amount, symbol=DEFAULT_SYMBOL):
+    return get_storage().create_seed_funds(amount, symbol)
 
-def create_seed_funds(amount):
-    '''
-    Creates the first entry in the Account table. Used to simulate the initial deposit of money.
 
-    :param amount:  Amount of seed money, as a float.
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "INSERT INTO account VALUES (?,?,?,?)", 
-        (None, None, float(amount), str(timestamp))
-    )
-    con.commit()
-    con.close()
-
-
-def update_funds(trade_id, amount):
-    '''
-    Creates a new entry in the Account table as trades are made. Used to simulate money flow with buys and sells.
+def update_funds(trade_id, amount, symbol=DEFAULT_SYMBOL):
+    return get_storage().update_funds(trade_id, amount, symbol)
 
-    :param trade_id:    What is the primary key of the trade that is affecting the balance, as an integer?
-    :param amount:      What is the new amount of money in the account, as a float? 
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    timestamp = datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
-    cur.execute(
-        "INSERT INTO account VALUES (?,?,?,?)", 
-        (None, int(trade_id), float(amount), str(timestamp))
-    )
-    con.commit()
-    con.close()
-
-
-def read_account_balances(limit):
-    '''
-    Returns the last n account balances, in reverse chronological order (newest is first). Used to read historical account data.
 
-    :param limit:   Number of entries to retrieve, as an integer
-    :rtype:         List of floats
-    '''
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    res = cur.execute(f"SELECT * FROM account ORDER BY id DESC LIMIT {int(limit)}")
-    raw_data = res.fetchall()
-    con.close()
-    data_list = []
-    for x in raw_data:
-        data_dict = {
-            'id': x[0],
-            'trade_id': x[1],
-            'balance': x[2],
-            'timestamp': x[3]
-        }
-        data_list.append(data_dict)
-    return data_list  
-
-
-def purge_old_prices(older_than=528):
-    '''
-    Deletes price entries that are over 528 hours (22 days) old. Used to prevent database from getting too big.
+def read_account_balances(limit, symbol=DEFAULT_SYMBOL):
+    return get_storage().read_account_balances(limit, symbol)
 
-    :param older_than:      Delete older than x hours, as an integer
-    :rtype:                 None
-    '''
-    now = datetime.datetime.now(datetime.UTC)
-    limit = now - datetime.timedelta(hours=int(older_than))
-    condition = limit.strftime('%Y-%m-%d %H:%M')
 
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    cur.execute(
-        f'DELETE FROM price WHERE timestamp LIKE "{condition}:%"'
-    )
-    con.commit()
-    con.close()
+def read_trade_array(after_id=0, columns=tuple(TRADE_COLUMNS), symbol=DEFAULT_SYMBOL):
+    return get_storage().read_trade_array(after_id, columns, symbol)
 
 
-def purge_old_advices(older_than=528):
-    '''
-    Deletes advice entries that are over 528 hours (22 days) old. Used to prevent database from getting too big.
+def read_account_array(after_id=0, columns=tuple(ACCOUNT_COLUMNS), symbol=DEFAULT_SYMBOL):
+    return get_storage().read_account_array(after_id, columns, symbol)
 
-    :param older_than:      Delete older than x hours, as an integer
-    :rtype:                 None
-    '''
-    now = datetime.datetime.now(datetime.UTC)
-    limit = now - datetime.timedelta(hours=int(older_than))
-    condition = limit.strftime('%Y-%m-%d %H:%M')
-
-    con = sqlite3.connect("demo_database.db")
-    cur = con.cursor()
-    cur.execute(
-        f'DELETE FROM advice WHERE timestamp LIKE "{condition}:%"'
-    )
-    con.commit()
-    con.close()
+
+def read_last_ids():
+    return get_storage().read_last_ids()
+
+
+def purge_old_prices(older_than=528, batch_size=PURGE_BATCH_SIZE):
+    return get_storage().purge_old_prices(older_than, batch_size)
+
+
+def purge_old_advices(older_than=528, batch_size=PURGE_BATCH_SIZE):
+    return get_storage().purge_old_advices(older_than, batch_size)
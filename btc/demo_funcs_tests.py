@@ -1,26 +1,107 @@
 import unittest
-from demo_funcs import *
+from funcs import *
 from demo_db_utils import *
+import demo_db_utils as db_utils
+import http.server
+import json
+import log
+import os
+import tempfile
+import threading
+import unittest.mock
+
+
+class StandInTickerHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the scripted (status, body, delay) responses in order, then repeats the last one
+    responses = []
+
+    def do_GET(self):
+        StandInTickerHandler.last_path = self.path
+        status, body, delay = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
 
 class DemoFuncsTestCase(unittest.TestCase):
     def setUp(self):
         create_database()
     
     def test_get_btc_price(self):
-        result = get_btc_price()
+        result = get_btc_price(db_utils)
         self.assertEqual(type(result), float)
 
+    def test_price_client(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInTickerHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = PriceClient(base_url=f"http://127.0.0.1:{server.server_port}", timeout=(1, 0.2), retries=2, backoff=0.01)
+        try:
+            StandInTickerHandler.responses = [(200, {'symbol': 'BTCUSDT', 'price': '64000.12'}, 0)]
+            quote = client.get_price('BTCUSDT')
+            self.assertEqual(quote.symbol, 'BTCUSDT')
+            self.assertEqual(quote.price, 64000.12)
+            self.assertGreater(quote.latency, 0)
+
+            # Server errors and timeouts are retried
+            StandInTickerHandler.responses = [
+                (500, {'msg': 'busy'}, 0),
+                (200, {'symbol': 'BTCUSDT', 'price': '1.0'}, 0.5),
+                (200, {'symbol': 'BTCUSDT', 'price': '64001.0'}, 0)
+            ]
+            self.assertEqual(client.get_price('BTCUSDT').price, 64001.0)
+
+            # Many symbols in one request
+            StandInTickerHandler.responses = [
+                (200, [{'symbol': 'BTCUSDT', 'price': '64003.0'}, {'symbol': 'ETHUSDT', 'price': '3100.5'}], 0)
+            ]
+            quotes = client.get_prices(['BTCUSDT', 'ETHUSDT'])
+            self.assertEqual(quotes['BTCUSDT'].price, 64003.0)
+            self.assertEqual(quotes['ETHUSDT'].price, 3100.5)
+            self.assertEqual(StandInTickerHandler.last_path, '/api/v3/ticker/price?symbols=%5B%22BTCUSDT%22%2C%22ETHUSDT%22%5D')
+
+            # Client errors are not
+            StandInTickerHandler.responses = [
+                (400, {'msg': 'Invalid symbol.'}, 0),
+                (200, {'symbol': 'BTCUSDT', 'price': '64002.0'}, 0)
+            ]
+            with self.assertRaises(ValueError):
+                client.get_price('NOPE')
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
     def test_load_price_data(self):
-        result = load_price_data(window_size=1)
+        result = load_price_data(db_utils, window_size=1)
         self.assertEqual(len(result), 1)
-        self.assertEqual(type(result[0]), float)
+        self.assertIsInstance(result[0], float)
         
         with self.assertRaises(ValueError):
-            result = load_price_data(window_size=20)
+            result = load_price_data(db_utils, window_size=20)
 
     def test_logger(self):
-        with open('errors.log', 'r') as f:
-            self.assertEqual(f.readlines()[0], '[load_price_data] Insufficient data.\n')
+        with tempfile.TemporaryDirectory() as directory:
+            log.stop()
+            log_file, log.LOG_FILE = log.LOG_FILE, os.path.join(directory, "errors.log")
+            try:
+                logger("[load_price_data] Insufficient data.")
+                logger("Retrying.", level='warning', stage='fetch_prices')
+                # Records are written by a background thread; stopping it writes out everything queued
+                log.stop()
+                with open(log.LOG_FILE) as f:
+                    lines = [json.loads(x) for x in f]
+            finally:
+                log.LOG_FILE = log_file
+        self.assertEqual(
+            [(x['stage'], x['level'], x['message']) for x in lines],
+            [('load_price_data', 'error', 'Insufficient data.'), ('fetch_prices', 'warning', 'Retrying.')]
+        )
 
     def test_get_sma(self):
         result = get_sma(data=[1,2,3,4,5,6,7,8,9,10])
@@ -51,6 +132,7 @@ class DemoFuncsTestCase(unittest.TestCase):
     def test_make_advice(self):
         
         result = make_advice(
+            db_utils,
             data=[1.,2.,3.,4.,5.,6.,7.,8.,9.,10.],
             k=1
         )
@@ -63,6 +145,7 @@ class DemoFuncsTestCase(unittest.TestCase):
         self.assertEqual(result['advice'], "BUY")
 
         result = make_advice(
+            db_utils,
             data=[10.,9.,8.,7.,6.,5.,4.,3.,2.,1.],
             k=1
         )
@@ -74,6 +157,60 @@ class DemoFuncsTestCase(unittest.TestCase):
         self.assertAlmostEqual(result['lower_band'], 2.6277187)
         self.assertEqual(result['advice'], "SELL")
 
+    def test_rolling_bollinger(self):
+        data = [float(x) for x in range(1, 41)]
+        bollinger = RollingBollinger(window_size=10, k=1)
+        for i, price in enumerate(data):
+            bollinger.push(price)
+            if i < 9:
+                self.assertFalse(bollinger.is_ready())
+                continue
+            window = data[i-9:i+1][::-1]
+            result = bollinger.bands()
+            self.assertEqual(result['price'], window[0])
+            self.assertAlmostEqual(result['sma'], get_sma(window))
+            self.assertAlmostEqual(result['standard_deviation'], np.std(window))
+            self.assertAlmostEqual(result['upper_band'], get_sma(window) + np.std(window))
+            self.assertAlmostEqual(result['lower_band'], get_sma(window) - np.std(window))
+
+        warmed = RollingBollinger(window_size=10, k=1)
+        warmed.warm(data[::-1])
+        self.assertAlmostEqual(warmed.bands()['standard_deviation'], 2.8722813)
+
+    def test_candle_bands(self):
+        prices = np.random.default_rng(1).normal(100.0, 5.0, 600)
+        timestamps = 1700000000000 + 30000 * np.arange(600)
+        create_prices(zip(prices.tolist(), timestamps.tolist()), symbol='CANDLEBANDS')
+        with self.assertRaises(ValueError):
+            get_candle_bands(db_utils, 10, interval='1h', symbol='CANDLEBANDS')
+        bands = get_candle_bands(db_utils, 300, interval='1m', k=2, symbol='CANDLEBANDS')
+        self.assertEqual(bands['price'], prices[-1])
+        self.assertAlmostEqual(bands['sma'], prices.mean(), places=9)
+        self.assertAlmostEqual(bands['standard_deviation'], prices.std(), places=6)
+        self.assertAlmostEqual(bands['upper_band'], prices.mean() + 2 * prices.std(), places=6)
+
+    def test_price_window(self):
+        window = PriceWindow(capacity=3)
+        self.assertEqual(window.push(1.0), None)
+        self.assertEqual(window.push(2.0), None)
+        self.assertEqual(list(window.prices()), [2.0, 1.0])
+        self.assertEqual(window.push(3.0), None)
+        self.assertTrue(window.is_full())
+        self.assertEqual(window.push(4.0), 1.0)
+        self.assertEqual(window.push(5.0), 2.0)
+        result = window.prices()
+        self.assertEqual(list(result), [5.0, 4.0, 3.0])
+        self.assertEqual(list(window.prices(2)), [5.0, 4.0])
+        self.assertEqual(window.latest(), 5.0)
+        self.assertEqual(len(window.timestamps()), 3)
+
+        window.extend(np.array([6.0, 7.0]), np.array(['2024-01-01 00:00:00', '2024-01-01 00:00:30'], dtype='datetime64[ms]'))
+        self.assertEqual(list(window.prices()), [7.0, 6.0, 5.0])
+        self.assertEqual(window.timestamps()[0], np.datetime64('2024-01-01 00:00:30'))
+        # Zero-copy view into the ring buffer
+        self.assertFalse(result.flags.owndata)
+        self.assertFalse(result.flags.writeable)
+
     def test_buy(self):
         
         buy_advice_dict = {
@@ -89,7 +226,7 @@ class DemoFuncsTestCase(unittest.TestCase):
         # Check that buy executes
         create_seed_funds(200.0)
         
-        result = buy(buy_advice_dict)
+        result = buy(db_utils, buy_advice_dict)
         #db = read_last_trade()[0]
         #print(db)
         self.assertEqual(result[0]['id'], 1)
@@ -105,7 +242,7 @@ class DemoFuncsTestCase(unittest.TestCase):
         self.assertEqual(funds[0]['balance'], 0.0)
 
         # Check that logic holds and buy doesn't execute
-        buy(buy_advice_dict)
+        buy(db_utils, buy_advice_dict)
         result = read_last_trade()
         print(result)
         self.assertEqual(result[0]['id'], 1)
@@ -119,7 +256,7 @@ class DemoFuncsTestCase(unittest.TestCase):
 
     def test_sell(self):
         sell_advice = read_last_advice()[0]
-        result = sell(sell_advice, 1.05)
+        result = sell(db_utils, sell_advice, 1.05)
         self.assertEqual(result[0]['id'], 1)
         self.assertEqual(result[0]['amount'], 199.8)
         self.assertEqual(result[0]['buy_advice_id'], 1)
@@ -132,6 +269,33 @@ class DemoFuncsTestCase(unittest.TestCase):
         self.assertEqual(funds[0]['trade_id'], 1)
         self.assertEqual(funds[0]['balance'], 1996.002)
 
+    def test_ledger(self):
+        previous = use_storage(MemoryStorage())
+        try:
+            create_seed_funds(200.0)
+            ledger = Ledger.from_database(db_utils)
+            self.assertEqual(ledger.balance, 200.0)
+            self.assertIsNone(ledger.open_trade)
+            buy_advice = {'id': 1, 'price': 2.0}
+            sell_advice = {'id': 2, 'price': 3.0}
+            # Decisions come from the ledger, without reading the database
+            with unittest.mock.patch('demo_db_utils.read_account_balances', side_effect=AssertionError), \
+                    unittest.mock.patch('demo_db_utils.read_last_trade', side_effect=AssertionError):
+                self.assertIsNone(sell(db_utils, sell_advice, 1.0, ledger))
+                bought = buy(db_utils, buy_advice, ledger)[0]
+                self.assertIsNone(buy(db_utils, buy_advice, ledger))
+                self.assertIsNone(sell(db_utils, {'id': 3, 'price': 1.0}, 1.0, ledger))
+                sold = sell(db_utils, sell_advice, 1.0, ledger)[0]
+            self.assertEqual(bought['amount'], 199.8)
+            self.assertEqual(sold['profit_multiplier'], 1.5)
+            # Every write went through to the database
+            self.assertEqual(read_last_trade()[0], ledger.last_trade)
+            self.assertEqual(read_account_balances(1)[0]['balance'], ledger.balance)
+            self.assertAlmostEqual(ledger.balance, 199.8 * 1.5 * 0.999)
+            self.assertEqual(Ledger.from_database(db_utils).balance, ledger.balance)
+        finally:
+            use_storage(previous)
+
 
 if __name__ == '__main__':
     unittest.main()
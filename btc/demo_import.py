@@ -0,0 +1,118 @@
+import argparse
+import csv
+import datetime
+import itertools
+import time
+import numpy as np
+import demo_db_utils as db_utils
+
+# Rows per executemany() call, and rows per transaction
+CHUNK_SIZE = 50000
+TRANSACTION_SIZE = 1000000
+
+
+def _to_ms(value):
+    # Epoch seconds / milliseconds / microseconds by magnitude, otherwise an ISO date string (taken as UTC)
+    try:
+        number = float(value)
+    except ValueError:
+        timestamp = datetime.datetime.fromisoformat(value)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.UTC)
+        return int(timestamp.timestamp() * 1000)
+    return int(_epoch_to_ms(np.array([number]))[0])
+
+
+def _epoch_to_ms(numbers):
+    return np.where(numbers >= 1e14, numbers // 1000, np.where(numbers >= 1e11, numbers, numbers * 1000)).astype(np.int64)
+
+
+def _parse_chunk(lines, price_column, timestamp_column):
+    # Numeric files are parsed in C by NumPy; files with date strings fall back to the csv module
+    try:
+        data = np.loadtxt(lines, delimiter=',', usecols=(price_column, timestamp_column), dtype=np.float64, ndmin=2)
+    except ValueError:
+        rows = list(csv.reader(lines))
+        return [(float(x[price_column]), _to_ms(x[timestamp_column])) for x in rows]
+    return list(zip(data[:, 0].tolist(), _epoch_to_ms(data[:, 1]).tolist()))
+
+
+def read_csv_chunks(f):
+    '''
+    Yields lists of (price, timestamp) pairs from a CSV file with a header and 'price' and 'timestamp' columns.
+
+    :param f:   Open text file
+    '''
+    header = next(csv.reader([f.readline()]))
+    price_column = header.index('price')
+    timestamp_column = header.index('timestamp')
+    while True:
+        lines = list(itertools.islice(f, CHUNK_SIZE))
+        if not lines:
+            return
+        yield _parse_chunk(lines, price_column, timestamp_column)
+
+
+def read_kline_chunks(f):
+    '''
+    Yields lists of (price, timestamp) pairs from a Binance kline file (close price at its close time).
+
+    :param f:   Open text file
+    '''
+    while True:
+        lines = list(itertools.islice(f, CHUNK_SIZE))
+        if not lines:
+            return
+        # Some kline dumps start with a header row
+        lines = [x for x in lines if x[:1].isdigit()]
+        if lines:
+            yield _parse_chunk(lines, 4, 6)
+
+
+READERS = {
+    'csv': read_csv_chunks,
+    'kline': read_kline_chunks
+}
+
+
+def import_prices(path, file_format='csv', symbol=db_utils.DEFAULT_SYMBOL):
+    '''
+    Streams a price file into the Price table in large transactions, with the timestamp indexes rebuilt once at the end.
+    Rows must be in chronological order and newer than everything already in the table, so ids stay chronological.
+
+    :param path:        File to import, as a string
+    :param file_format: 'csv' or 'kline', as a string
+    :param symbol:      Trading pair the prices are for, as a string
+    :rtype:             Number of entries created, as an integer
+    '''
+    newest = db_utils.read_last_price_timestamp(symbol)
+    created = 0
+    with db_utils.bulk_load(), open(path, newline='') as f:
+        chunks = READERS[file_format](f)
+        while True:
+            with db_utils.transaction():
+                for _ in range(TRANSACTION_SIZE // CHUNK_SIZE):
+                    chunk = next(chunks, None)
+                    if not chunk:
+                        break
+                    if newest is not None and chunk[0][1] < newest:
+                        raise ValueError(f"{path} starts before the newest price already in the database.")
+                    newest = chunk[-1][1]
+                    created += db_utils.create_prices(chunk, symbol=symbol)
+            if not chunk:
+                break
+    return created
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk import historical prices into the Price table.")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--format', choices=sorted(READERS), default='csv')
+    parser.add_argument('--symbol', default=db_utils.DEFAULT_SYMBOL)
+    args = parser.parse_args()
+
+    db_utils.create_database()
+    for path in args.files:
+        start = time.perf_counter()
+        created = import_prices(path, args.format, args.symbol)
+        print(f"{path}: {created} prices in {time.perf_counter() - start:.1f}s")
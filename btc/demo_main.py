@@ -1,43 +1,149 @@
-import demo_funcs
-import schedule
-import time
+import asyncio
+import os
+import demo_db_utils as db_utils
+import demo_metrics
+import demo_scheduler
+import funcs
+import pipeline
+import strategies
+import stream
+from demo_config import SYMBOLS
 
-def main(window_size=57600, k=2, desired_profit=1.00):
+# Strategy to trade with: 'bollinger', 'ema_bollinger', 'rsi' or 'macd' (see strategies.py)
+STRATEGY = 'bollinger'
+
+# Price feed (shared indicators) and strategy per symbol, warm-loaded from the database on the first tick
+feeds = {}
+strategies_by_symbol = {}
+
+# Balance and open position per symbol (write-through, see funcs.Ledger), loaded on the first tick
+ledgers = {}
+
+# Set to 'trade' or 'bookTicker' to stream prices from the exchange WebSocket instead of polling every 30 seconds (see stream.py)
+# The strategy then runs on every tick of STREAM_INTERVAL_MS, so window_size counts those ticks
+STREAM = os.environ.get('STREAM')
+STREAM_INTERVAL_MS = 1000
+
+# Set to run fetching, the strategy and database writes in three processes instead (see pipeline.py); prices are still fetched every 30 seconds
+# Each process then logs to a file of its own: errors.fetcher.log, errors.strategy.log and errors.persistence.log
+PIPELINE = os.environ.get('PIPELINE')
+
+# Set to a .prom path (Prometheus textfile) or a .jsonl path to time every stage and export the histograms
+# With PIPELINE, each process exports its own file next to it instead (metrics.fetcher.prom, metrics.strategy.prom, metrics.persistence.prom)
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_INTERVAL = 60
+
+def process(quotes, window_size=57600, k=2, desired_profit=1.00, symbols=SYMBOLS, persist=True):
     try:
-        # Save BTC price
-        demo_funcs.get_btc_price()
+        # Everything a tick writes is committed together at the end of the block
+        with demo_metrics.timer('process'), db_utils.transaction():
+            for symbol in symbols:
+                if symbol not in feeds:
+                    with demo_metrics.timer('load_price_data'):
+                        feeds[symbol] = strategies.Feed(db_utils, symbol)
+                        strategies_by_symbol[symbol] = strategies.build(STRATEGY, feeds[symbol], window_size, k)
+                        feeds[symbol].load(window_size)
+                if symbol not in ledgers:
+                    ledgers[symbol] = funcs.Ledger.from_database(db_utils, symbol)
+
+            # Save every symbol's price and update its indicators
+            with demo_metrics.timer('save_prices'):
+                funcs.save_prices(db_utils, quotes, windows=feeds, persist=persist)
+
+            for symbol in symbols:
+                try:
+                    # Use the incrementally updated indicators to generate advice
+                    with demo_metrics.timer('make_advice'):
+                        advice = funcs.make_strategy_advice(db_utils, strategies_by_symbol[symbol])
+
+                    if advice['advice'] == "BUY":
+                        with demo_metrics.timer('buy'):
+                            funcs.buy(db_utils, advice, ledgers[symbol])
+                
+                    elif advice['advice'] == 'SELL':
+                        with demo_metrics.timer('sell'):
+                            funcs.sell(db_utils, advice, desired_profit, ledgers[symbol])
+
+                    else:
+                        pass
+            
+                except ValueError:
+                    pass
+    except BaseException:
+        # The tick was rolled back, so the indicators and cached balances are reloaded from the database on the next one
+        feeds.clear()
+        strategies_by_symbol.clear()
+        ledgers.clear()
+        raise
+
+
+def process_ticks(ticks, window_size=57600, k=2, desired_profit=1.00):
+    # Streamed ticks are saved in batches by the ingestor, so each one only runs the strategy
+    for quote in ticks:
+        process({quote.symbol: quote}, window_size, k, desired_profit, symbols=[quote.symbol], persist=False)
+
+
+def main(window_size=57600, k=2, desired_profit=1.00, symbols=SYMBOLS):
+    # Fetch prices (one batched request), then run the strategy on them
+    with demo_metrics.timer('tick'):
+        with demo_metrics.timer('fetch_prices'):
+            quotes = funcs.fetch_prices(symbols)
+        process(quotes, window_size, k, desired_profit, symbols)
+
+
+async def tick(window_size=57600, k=2, desired_profit=1.00, symbols=SYMBOLS):
+    # Network and database work run in worker threads, so the event loop (and the purge job) are never blocked
+    with demo_metrics.timer('tick'):
+        with demo_metrics.timer('fetch_prices'):
+            quotes = await asyncio.to_thread(funcs.fetch_prices, symbols)
+        await asyncio.to_thread(process, quotes, window_size, k, desired_profit, symbols)
+
+
+def purge():
+    funcs.purge(db_utils)
+
+
+def export_metrics():
+    demo_metrics.export(METRICS_FILE)
+
+
+def start_metrics():
+    demo_metrics.enable()
+    # Every db_utils call is timed as 'db.<function>'
+    demo_metrics.instrument(db_utils, 'db', exclude=('get_storage', 'use_storage', 'get_connection', 'close_connections', 'transaction', 'bulk_load', 'now_ms'))
 
-        # Load data 
-        data = demo_funcs.load_price_data(
-            window_size=window_size
-        )
 
-        # Use data to generate advice
-        advice = demo_funcs.make_advice(
-            data=data,
-            k=k
-        )
+def start_stage_metrics(stage):
+    # Runs first in every pipeline process, which times its own stages and exports them next to METRICS_FILE, e.g. metrics.strategy.prom
+    start_metrics()
+    root, extension = os.path.splitext(METRICS_FILE)
+    demo_metrics.export_every(f"{root}.{stage}{extension}", METRICS_INTERVAL)
 
-        if advice['advice'] == "BUY":
-            demo_funcs.buy(advice)
-        
-        elif advice['advice'] == 'SELL':
-            demo_funcs.sell(advice, desired_profit)
 
-        else:
-            pass
-    
-    except ValueError:
-        pass
+scheduler = demo_scheduler.Scheduler()
 
-schedule.every().minute.at(":00").do(main)
+ingestor = None
 
-schedule.every().minute.at(":15").do(demo_funcs.purge)
+if STREAM:
+    ingestor = stream.StreamIngestor(stream.stream_url(SYMBOLS, STREAM), db_utils, STREAM_INTERVAL_MS, on_ticks=process_ticks)
+elif not PIPELINE:
+    scheduler.every(30, tick, name='main')
 
-schedule.every().minute.at(":30").do(main)
+# The pipeline's strategy process purges on its own
+if not PIPELINE:
+    scheduler.every(30, demo_metrics.timed(purge), offset=15, name='purge')
 
-schedule.every().minute.at(":45").do(demo_funcs.purge)
+if METRICS_FILE:
+    scheduler.every(METRICS_INTERVAL, export_metrics, offset=5, name='metrics')
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+if __name__ == '__main__':
+    if PIPELINE:
+        setup = start_stage_metrics if METRICS_FILE else None
+        with pipeline.Pipeline(process, SYMBOLS, db_utils, interval=30, setup=setup) as running:
+            running.join()
+    else:
+        if METRICS_FILE:
+            start_metrics()
+        if ingestor is not None:
+            ingestor.start()
+        asyncio.run(scheduler.run())
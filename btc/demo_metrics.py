@@ -0,0 +1,232 @@
+import atexit
+import bisect
+import contextlib
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Timing is off unless `enable()` is called; disabled timers cost one global lookup
+enabled = False
+
+# Bucket upper bounds in seconds: four per doubling from 1 microsecond to ~134 seconds (relative error under 19%)
+BUCKETS = [1e-6 * 2 ** (i / 4) for i in range(109)]
+
+_histograms = {}
+_lock = threading.Lock()
+_null_timer = contextlib.nullcontext()
+
+
+class Histogram:
+    '''
+    Latency histogram with fixed log-spaced buckets. Recording is O(log buckets) and memory is constant.
+    '''
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        '''
+        Returns the upper bound of the bucket holding the q-th quantile (capped at the observed maximum).
+
+        :param q:   Quantile between 0 and 1, as a float
+        :rtype:     Seconds, as a float
+        '''
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max
+        }
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def histogram(name):
+    h = _histograms.get(name)
+    if h is None:
+        with _lock:
+            h = _histograms.setdefault(name, Histogram())
+    return h
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
+
+
+def timer(name):
+    '''
+    Context manager that records how long its block takes under a stage name. Does nothing while metrics are disabled.
+
+    :param name:    Stage name, as a string
+    '''
+    if not enabled:
+        return _null_timer
+    return _Timer(histogram(name))
+
+
+def timed(func, name=None):
+    '''
+    Wraps a function so every call is recorded under a stage name (defaults to the function name).
+    '''
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        with _Timer(histogram(name)):
+            return func(*args, **kwargs)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def instrument(module, prefix, exclude=()):
+    '''
+    Replaces every public function defined in a module with a timed wrapper named `<prefix>.<function>`.
+    Callers that use `module.function` pick the wrappers up; call it once at startup, only when metrics are wanted.
+
+    :param module:  Module to instrument, e.g. demo_db_utils
+    :param prefix:  Stage name prefix, as a string
+    :param exclude: Function names to leave alone, as a tuple of strings
+    '''
+    for name, value in list(vars(module).items()):
+        if name.startswith('_') or name in exclude or hasattr(value, '__wrapped__'):
+            continue
+        if callable(value) and getattr(value, '__module__', None) == module.__name__ and not isinstance(value, type):
+            setattr(module, name, timed(value, f"{prefix}.{name}"))
+
+
+def snapshot():
+    '''
+    Returns count, sum, p50, p99 and max (seconds) per stage.
+
+    :rtype:     Dictionary of stage name to dictionary
+    '''
+    with _lock:
+        items = sorted(_histograms.items())
+    return {name: h.summary() for name, h in items}
+
+
+def _write_atomic(path, text):
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def write_prometheus(path, namespace='stonks'):
+    '''
+    Writes every stage as a Prometheus summary (text exposition format), replacing the file atomically.
+    Point node_exporter's textfile collector at it.
+
+    :param path:        Output file, as a string
+    :param namespace:   Metric name prefix, as a string
+    '''
+    metric = f"{namespace}_stage_seconds"
+    lines = [
+        f"# HELP {metric} Time spent in each stage of the tick pipeline.",
+        f"# TYPE {metric} summary"
+    ]
+    stats = snapshot()
+    for name, x in stats.items():
+        lines.append(f'{metric}{{stage="{name}",quantile="0.5"}} {x["p50"]:.9f}')
+        lines.append(f'{metric}{{stage="{name}",quantile="0.99"}} {x["p99"]:.9f}')
+        lines.append(f'{metric}_sum{{stage="{name}"}} {x["sum"]:.9f}')
+        lines.append(f'{metric}_count{{stage="{name}"}} {x["count"]}')
+    lines.append(f"# HELP {metric}_max Slowest run of each stage.")
+    lines.append(f"# TYPE {metric}_max gauge")
+    for name, x in stats.items():
+        lines.append(f'{metric}_max{{stage="{name}"}} {x["max"]:.9f}')
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def write_json_line(path):
+    '''
+    Appends one JSON line with a timestamp and every stage's summary.
+
+    :param path:    Output file, as a string
+    '''
+    with open(path, 'a') as f:
+        f.write(json.dumps({'time': time.time(), 'stages': snapshot()}) + "\n")
+
+
+def export(path):
+    '''
+    Writes JSON lines if the path ends in .json or .jsonl, otherwise a Prometheus text file.
+    '''
+    if path.endswith(('.json', '.jsonl')):
+        write_json_line(path)
+    else:
+        write_prometheus(path)
+
+
+def export_every(path, interval):
+    '''
+    Exports to a path every `interval` seconds from a background thread, and once more at exit. For processes without a scheduler.
+
+    :param path:        Output file, as a string (see `export()`)
+    :param interval:    Seconds between exports, as a float
+    '''
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            export(path)
+
+    def finish():
+        stop.set()
+        export(path)
+
+    threading.Thread(target=run, name='metrics', daemon=True).start()
+    atexit.register(finish)
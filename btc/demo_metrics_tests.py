@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import types
+import unittest
+from demo_metrics import *
+import demo_metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        reset()
+        enable()
+
+    def tearDown(self):
+        disable()
+        reset()
+
+    def test_histogram(self):
+        h = Histogram()
+        self.assertEqual(h.quantile(0.5), 0.0)
+        for _ in range(98):
+            h.record(0.001)
+        h.record(0.1)
+        h.record(2.0)
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.max, 2.0)
+        # Bucket bounds are within 19% of the true value
+        self.assertGreaterEqual(h.quantile(0.5), 0.001)
+        self.assertLess(h.quantile(0.5), 0.00119)
+        self.assertGreaterEqual(h.quantile(0.99), 0.1)
+        self.assertLess(h.quantile(0.99), 0.119)
+        self.assertEqual(h.quantile(1.0), 2.0)
+
+    def test_timer(self):
+        with timer('stage'):
+            pass
+        self.assertEqual(snapshot()['stage']['count'], 1)
+        disable()
+        self.assertIs(timer('stage'), demo_metrics._null_timer)
+        with timer('stage'):
+            pass
+        self.assertEqual(snapshot()['stage']['count'], 1)
+
+    def test_instrument(self):
+        module = types.ModuleType('fake_db_utils')
+        exec("def read_prices(n):\n    return n * 2\n\ndef _private():\n    return 1\n", module.__dict__)
+        instrument(module, 'db')
+        instrument(module, 'db')
+        self.assertEqual(module.read_prices(3), 6)
+        stats = snapshot()
+        self.assertEqual(stats['db.read_prices']['count'], 1)
+        self.assertNotIn('db._private', stats)
+
+    def test_export(self):
+        with timer('tick'):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stonks.prom")
+            export(path)
+            with open(path) as f:
+                text = f.read()
+            self.assertIn('# TYPE stonks_stage_seconds summary', text)
+            self.assertIn('stonks_stage_seconds{stage="tick",quantile="0.99"}', text)
+            self.assertIn('stonks_stage_seconds_count{stage="tick"} 1', text)
+            self.assertFalse(os.path.exists(path + ".tmp"))
+
+            path = os.path.join(directory, "stonks.jsonl")
+            export(path)
+            export(path)
+            with open(path) as f:
+                lines = [json.loads(x) for x in f]
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(lines[0]['stages']['tick']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
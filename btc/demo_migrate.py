@@ -0,0 +1,4 @@
+from demo_db_utils import create_database
+
+# Upgrades an existing database in place (text timestamps -> epoch milliseconds, indexes)
+create_database()
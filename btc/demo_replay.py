@@ -0,0 +1,183 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import numpy as np
+import demo_db_utils as db_utils
+import funcs
+import demo_import
+import demo_main
+
+# Virtual time between purges; production purges every 30 seconds, but only rows older than 22 days go, so hourly is plenty
+PURGE_INTERVAL_MS = 3600 * 1000
+
+
+class VirtualClock:
+    '''
+    Clock for `db_utils.set_clock()` that only moves when told to, so recorded prices can be replayed as fast as the machine allows.
+
+    :param start_ms:    Starting time, in epoch milliseconds
+    '''
+    def __init__(self, start_ms=0):
+        self.ms = int(start_ms)
+
+    def __call__(self):
+        return self.ms / 1000
+
+    def set(self, ms):
+        self.ms = int(ms)
+
+    def advance(self, ms):
+        self.ms += int(ms)
+
+
+class ReplayPriceClient:
+    '''
+    Stands in for `funcs.price_client`, handing out recorded prices one tick at a time and moving the clock to each price's timestamp.
+
+    :param prices:      Recorded prices in chronological order, as a numpy.ndarray
+    :param timestamps:  When they were recorded in epoch milliseconds, as a numpy.ndarray
+    :param clock:       Clock to move, as a VirtualClock
+    :param symbol:      Trading pair the prices are for, as a string
+    '''
+    def __init__(self, prices, timestamps, clock, symbol=db_utils.DEFAULT_SYMBOL):
+        self.prices = np.asarray(prices, dtype=np.float64).tolist()
+        self.timestamps = np.asarray(timestamps, dtype=np.int64).tolist()
+        self.clock = clock
+        self.symbol = symbol
+        self.index = 0
+
+    def __len__(self):
+        return len(self.prices)
+
+    def get_prices(self, symbols):
+        if self.index >= len(self.prices):
+            raise ValueError("Replay finished.")
+        price, timestamp = self.prices[self.index], self.timestamps[self.index]
+        self.index += 1
+        self.clock.set(timestamp)
+        return {self.symbol: funcs.PriceQuote(self.symbol, price, timestamp, 0.0)}
+
+    def get_price(self, symbol=db_utils.DEFAULT_SYMBOL):
+        return self.get_prices([symbol])[symbol]
+
+
+def read_file(path, file_format='csv'):
+    '''
+    Reads recorded prices from a file in one of the `demo_import` formats.
+
+    :param path:        File to read, as a string
+    :param file_format: 'csv' or 'kline', as a string
+    :rtype:             (prices, timestamps in epoch milliseconds), as a tuple of numpy.ndarray
+    '''
+    with open(path, newline='') as f:
+        rows = [x for chunk in demo_import.READERS[file_format](f) for x in chunk]
+    data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    return data[:, 0], data[:, 1].astype(np.int64)
+
+
+def read_table(database, start=0, end=2 ** 62, symbol=db_utils.DEFAULT_SYMBOL):
+    '''
+    Reads recorded prices from the Price table of a database. The database is only read.
+
+    :param database:    Database file, as a string
+    :param start:       Start of the period (inclusive), as epoch milliseconds, a datetime or a 'YYYY-MM-DD HH:MM:SS' string
+    :param end:         End of the period (exclusive), as epoch milliseconds, a datetime or a 'YYYY-MM-DD HH:MM:SS' string
+    :param symbol:      Trading pair, as a string
+    :rtype:             (prices, timestamps in epoch milliseconds), as a tuple of numpy.ndarray
+    '''
+    source = db_utils.SQLiteStorage(database)
+    try:
+        data = source.read_price_range(start, end, columns=('price', 'timestamp'), symbol=symbol)
+    finally:
+        source.close()
+    return data['price'], data['timestamp'].view(np.int64)
+
+
+def replay(prices, timestamps, window_size=57600, k=2, desired_profit=1.00, seed_funds=200.0,
+           symbol=db_utils.DEFAULT_SYMBOL, storage=None, purge_interval=PURGE_INTERVAL_MS):
+    '''
+    Replays recorded prices through the unmodified tick pipeline (`demo_main.main()` -> `buy()` / `sell()` and the periodic purge)
+    on a virtual clock, one tick per price, as fast as possible. The storage, clock and price client in use are restored afterwards.
+
+    :param prices:          Recorded prices in chronological order, as a numpy.ndarray
+    :param timestamps:      When they were recorded in epoch milliseconds, as a numpy.ndarray
+    :param window_size:     Number of prices in the strategy window, as an integer
+    :param k:               Width of the Bollinger bands in standard deviations, as a float
+    :param desired_profit:  Minimum sell / buy price ratio, as a float
+    :param seed_funds:      Starting balance, as a float
+    :param symbol:          Trading pair, as a string
+    :param storage:         Storage to trade in (defaults to a new MemoryStorage), as a SQLiteStorage or MemoryStorage
+    :param purge_interval:  Virtual time between purges in milliseconds, as an integer (None never purges)
+    :rtype:                 Dictionary with throughput and trading results
+    '''
+    storage = db_utils.MemoryStorage() if storage is None else storage
+    clock = VirtualClock(timestamps[0] if len(timestamps) else 0)
+    client = ReplayPriceClient(prices, timestamps, clock, symbol)
+    previous_storage = db_utils.use_storage(storage)
+    previous_clock = db_utils.set_clock(clock)
+    price_client = funcs.price_client
+    funcs.price_client = client
+    demo_main.feeds.clear()
+    demo_main.strategies_by_symbol.clear()
+    demo_main.ledgers.clear()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db_utils.create_database()
+            db_utils.create_seed_funds(seed_funds, symbol=symbol)
+            next_purge = clock.ms + purge_interval if purge_interval else None
+            start = time.perf_counter()
+            for _ in range(len(client)):
+                demo_main.main(window_size, k, desired_profit, symbols=[symbol])
+                if next_purge is not None and clock.ms >= next_purge:
+                    funcs.purge(db_utils)
+                    next_purge = clock.ms + purge_interval
+            seconds = time.perf_counter() - start
+        last_trade = db_utils.read_last_trade(symbol=symbol)
+        balance = db_utils.read_account_balances(1, symbol=symbol)[0]['balance']
+    finally:
+        demo_main.feeds.clear()
+        demo_main.strategies_by_symbol.clear()
+        demo_main.ledgers.clear()
+        funcs.price_client = price_client
+        db_utils.set_clock(previous_clock)
+        db_utils.use_storage(previous_storage)
+    return {
+        'ticks': len(client),
+        'seconds': seconds,
+        'ticks_per_second': len(client) / seconds if seconds else None,
+        'replayed_seconds': (int(timestamps[-1]) - int(timestamps[0])) / 1000 if len(timestamps) else 0.0,
+        'trades': last_trade[0]['id'] if last_trade else 0,
+        'open_position': bool(last_trade) and last_trade[0]['sell_advice_id'] is None,
+        'final_balance': balance
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded prices through the trading pipeline on a virtual clock.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="Price file in a demo_import format")
+    source.add_argument('--database', help="Database whose Price table to replay")
+    parser.add_argument('--format', choices=sorted(demo_import.READERS), default='csv')
+    parser.add_argument('--symbol', default=db_utils.DEFAULT_SYMBOL)
+    parser.add_argument('--start', default=0, help="With --database: first timestamp to replay")
+    parser.add_argument('--end', default=2 ** 62, help="With --database: replay up to this timestamp")
+    parser.add_argument('--window-size', type=int, default=57600)
+    parser.add_argument('--k', type=float, default=2)
+    parser.add_argument('--desired-profit', type=float, default=1.00)
+    parser.add_argument('--strategy', choices=sorted(demo_main.strategies.STRATEGIES), default=demo_main.STRATEGY)
+    parser.add_argument('--output', help="Database file to trade in (defaults to memory)")
+    args = parser.parse_args()
+
+    if args.file:
+        prices, timestamps = read_file(args.file, args.format)
+    else:
+        to_ms = lambda x: int(x) if str(x).isdigit() else x
+        prices, timestamps = read_table(args.database, to_ms(args.start), to_ms(args.end), args.symbol)
+    demo_main.STRATEGY = args.strategy
+    storage = db_utils.SQLiteStorage(args.output) if args.output else None
+    report = replay(prices, timestamps, args.window_size, args.k, args.desired_profit, symbol=args.symbol, storage=storage)
+    print(json.dumps(report, indent=2))
+    print(f"{report['ticks']} ticks in {report['seconds']:.1f}s ({report['ticks_per_second']:.0f} ticks/s)", file=sys.stderr)
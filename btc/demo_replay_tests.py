@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import unittest
+from demo_replay import *
+
+START = 1577836800000 # 2020-01-01 00:00:00 UTC
+HOUR = 3600 * 1000
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(START)
+        previous = db_utils.set_clock(clock)
+        try:
+            self.assertEqual(db_utils.now_ms(), START)
+            clock.advance(1500)
+            self.assertEqual(db_utils.now_ms(), START + 1500)
+        finally:
+            db_utils.set_clock(previous)
+        self.assertLess(abs(db_utils.now_ms() - time.time() * 1000), 1000)
+
+    def test_replay(self):
+        # 30 days of hourly prices on a sine wave, so the bands are crossed in both directions
+        ticks = 30 * 24
+        prices = 30000.0 + 1000.0 * np.sin(np.arange(ticks) / 10)
+        timestamps = START + HOUR * np.arange(ticks)
+        storage = db_utils.MemoryStorage()
+        previous = db_utils.get_storage()
+        report = replay(prices, timestamps, window_size=24, storage=storage)
+        self.assertIs(db_utils.get_storage(), previous)
+        self.assertIs(db_utils.clock, time.time)
+        self.assertEqual(report['ticks'], ticks)
+        self.assertGreater(report['ticks_per_second'], 0)
+        self.assertEqual(report['replayed_seconds'], (ticks - 1) * 3600)
+        self.assertGreater(report['trades'], 0)
+        self.assertEqual(report['final_balance'] == 0.0, report['open_position'])
+        # Trades are stamped with replayed time, and the purge ran on replayed time too
+        self.assertTrue(storage.read_last_trade()[0]['buy_timestamp'].startswith('2020-01-'))
+        self.assertEqual(storage.count_prices(), 22 * 24 + 1)
+
+    def test_sources(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "prices.csv")
+            with open(path, 'w') as f:
+                f.write("timestamp,price\n")
+                for i in range(5):
+                    f.write(f"{START + 30000 * i},{100.0 + i}\n")
+            prices, timestamps = read_file(path)
+            self.assertEqual(prices.tolist(), [100.0, 101.0, 102.0, 103.0, 104.0])
+            self.assertEqual(timestamps[-1], START + 120000)
+
+            database = os.path.join(directory, "source.db")
+            source = db_utils.SQLiteStorage(database)
+            source.create_database()
+            source.create_prices(zip(prices.tolist(), timestamps.tolist()))
+            source.close()
+            prices, timestamps = read_table(database, start=START + 30000, end=START + 120000)
+            self.assertEqual(prices.tolist(), [101.0, 102.0, 103.0])
+            self.assertEqual(timestamps.dtype, np.int64)
+
+
+if __name__ == '__main__':
+    unittest.main()
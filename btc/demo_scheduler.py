@@ -0,0 +1,69 @@
+import asyncio
+import collections
+import time
+import funcs
+
+# A finished run: job name, scheduled start (epoch seconds), lag behind schedule and run time in seconds, boundaries skipped
+JobRun = collections.namedtuple('JobRun', ['name', 'scheduled', 'lag', 'duration', 'skipped'])
+
+
+class Scheduler:
+    '''
+    Asyncio driver that runs jobs on wall-clock boundaries (e.g. every 30 seconds at :00 and :30).
+    Each job runs in its own task, so a slow job never delays another one, and plain functions are run in worker threads.
+    Start times are always computed from the epoch rather than from the previous run, so the schedule does not drift;
+    if a run overruns its interval the missed boundaries are skipped and counted.
+
+    :param clock:       Returns the current time in epoch seconds
+    :param sleep:       Coroutine function that waits a number of seconds on that clock (defaults to `asyncio.sleep`)
+    :param history:     Number of recent runs kept in `runs`, as an integer
+    :param lag_warning: Lag in seconds above which a run is written to the error log, as a float
+    '''
+    def __init__(self, clock=time.time, history=1000, lag_warning=1.0, sleep=asyncio.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.jobs = []
+        self.runs = collections.deque(maxlen=history)
+        self.lag_warning = lag_warning
+
+    def every(self, interval, job, offset=0.0, name=None):
+        '''
+        Adds a job.
+
+        :param interval:    Seconds between runs, as a float
+        :param job:         Function or coroutine function taking no arguments
+        :param offset:      Seconds after each boundary to run at, as a float
+        :param name:        Name used in `runs` and the error log, as a string
+        '''
+        self.jobs.append((float(interval), job, float(offset), name or job.__name__))
+        return self
+
+    def next_boundary(self, interval, offset, now):
+        return ((now - offset) // interval + 1) * interval + offset
+
+    async def _run_job(self, interval, job, offset, name):
+        scheduled = self.next_boundary(interval, offset, self.clock())
+        while True:
+            await self.sleep(max(0.0, scheduled - self.clock()))
+            started = self.clock()
+            try:
+                if asyncio.iscoroutinefunction(job):
+                    await job()
+                else:
+                    await asyncio.to_thread(job)
+            except Exception as e:
+                funcs.logger(f"Failed. Error message: {e!r}", stage=name)
+            finished = self.clock()
+            following = self.next_boundary(interval, offset, max(finished, scheduled))
+            skipped = int(round((following - scheduled) / interval)) - 1
+            run = JobRun(name, scheduled, started - scheduled, finished - started, skipped)
+            self.runs.append(run)
+            if run.lag > self.lag_warning or skipped:
+                funcs.logger(f"Late. Ran {run.duration:.3f}s, skipped {skipped} run(s).", level='warning', stage=name, latency=run.lag)
+            scheduled = following
+
+    async def run(self):
+        '''
+        Runs every job until cancelled.
+        '''
+        await asyncio.gather(*(self._run_job(*job) for job in self.jobs))
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import unittest
+from unittest import mock
+from demo_scheduler import *
+
+
+class FakeClock:
+    # Virtual time for the scheduler: it only moves once every job is asleep, straight to the earliest wake-up, so runs are exact
+
+    def __init__(self, now):
+        self.now = now
+        self.sleepers = []
+        self.order = itertools.count()
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        woken = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.sleepers, (self.now + seconds, next(self.order), woken))
+        await woken
+
+    def run_until(self, scheduler, end):
+        # Jobs that are plain functions run in worker threads, so their tasks are waited for in real time
+        async def run():
+            task = asyncio.ensure_future(scheduler.run())
+            try:
+                while True:
+                    while len(self.sleepers) < len(scheduler.jobs):
+                        await asyncio.sleep(0.001)
+                    if self.sleepers[0][0] > end:
+                        break
+                    self.now, _, woken = heapq.heappop(self.sleepers)
+                    woken.set_result(None)
+            finally:
+                task.cancel()
+        asyncio.run(run())
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def test_next_boundary(self):
+        scheduler = Scheduler()
+        self.assertEqual(scheduler.next_boundary(30, 0, 1000.0), 1020.0)
+        self.assertEqual(scheduler.next_boundary(30, 15, 1000.0), 1005.0)
+        self.assertEqual(scheduler.next_boundary(30, 0, 1020.0), 1050.0)
+
+    def test_runs_on_boundaries(self):
+        clock = FakeClock(1000.0)
+        calls = []
+        scheduler = Scheduler(clock, sleep=clock.sleep)
+        scheduler.every(30, lambda: calls.append(clock()), name='fast')
+        clock.run_until(scheduler, 1100.0)
+        self.assertEqual(calls, [1020.0, 1050.0, 1080.0])
+        self.assertEqual([(x.scheduled, x.lag, x.duration, x.skipped) for x in scheduler.runs], [(x, 0.0, 0.0, 0) for x in calls])
+
+    def test_slow_job_skips_and_does_not_block(self):
+        clock = FakeClock(1000.0)
+        fast = []
+
+        async def slow():
+            await clock.sleep(70)
+
+        scheduler = Scheduler(clock, sleep=clock.sleep)
+        scheduler.every(30, slow)
+        scheduler.every(30, lambda: fast.append(clock()), offset=15, name='fast')
+        with mock.patch('funcs.logger') as logger:
+            clock.run_until(scheduler, 1200.0)
+        # Started at 1020 and 1110, each ran 70 seconds, past the next two boundaries
+        slow_runs = [(x.scheduled, x.lag, x.duration, x.skipped) for x in scheduler.runs if x.name == 'slow']
+        self.assertEqual(slow_runs, [(1020.0, 0.0, 70.0, 2), (1110.0, 0.0, 70.0, 2)])
+        self.assertEqual(logger.call_args_list[0].kwargs['stage'], 'slow')
+        # The fast job kept its own schedule meanwhile
+        self.assertEqual(fast, [1005.0 + 30 * i for i in range(7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 from demo_db_utils import create_database, create_seed_funds
+from demo_config import SYMBOLS
 
 create_database()
-create_seed_funds(200.0)
+# One seed deposit per traded symbol
+for symbol in SYMBOLS:
+    create_seed_funds(200.0, symbol=symbol)
@@ -0,0 +1,130 @@
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import math
+import os
+import tempfile
+import numpy as np
+import demo_backtest
+
+RESULT_FIELDS = ['window_size', 'k', 'desired_profit', 'final_balance', 'trades', 'open_position']
+
+# Price series shared by every task in a worker process, memory-mapped from the parent's .npy file
+_prices = None
+
+
+def _init_worker(path):
+    global _prices
+    _prices = np.load(path, mmap_mode='r')
+
+
+def _save_bands(window_size, directory):
+    # Computes a window's bands once and writes them to a .npy file, for the tasks that split its grid to share
+    path = os.path.join(directory, f"bands_{window_size}.npy")
+    np.save(path, np.stack(demo_backtest.rolling_stats(_prices, window_size)))
+    return path
+
+
+def _run_window(window_size, params, start_balance, bands=None):
+    # Bands depend only on the window size: they are memory-mapped from `bands` when the window's grid is split across tasks,
+    # otherwise computed here; either way once per window, and reused for every (k, desired_profit)
+    if bands is None:
+        sma, standard_deviation = demo_backtest.rolling_stats(_prices, window_size)
+    else:
+        sma, standard_deviation = np.load(bands, mmap_mode='r')
+    results = []
+    for k, desired_profit in params:
+        result = demo_backtest.simulate(_prices, sma, standard_deviation, k, desired_profit, start_balance)
+        results.append({
+            'window_size': window_size,
+            'k': k,
+            'desired_profit': desired_profit,
+            'final_balance': result['final_balance'],
+            'trades': len(result['trades']),
+            'open_position': result['open_position']
+        })
+    return results
+
+
+def _tasks(window_sizes, ks, desired_profits, workers):
+    params = list(itertools.product(ks, desired_profits))
+    # With fewer window sizes than workers, split each window's grid so every core gets work
+    chunks = max(1, math.ceil(workers / len(window_sizes)))
+    size = max(1, math.ceil(len(params) / chunks))
+    for window_size in window_sizes:
+        for i in range(0, len(params), size):
+            yield window_size, params[i:i + size]
+
+
+def run_sweep(prices, window_sizes, ks, desired_profits, start_balance=200.0, workers=None):
+    '''
+    Backtests every combination of window size, k and desired profit across a process pool.
+    The price series is written once to a memory-mapped file that all workers share, instead of being pickled per task.
+    When a window's (k, desired_profit) grid is split across several tasks, its bands are computed once and shared the same way.
+
+    :param prices:          BTC prices in chronological order, as a numpy.ndarray
+    :param window_sizes:    Window sizes to try, as a list of integers
+    :param ks:              Band widths to try, as a list of floats
+    :param desired_profits: Profit thresholds to try, as a list of floats
+    :param start_balance:   Seed money, as a float
+    :param workers:         Number of processes (defaults to one per core)
+    :rtype:                 List of dictionaries, best final balance first
+    '''
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "prices.npy")
+        np.save(path, np.asarray(prices, dtype=np.float64))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            tasks = list(_tasks(window_sizes, ks, desired_profits, workers))
+            split = {x for x, _ in tasks if sum(1 for y, _ in tasks if y == x) > 1}
+            bands = {x: pool.submit(_save_bands, x, directory) for x in split}
+            futures = [pool.submit(_run_window, window_size, params, start_balance) for window_size, params in tasks if window_size not in split]
+            futures += [
+                pool.submit(_run_window, window_size, params, start_balance, bands[window_size].result())
+                for window_size, params in tasks if window_size in split
+            ]
+            results = [x for future in futures for x in future.result()]
+    results.sort(key=lambda x: x['final_balance'], reverse=True)
+    return results
+
+
+def write_results(results, path):
+    '''
+    Writes sweep results to a CSV file, ranked from best to worst.
+
+    :param results: As returned by `run_sweep()`
+    :param path:    Output file, as a string
+    '''
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['rank'] + RESULT_FIELDS)
+        writer.writeheader()
+        for rank, result in enumerate(results, start=1):
+            writer.writerow({'rank': rank, **result})
+
+
+def _floats(text):
+    return [float(x) for x in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Grid-search window_size / k / desired_profit with backtests.")
+    parser.add_argument('--file', help="Price file (.npy or CSV with a 'price' column); defaults to the database")
+    parser.add_argument('--window-sizes', default="2880,14400,57600")
+    parser.add_argument('--ks', default="1.5,2,2.5")
+    parser.add_argument('--desired-profits', default="1.00,1.01,1.02")
+    parser.add_argument('--start-balance', type=float, default=200.0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default="sweep_results.csv")
+    args = parser.parse_args()
+
+    results = run_sweep(
+        prices=demo_backtest.load_prices(args.file),
+        window_sizes=[int(x) for x in args.window_sizes.split(',')],
+        ks=_floats(args.ks),
+        desired_profits=_floats(args.desired_profits),
+        start_balance=args.start_balance,
+        workers=args.workers
+    )
+    write_results(results, args.output)
+    print(f"Wrote {len(results)} results to {args.output}")
@@ -0,0 +1,578 @@
+import requests
+import storage
+import log
+import collections
+import json
+import math
+import time
+import numpy as np
+
+def logger(message, level='error', stage=None, latency=None, **fields):
+    # Queued for a background writer as a JSON line (see log.py), so a tick never waits for the log file
+    log.write(message, level, stage, latency, **fields)
+
+
+# A price quote: symbol, price as a float, timestamp in epoch milliseconds, and request latency in seconds
+PriceQuote = collections.namedtuple('PriceQuote', ['symbol', 'price', 'timestamp', 'latency'])
+
+
+class PriceClient:
+    '''
+    Client for the Binance.US ticker endpoint. Reuses one keep-alive session (no new TCP/TLS handshake per tick),
+    bounds every request with connect/read timeouts and retries failures with exponential backoff.
+
+    :param base_url:    API root, as a string
+    :param timeout:     (connect, read) timeouts in seconds, as a tuple of floats
+    :param retries:     Extra attempts after a failed request, as an integer
+    :param backoff:     Delay before the first retry in seconds, doubled on each retry, as a float
+    '''
+    def __init__(self, base_url='https://api.binance.us', timeout=(3.05, 5.0), retries=2, backoff=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = int(retries)
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.last_latency = None
+
+    def _get_ticker(self, params):
+        # One ticker request with timeouts and retries; returns the parsed JSON and the request latency
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                r = self.session.get(f"{self.base_url}/api/v3/ticker/price", params=params, timeout=self.timeout)
+                self.last_latency = time.perf_counter() - start
+                if r.status_code == 200:
+                    return r.json(), self.last_latency
+                error = f"HTTP {r.status_code}: {r.text[:200]}"
+                # Client errors won't fix themselves, except rate limiting
+                if r.status_code < 500 and r.status_code != 429:
+                    break
+            except (requests.RequestException, ValueError) as e:
+                self.last_latency = time.perf_counter() - start
+                error = repr(e)
+            if attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt))
+        raise ValueError(f"Failed to get price from API. {error}")
+
+    def get_price(self, symbol='BTCUSDT'):
+        '''
+        Fetches the latest price for a symbol.
+
+        :param symbol:  Trading pair, as a string
+        :rtype:         PriceQuote
+        :raises:        ValueError if every attempt failed
+        '''
+        data, latency = self._get_ticker({'symbol': symbol})
+        try:
+            return PriceQuote(data['symbol'], float(data['price']), storage.now_ms(), latency)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Unexpected response from API: {data}") from e
+
+    def get_prices(self, symbols):
+        '''
+        Fetches the latest prices for many symbols with a single request.
+
+        :param symbols: Trading pairs, as a list of strings
+        :rtype:         Dictionary of symbol to PriceQuote
+        :raises:        ValueError if every attempt failed
+        '''
+        data, latency = self._get_ticker({'symbols': json.dumps(list(symbols), separators=(',', ':'))})
+        timestamp = storage.now_ms()
+        try:
+            return {x['symbol']: PriceQuote(x['symbol'], float(x['price']), timestamp, latency) for x in data}
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Unexpected response from API: {data}") from e
+
+    def close(self):
+        self.session.close()
+
+
+price_client = PriceClient()
+
+
+def get_btc_price(db_utils, window=None):
+    try: # Error handling
+        quote = price_client.get_price('BTCUSDT')
+    except ValueError as e:
+        logger(f"Failed. Error message: {e}", stage='get_btc_price')
+        return None
+    db_utils.create_price(quote.price, quote.timestamp)
+    if window is not None:
+        window.push(quote.price, np.datetime64(quote.timestamp, 'ms'))
+    return quote.price
+
+
+def fetch_prices(symbols):
+    '''
+    Fetches the latest price of every symbol in one batched request, without touching the database.
+
+    :param symbols: Trading pairs, as a list of strings
+    :rtype:         Dictionary of symbol to PriceQuote (empty if the request failed)
+    '''
+    try:
+        return price_client.get_prices(symbols)
+    except ValueError as e:
+        logger(f"Failed. Error message: {e}", stage='fetch_prices')
+        return {}
+
+
+def save_prices(db_utils, quotes, windows=None, persist=True):
+    '''
+    Saves fetched prices to the Price table and appends them to the rolling windows.
+
+    :param db_utils:    Where the prices are saved: a storage (see storage.py), or a module of storage functions such as demo_db_utils
+    :param quotes:  As returned by `fetch_prices()`
+    :param windows: Rolling window per symbol to append the prices to, as a dictionary (optional)
+    :param persist: False when the prices are saved elsewhere (e.g. in batches by stream.py), as a boolean
+    :rtype:         Dictionary of symbol to price as a float
+    '''
+    prices = {}
+    for symbol, quote in quotes.items():
+        if persist:
+            db_utils.create_price(quote.price, quote.timestamp, symbol=symbol)
+        if windows is not None and symbol in windows:
+            windows[symbol].push(quote.price, np.datetime64(quote.timestamp, 'ms'))
+        prices[symbol] = quote.price
+    return prices
+
+
+def get_prices(db_utils, symbols, windows=None):
+    '''
+    Fetches and saves the latest price of every symbol in one batched request. Used to run many trading pairs from one process.
+
+    :param db_utils:    Where the prices are saved (see `save_prices()`)
+    :param symbols:     Trading pairs, as a list of strings
+    :param windows:     Rolling window per symbol to append the prices to, as a dictionary (optional)
+    :rtype:             Dictionary of symbol to price as a float (empty if the request failed)
+    '''
+    return save_prices(db_utils, fetch_prices(symbols), windows)
+
+
+def load_price_data(db_utils, window_size):
+    price_data = db_utils.read_price_array(window_size)['price']
+    if len(price_data) == window_size:
+        return price_data
+    else:
+        #logger("[load_price_data] Insufficient data.")
+        raise ValueError("Insufficient data.")
+
+
+def get_sma(data):
+    return (sum(data) / len(data))
+
+
+def get_bsh(price, upper_band, lower_band):
+    if float(price) <= float(lower_band):
+        return "BUY"
+    elif float(price) >= float(upper_band):
+        return "SELL"
+    else:
+        return "HOLD"
+
+
+def make_advice(db_utils, data, k=2):
+    sma = get_sma(data)
+    standard_deviation = np.std(data)
+    data_dict = {
+        'price': data[0],
+        'sma': sma,
+        'standard_deviation': standard_deviation,
+        'upper_band': sma + (standard_deviation * k),
+        'lower_band': sma - (standard_deviation * k)
+    }
+    return record_advice(db_utils, data_dict)
+
+
+def make_rolling_advice(db_utils, bollinger):
+    if not bollinger.is_ready():
+        raise ValueError("Insufficient data.")
+    return record_advice(db_utils, bollinger.bands(), symbol=bollinger.symbol)
+
+
+def make_strategy_advice(db_utils, strategy):
+    '''
+    Records the advice of a strategy (see strategies.py) for its symbol.
+
+    :param db_utils:    Where the advice is saved (see `save_prices()`)
+    :param strategy:    Strategy whose feed already has the latest price
+    :rtype:             The new advice, as a dictionary
+    '''
+    return record_advice(db_utils, strategy.advise(), symbol=strategy.symbol)
+
+
+def get_candle_bands(db_utils, periods, interval='1h', k=2, symbol=storage.DEFAULT_SYMBOL):
+    '''
+    Computes Bollinger bands over the last n candles from their stored sums, so a 30-day window reads 720 hourly rows instead of 86,400 prices.
+    The newest candle is the one still filling up. Returns the same dictionary as `RollingBollinger.bands()`.
+
+    :param db_utils:    Where the candles are read from (see `save_prices()`)
+    :param periods:     Number of candles in the window, as an integer
+    :param interval:    '1m', '1h' or '1d', as a string
+    :param k:           Width of the bands in standard deviations, as a float
+    :param symbol:      Trading pair, as a string
+    :rtype:             Dictionary
+    '''
+    candles = db_utils.read_candles(interval, periods, columns=('close', 'count', 'sum', 'sum_sq'), symbol=symbol)
+    if len(candles['close']) < periods:
+        raise ValueError("Insufficient data.")
+    count = candles['count'].sum()
+    sma = candles['sum'].sum() / count
+    standard_deviation = math.sqrt(max(candles['sum_sq'].sum() / count - sma * sma, 0.0))
+    return {
+        'price': float(candles['close'][0]),
+        'sma': float(sma),
+        'standard_deviation': standard_deviation,
+        'upper_band': float(sma + (standard_deviation * k)),
+        'lower_band': float(sma - (standard_deviation * k))
+    }
+
+
+def record_advice(db_utils, data_dict, symbol=storage.DEFAULT_SYMBOL):
+    # Strategies decide the advice themselves; otherwise it comes from the price and the bands
+    if 'advice' not in data_dict:
+        data_dict['advice'] = get_bsh(
+            price=data_dict['price'],
+            upper_band=data_dict['upper_band'],
+            lower_band=data_dict['lower_band']
+        )
+    return db_utils.create_advice(
+        price=data_dict['price'],
+        sma=data_dict['sma'],
+        standard_deviation=data_dict['standard_deviation'],
+        upper_band=data_dict['upper_band'],
+        lower_band=data_dict['lower_band'],
+        advice=data_dict['advice'],
+        symbol=symbol
+    )[0]
+
+
+class PriceWindow:
+    '''
+    Preallocated float64 ring buffer of the last n BTC prices, with timestamps alongside.
+    Every value is written twice (at i and i + capacity), so the current window is always one contiguous slice
+    and `prices()` can hand out a zero-copy view instead of building a list.
+
+    :param capacity:    Maximum number of prices held, as an integer
+    '''
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._prices = np.zeros(2 * self.capacity, dtype=np.float64)
+        self._timestamps = np.zeros(2 * self.capacity, dtype='datetime64[ms]')
+        self._head = -1     # Index of the newest price, in [0, capacity)
+        self.size = 0
+
+    @classmethod
+    def from_database(cls, db_utils, capacity, symbol=storage.DEFAULT_SYMBOL):
+        '''
+        Builds a window warm-loaded with the last n prices of a symbol in the Price table. Used once at startup.
+        '''
+        window = cls(capacity)
+        data = db_utils.read_price_array(capacity, columns=('price', 'timestamp'), order='asc', symbol=symbol)
+        window.extend(data['price'], data['timestamp'])
+        return window
+
+    def __len__(self):
+        return self.size
+
+    def is_full(self):
+        return self.size == self.capacity
+
+    def push(self, price, timestamp=None):
+        '''
+        Appends a price, overwriting the oldest one once the buffer is full.
+
+        :param price:       BTC price, as a float
+        :param timestamp:   When the price was recorded, as a numpy.datetime64 (defaults to now)
+        :rtype:             The evicted price as a float, or None if nothing was evicted
+        '''
+        if timestamp is None:
+            timestamp = np.datetime64(storage.now_ms(), 'ms')
+        evicted = None
+        self._head = (self._head + 1) % self.capacity
+        if self.size == self.capacity:
+            evicted = float(self._prices[self._head])
+        else:
+            self.size += 1
+        self._prices[self._head] = self._prices[self._head + self.capacity] = price
+        self._timestamps[self._head] = self._timestamps[self._head + self.capacity] = timestamp
+        return evicted
+
+    def extend(self, prices, timestamps):
+        '''
+        Appends many prices at once, in chronological order. Used to warm-load the window.
+
+        :param prices:      BTC prices, as a numpy.ndarray
+        :param timestamps:  When the prices were recorded, as a numpy.ndarray of datetime64
+        '''
+        prices = np.asarray(prices, dtype=np.float64)[-self.capacity:]
+        timestamps = np.asarray(timestamps, dtype='datetime64[ms]')[-self.capacity:]
+        if len(prices) == 0:
+            return
+        index = (self._head + 1 + np.arange(len(prices))) % self.capacity
+        self._prices[index] = self._prices[index + self.capacity] = prices
+        self._timestamps[index] = self._timestamps[index + self.capacity] = timestamps
+        self._head = int(index[-1])
+        self.size = min(self.size + len(prices), self.capacity)
+
+    def _slice(self, n):
+        n = self.size if n is None else min(int(n), self.size)
+        end = self._head + 1 + self.capacity
+        return slice(end - n, end)
+
+    def prices(self, n=None):
+        '''
+        Returns the last n prices, in reverse chronological order (newest is first), as a read-only view.
+
+        :param n:   Number of prices, as an integer (defaults to the whole window)
+        :rtype:     numpy.ndarray
+        '''
+        view = self._prices[self._slice(n)][::-1]
+        view.flags.writeable = False
+        return view
+
+    def timestamps(self, n=None):
+        '''
+        Returns the timestamps of the last n prices, in reverse chronological order (newest is first), as a read-only view.
+
+        :rtype:     numpy.ndarray
+        '''
+        view = self._timestamps[self._slice(n)][::-1]
+        view.flags.writeable = False
+        return view
+
+    def latest(self):
+        return float(self._prices[self._head])
+
+
+class RollingBollinger:
+    '''
+    Rolling window of BTC prices that keeps a running mean and sum of squared deviations (Welford),
+    so the SMA and standard deviation are updated in O(1) per new price instead of recomputed over the whole window.
+
+    :param window_size:     Number of prices in the window, as an integer
+    :param k:               Width of the bands in standard deviations, as a float
+    :param window:          PriceWindow to keep the prices in (defaults to a new, empty one)
+    :param symbol:          Trading pair the prices are for, as a string
+    '''
+    def __init__(self, window_size, k=2, window=None, symbol=storage.DEFAULT_SYMBOL):
+        self.window_size = int(window_size)
+        self.k = k
+        self.symbol = symbol
+        self.window = PriceWindow(self.window_size) if window is None else window
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.pushes_since_resync = 0
+        if len(self.window):
+            self.resync()
+
+    @classmethod
+    def from_database(cls, db_utils, window_size, k=2, symbol=storage.DEFAULT_SYMBOL):
+        '''
+        Builds a window warm-loaded with the last n prices of a symbol in the Price table. Used once at startup.
+        '''
+        return cls(window_size, k, window=PriceWindow.from_database(db_utils, window_size, symbol), symbol=symbol)
+
+    def warm(self, data):
+        '''
+        Pushes historical prices into the window.
+
+        :param data:    Prices in reverse chronological order (newest is first), as from `load_price_data()`
+        '''
+        for price in reversed(data):
+            self.push(price)
+
+    def extend(self, prices, timestamps):
+        '''
+        Adds many prices to the window at once, in chronological order, then recomputes the mean and deviation. Used to warm up.
+
+        :param prices:      BTC prices, as a numpy.ndarray
+        :param timestamps:  When the prices were recorded, as a numpy.ndarray of datetime64
+        '''
+        self.window.extend(prices, timestamps)
+        self.resync()
+
+    def push(self, price, timestamp=None):
+        '''
+        Adds a new price to the window, evicting the oldest one once the window is full.
+
+        :param price:       BTC price, as a float
+        :param timestamp:   When the price was recorded, as a numpy.datetime64 (defaults to now)
+        '''
+        price = float(price)
+        old = self.window.push(price, timestamp)
+        if old is not None:
+            new_mean = self.mean + (price - old) / self.window_size
+            self.m2 += (price - old) * (price - new_mean + old - self.mean)
+            self.mean = new_mean
+        else:
+            delta = price - self.mean
+            self.mean += delta / len(self.window)
+            self.m2 += delta * (price - self.mean)
+
+        # Recompute exactly once per window to stop rounding error from accumulating (amortised O(1))
+        self.pushes_since_resync += 1
+        if self.pushes_since_resync >= self.window_size:
+            self.resync()
+
+    def resync(self):
+        data = self.window.prices()
+        self.mean = float(data.mean()) if len(data) else 0.0
+        self.m2 = float(((data - self.mean) ** 2).sum())
+        self.pushes_since_resync = 0
+
+    def is_ready(self):
+        return self.window.is_full()
+
+    def prices(self):
+        return self.window.prices()
+
+    def bands(self):
+        '''
+        Returns the current price, SMA, standard deviation and Bollinger bands, same as `make_advice()` computes them.
+
+        :rtype:     Dictionary
+        '''
+        standard_deviation = math.sqrt(max(self.m2, 0.0) / len(self.window))
+        return {
+            'price': self.window.latest(),
+            'sma': self.mean,
+            'standard_deviation': standard_deviation,
+            'upper_band': self.mean + (standard_deviation * self.k),
+            'lower_band': self.mean - (standard_deviation * self.k)
+        }
+
+
+class Ledger:
+    '''
+    Write-through cache of one symbol's account: the current balance and the last trade (the open position, if it has not been sold).
+    Loaded from the Account and Trade tables once; after that every write goes to the database and updates the cache,
+    so `buy()` and `sell()` decide without reading. All account and trade writes for the symbol must go through it while it is in use.
+
+    :param db_utils:    Where the entries are written (see `save_prices()`)
+    :param symbol:      Trading pair, as a string
+    :param balance:     Current balance, as a float (None if the account was never seeded)
+    :param last_trade:  Last trade, as a dictionary (None if there is none)
+    '''
+    def __init__(self, db_utils, symbol=storage.DEFAULT_SYMBOL, balance=None, last_trade=None):
+        self.db_utils = db_utils
+        self.symbol = symbol
+        self.balance = balance
+        self.last_trade = last_trade
+
+    @classmethod
+    def from_database(cls, db_utils, symbol=storage.DEFAULT_SYMBOL):
+        '''
+        Builds a ledger from the newest Account and Trade entries of a symbol. Used once at startup.
+        '''
+        funds = db_utils.read_account_balances(1, symbol=symbol)
+        last_trade = db_utils.read_last_trade(symbol=symbol)
+        return cls(db_utils, symbol, funds[0]['balance'] if funds else None, last_trade[0] if last_trade else None)
+
+    @property
+    def open_trade(self):
+        if self.last_trade is None or self.last_trade['sell_advice_id']:
+            return None
+        return self.last_trade
+
+    def record_buy(self, amount, buy_advice_id, buy_price):
+        '''
+        Creates a buy entry in the Trade table and empties the balance.
+
+        :param amount:          How much money did we spend on this buy, as a float?
+        :param buy_advice_id:   What is the primary key of the Advice that prompted this buy, as an integer?
+        :param buy_price:       What price did we buy at, as a float?
+        :rtype:                 The new entry, as a list of dictionaries (same as `db_utils.create_buy()`)
+        '''
+        last_trade = self.db_utils.create_buy(
+            amount=amount,
+            buy_advice_id=buy_advice_id,
+            buy_price=buy_price,
+            symbol=self.symbol
+        )
+        self.db_utils.update_funds(
+            trade_id=last_trade[0]['id'],
+            amount=0.0,
+            symbol=self.symbol
+        )
+        self.last_trade = last_trade[0]
+        self.balance = 0.0
+        return last_trade
+
+    def record_sell(self, sell_advice_id, sell_price, profit_multiplier, amount):
+        '''
+        Closes the open trade with a sell entry and sets the balance to the proceeds.
+
+        :param sell_advice_id:      What is the primary key of the Advice that prompted this sell, as an integer?
+        :param sell_price:          How much did we sell at, as a float?
+        :param profit_multiplier:   (Sell price) / (Buy price), as a float.
+        :param amount:              What is the new amount of money in the account, as a float?
+        :rtype:                     The updated entry, as a list of dictionaries (same as `db_utils.create_sell()`)
+        '''
+        last_trade = self.db_utils.create_sell(
+            trade_id=self.open_trade['id'],
+            sell_advice_id=sell_advice_id,
+            sell_price=sell_price,
+            profit_multiplier=profit_multiplier
+        )
+        self.db_utils.update_funds(
+            trade_id=last_trade[0]['id'],
+            amount=amount,
+            symbol=self.symbol
+        )
+        self.last_trade = last_trade[0]
+        self.balance = amount
+        return last_trade
+
+
+def buy(db_utils, buy_advice_dict, ledger=None):
+    symbol = buy_advice_dict.get('symbol', storage.DEFAULT_SYMBOL)
+    # Without a ledger the account is read from the database
+    if ledger is None:
+        ledger = Ledger.from_database(db_utils, symbol)
+    print(f"Funds: {ledger.balance}")
+
+    #if ledger.balance is None:
+        #logger("[buy] Run `create_seed_funds()` function! No money in the account.")
+        #pass
+
+    if ledger.balance is None or ledger.balance == 0.0:
+        print("I'm not gonna buy anything!")
+        pass
+    else:
+        # ---BUY API FUNCTIONALITY HERE---
+        return ledger.record_buy(
+            amount=ledger.balance * 0.999, # Simulate Binance 0.1% fee
+            buy_advice_id=buy_advice_dict['id'],
+            buy_price=buy_advice_dict['price']
+        )
+
+
+def sell(db_utils, sell_advice_dict, desired_profit, ledger=None):
+    # If there is no open trade, pass
+    symbol = sell_advice_dict.get('symbol', storage.DEFAULT_SYMBOL)
+    if ledger is None:
+        ledger = Ledger.from_database(db_utils, symbol)
+    open_trade = ledger.open_trade
+    if open_trade is None:
+        pass
+    else:
+        # If the proposed sale price is less than or equal to buy price, pass
+        profit_multiplier = (float(sell_advice_dict['price']) / float(open_trade['buy_price']))
+        if profit_multiplier < float(desired_profit):
+            pass
+        else:
+            # ---SELL API FUNCTIONALITY HERE---
+            return ledger.record_sell(
+                sell_advice_id=sell_advice_dict['id'],
+                sell_price=sell_advice_dict['price'],
+                profit_multiplier=profit_multiplier,
+                amount=((profit_multiplier) * (open_trade['amount'])) * 0.999 # Simulate Binance 0.1% fee
+            )
+
+
+def purge(db_utils, older_than=528):
+    db_utils.purge_old_prices(older_than)
+    db_utils.purge_old_advices(older_than)
@@ -0,0 +1,180 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+
+# JSON lines, rotated once the file reaches LOG_MAX_BYTES; LOG_BACKUP_COUNT old files are kept (errors.log.1, errors.log.2, ...)
+# Only one process may write to a file: the pipeline's processes each write their own (errors.strategy.log, ..., see `use_stage_file()`)
+LOG_FILE = 'errors.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Records waiting for the writer thread; once it is full, new records are dropped (and counted) instead of waiting
+QUEUE_SIZE = 10000
+
+# At most RATE_LIMIT records with the same level, stage and message per RATE_WINDOW seconds
+RATE_LIMIT = 5
+RATE_WINDOW = 60.0
+
+# Legacy messages start with their stage: "[fetch_prices] Failed..."
+_STAGE_PREFIX = re.compile(r'\[(\w+)\] (.*)', re.DOTALL)
+
+
+class JSONFormatter(logging.Formatter):
+    '''
+    Formats a record as one JSON object per line: time (UTC), level, stage, message, then any extra fields (latency, suppressed, ...).
+    '''
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'stage': getattr(record, 'stage', None),
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, default=str)
+
+
+class RateLimiter(logging.Filter):
+    '''
+    Lets through at most `limit` records with the same level, stage and message per `window` seconds.
+    The first one let through after that carries the number that were held back, as the 'suppressed' field.
+
+    :param limit:   Records per window, as an integer
+    :param window:  Window length in seconds, as a float
+    :param clock:   Returns the time in seconds (defaults to `time.monotonic`)
+    '''
+    def __init__(self, limit=RATE_LIMIT, window=RATE_WINDOW, clock=time.monotonic):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self.suppressed = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.levelno, getattr(record, 'stage', None), record.msg)
+        now = self.clock()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state is not None and state[2]:
+                    record.fields['suppressed'] = state[2]
+                if len(self._windows) > 1024:
+                    # Forget keys whose window is over, so one-off messages do not pile up
+                    self._windows = {k: v for k, v in self._windows.items() if now - v[0] < self.window}
+                # Window start, records let through, records held back
+                state = self._windows[key] = [now, 0, 0]
+            if state[1] >= self.limit:
+                state[2] += 1
+                self.suppressed += 1
+                return False
+            state[1] += 1
+            return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Never waits: a full queue drops the record
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_logger = None
+_handler = None
+_listener = None
+_lock = threading.Lock()
+
+
+def start():
+    '''
+    Starts the writer thread with the current settings. Called by the first `write()`; call `stop()` first to apply new settings.
+    '''
+    global _logger, _handler, _listener
+    with _lock:
+        if _listener is not None:
+            return
+        records = queue.Queue(QUEUE_SIZE)
+        file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
+        file_handler.setFormatter(JSONFormatter())
+        _handler = _QueueHandler(records)
+        # Not attached to the logging hierarchy, so other libraries' logging settings do not apply
+        _logger = logging.Logger('stonks', logging.DEBUG)
+        _logger.addFilter(RateLimiter(RATE_LIMIT, RATE_WINDOW))
+        _logger.addHandler(_handler)
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+
+
+def stop():
+    '''
+    Writes out everything queued, closes the file and stops the writer thread. Runs automatically at exit.
+    '''
+    global _logger, _handler, _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _logger = _handler = _listener = None
+
+
+atexit.register(stop)
+
+
+def use_stage_file(stage):
+    '''
+    Switches this process to a log file of its own next to LOG_FILE, e.g. errors.strategy.log, so processes never rotate each other's file.
+    Records already queued are written to the old file first.
+
+    :param stage:   Name of the process, as a string
+    '''
+    global LOG_FILE
+    stop()
+    root, extension = os.path.splitext(LOG_FILE)
+    LOG_FILE = f"{root}.{stage}{extension}"
+
+
+def dropped():
+    '''
+    :rtype: Number of records dropped since `start()` because the queue was full, as an integer
+    '''
+    return _handler.dropped if _handler is not None else 0
+
+
+def write(message, level='error', stage=None, latency=None, **fields):
+    '''
+    Queues a structured log record for the writer thread; the caller never waits for the disk.
+
+    :param message:     What happened, as a string. "[stage] message" sets the stage when `stage` is not given
+    :param level:       'debug', 'info', 'warning', 'error' or 'critical', as a string
+    :param stage:       Part of the pipeline the record is about (e.g. 'fetch_prices'), as a string
+    :param latency:     How long the stage took or waited, in seconds, as a float
+    :param fields:      Further fields for the JSON line
+    '''
+    if _listener is None:
+        start()
+    if stage is None:
+        match = _STAGE_PREFIX.fullmatch(message)
+        if match:
+            stage, message = match.groups()
+    if latency is not None:
+        fields['latency'] = latency
+    logger = _logger
+    if logger is not None:
+        logger.log(logging.getLevelName(level.upper()), message, extra={'stage': stage, 'fields': fields})
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import unittest
+import logging
+import log
+
+
+class LogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings = (log.LOG_FILE, log.LOG_MAX_BYTES, log.RATE_LIMIT)
+        log.stop()
+        log.LOG_FILE = os.path.join(self.directory.name, "errors.log")
+
+    def tearDown(self):
+        log.stop()
+        log.LOG_FILE, log.LOG_MAX_BYTES, log.RATE_LIMIT = self.settings
+
+    def read(self, path=None):
+        with open(path or log.LOG_FILE) as f:
+            return [json.loads(x) for x in f]
+
+    def test_log(self):
+        log.write("[fetch_prices] Failed. Error message: timeout")
+        log.write("Late.", level='warning', stage='main', latency=1.25, skipped=2)
+        log.stop()
+        first, second = self.read()
+        self.assertEqual((first['level'], first['stage'], first['message']), ('error', 'fetch_prices', "Failed. Error message: timeout"))
+        self.assertTrue(first['time'].endswith('+00:00'))
+        self.assertEqual((second['level'], second['stage'], second['latency'], second['skipped']), ('warning', 'main', 1.25, 2))
+
+    def test_rate_limit(self):
+        now = [0.0]
+        limiter = log.RateLimiter(limit=2, window=60.0, clock=lambda: now[0])
+        record = lambda message: logging.LogRecord('stonks', logging.ERROR, '', 0, message, None, None)
+        results = []
+        for message in ["down"] * 5 + ["other"]:
+            r = record(message)
+            r.fields = {}
+            results.append(limiter.filter(r))
+        self.assertEqual(results, [True, True, False, False, False, True])
+        now[0] = 61.0
+        r = record("down")
+        r.fields = {}
+        self.assertTrue(limiter.filter(r))
+        self.assertEqual(r.fields, {'suppressed': 3})
+        self.assertEqual(limiter.suppressed, 3)
+
+    def test_rotation(self):
+        log.LOG_MAX_BYTES = 2000
+        log.RATE_LIMIT = 1000
+        for i in range(100):
+            log.write(f"Failed {i}.", stage='main')
+        self.assertEqual(log.dropped(), 0)
+        log.stop()
+        lines = self.read(log.LOG_FILE + ".1") + self.read()
+        self.assertLessEqual(os.path.getsize(log.LOG_FILE), 2000)
+        self.assertEqual(lines[-1]['message'], "Failed 99.")
+
+    def test_stage_file(self):
+        log.write("Before.", stage='main')
+        log.use_stage_file('strategy')
+        log.write("After.", stage='strategy')
+        log.stop()
+        self.assertEqual(log.LOG_FILE, os.path.join(self.directory.name, "errors.strategy.log"))
+        self.assertEqual([x['message'] for x in self.read()], ["After."])
+        self.assertEqual([x['message'] for x in self.read(os.path.join(self.directory.name, "errors.log"))], ["Before."])
+
+
+if __name__ == '__main__':
+    unittest.main()
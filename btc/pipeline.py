@@ -0,0 +1,377 @@
+import contextlib
+import importlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import storage
+import funcs
+import log
+
+# One slot of the price ring: index into the symbol list, price, timestamp in epoch milliseconds, request latency in seconds
+RING_DTYPE = np.dtype([('symbol', np.int32), ('price', np.float64), ('timestamp', np.int64), ('latency', np.float64)])
+
+# Storage methods that write; everything else is a read and is answered from memory
+WRITES = (
+    'create_price', 'create_prices', 'rebuild_candles', 'create_advice', 'create_advices', 'create_buy', 'create_sell',
+    'create_seed_funds', 'update_funds', 'purge_old_prices', 'purge_old_advices'
+)
+
+
+def _start_stage(name, core, setup):
+    # Ctrl-C is for the parent, which stops the stages in order so nothing queued is lost
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log.use_stage_file(name)
+    # Keep each stage on its own core where the OS allows it (Linux); elsewhere the scheduler decides
+    if core is not None and hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cores[core % len(cores)]})
+    if setup is not None:
+        setup(name)
+
+
+def _configure(settings):
+    # Spawned processes import the storage module afresh, so it is pointed at the parent's database; returns the module
+    name, storage_settings = settings
+    module = importlib.import_module(name)
+    module.use_storage(storage.SQLiteStorage(*storage_settings))
+    return module
+
+
+class PriceRing:
+    '''
+    Single-producer, single-consumer ring buffer of price quotes in shared memory. The writer never waits:
+    a reader that falls more than `capacity` quotes behind loses the oldest ones, and counts them in `dropped`.
+    Pass it to a `multiprocessing` process to use it there; only the process that created it unlinks the memory.
+
+    :param symbols:     Trading pairs that may be written, as a list of strings
+    :param capacity:    Number of quotes held, as an integer
+    '''
+    def __init__(self, symbols, capacity=1024):
+        self.symbols = list(symbols)
+        self.capacity = int(capacity)
+        self._shm = shared_memory.SharedMemory(create=True, size=8 + self.capacity * RING_DTYPE.itemsize)
+        self._owner = True
+        self._ready = multiprocessing.get_context('spawn').Semaphore(0)
+        self._attach()
+
+    def _attach(self):
+        # Quotes written so far, then the slots
+        self._count = np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf)
+        self._slots = np.ndarray((self.capacity,), dtype=RING_DTYPE, buffer=self._shm.buf, offset=8)
+        self._index = {x: i for i, x in enumerate(self.symbols)}
+        self.read_count = 0
+        self.dropped = 0
+
+    def __getstate__(self):
+        return {'symbols': self.symbols, 'capacity': self.capacity, 'name': self._shm.name, 'ready': self._ready}
+
+    def __setstate__(self, state):
+        self.symbols = state['symbols']
+        self.capacity = state['capacity']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+        self._ready = state['ready']
+        self._attach()
+
+    def write(self, quote):
+        '''
+        Appends a quote, overwriting the oldest one once the ring is full.
+
+        :param quote:   PriceQuote
+        '''
+        count = int(self._count[0])
+        self._slots[count % self.capacity] = (self._index[quote.symbol], quote.price, quote.timestamp, quote.latency)
+        # Published only once the slot is complete
+        self._count[0] = count + 1
+        self._ready.release()
+
+    def read(self, timeout=None):
+        '''
+        Returns the quotes written since the last read, oldest first, waiting up to `timeout` seconds for one to arrive.
+
+        :param timeout: Seconds to wait, as a float (None waits forever)
+        :rtype:         List of PriceQuote (empty on timeout)
+        '''
+        self._ready.acquire(timeout=timeout)
+        count = int(self._count[0])
+        start = max(self.read_count, count - self.capacity)
+        if start == count:
+            return []
+        rows = self._slots[np.arange(start, count) % self.capacity]
+        # Slots the writer reused while they were being copied are torn, so they are dropped too
+        valid = max(start, int(self._count[0]) - self.capacity)
+        self.dropped += valid - self.read_count
+        self.read_count = count
+        return [
+            funcs.PriceQuote(self.symbols[symbol], price, timestamp, latency)
+            for symbol, price, timestamp, latency in rows[valid - start:].tolist()
+        ]
+
+    def close(self):
+        self._count = self._slots = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class QueueStorage:
+    '''
+    Storage wrapper that answers everything from another storage (normally a MemoryStorage) and also sends every write to a queue,
+    one message per transaction, for a persistence process to apply to the database with `apply()`.
+    Each write is sent with the time it was made, so the database gets the same timestamps.
+
+    :param storage: Storage that reads and writes are made on, as a MemoryStorage
+    :param writes:  Queue to send the writes to, as a multiprocessing.Queue
+    '''
+    def __init__(self, storage, writes):
+        self.storage = storage
+        self.writes = writes
+        self._local = threading.local()
+        for name in WRITES:
+            setattr(self, name, self._recorded(name))
+
+    def __repr__(self):
+        return f"QueueStorage({self.storage!r})"
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def _recorded(self, name):
+        method = getattr(self.storage, name)
+
+        def write(*args, **kwargs):
+            # Iterators are read once, so the rows are kept for the queue
+            args = tuple(list(x) if hasattr(x, '__next__') else x for x in args)
+            result = method(*args, **kwargs)
+            call = (storage.clock(), name, args, kwargs)
+            pending = getattr(self._local, 'pending', None)
+            if pending is None:
+                self.writes.put([call])
+            else:
+                pending.append(call)
+            return result
+        return write
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Same as the wrapped storage's `transaction()`; the block's writes are sent once it commits, and never if it rolls back.
+        '''
+        if getattr(self._local, 'pending', None) is not None:
+            with self.storage.transaction():
+                yield self
+            return
+        pending = self._local.pending = []
+        try:
+            with self.storage.transaction():
+                yield self
+        finally:
+            self._local.pending = None
+        if pending:
+            self.writes.put(pending)
+
+
+def apply(batches, db_utils):
+    '''
+    Applies batches of writes sent by a QueueStorage, in one transaction, each at the time it was made.
+
+    :param batches:     Lists of writes, as a list
+    :param db_utils:    Where to apply them: a storage (see storage.py), or a module of storage functions such as demo_db_utils
+    '''
+    made_at = [storage.clock()]
+    previous = storage.set_clock(lambda: made_at[0])
+    try:
+        with db_utils.transaction():
+            for batch in batches:
+                for made_at[0], name, args, kwargs in batch:
+                    getattr(db_utils, name)(*args, **kwargs)
+    finally:
+        storage.set_clock(previous)
+
+
+def run_fetcher(ring, stop, symbols, interval=30.0, fetch=None, core=None, setup=None):
+    '''
+    Fetcher process: fetches prices every `interval` seconds and writes them to the ring. Never touches the database.
+    '''
+    _start_stage('fetcher', core, setup)
+    fetch = funcs.fetch_prices if fetch is None else fetch
+    while not stop.is_set():
+        started = time.monotonic()
+        for quote in fetch(symbols).values():
+            ring.write(quote)
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+    ring.close()
+
+
+def run_strategy(ring, writes, stop, settings, process, symbols, window_size=57600, kwargs=None, purge_interval=30.0, core=None, setup=None):
+    '''
+    Strategy process: loads the newest state from the database once, then runs `process()` on every quote from the ring
+    against memory. Writes go to the persistence process through `writes`, so the strategy never waits for the disk.
+    '''
+    _start_stage('strategy', core, setup)
+    module = _configure(settings)
+    memory = storage.MemoryStorage.from_storage(module.get_storage(), symbols, window_size)
+    module.close_connections()
+    module.use_storage(QueueStorage(memory, writes))
+    kwargs = {} if kwargs is None else kwargs
+    next_purge = time.monotonic() + purge_interval
+    try:
+        while not stop.is_set():
+            for quote in ring.read(timeout=0.1):
+                try:
+                    process({quote.symbol: quote}, window_size, symbols=[quote.symbol], **kwargs)
+                except Exception as e:
+                    funcs.logger(f"Failed. Error message: {e!r}", stage='strategy')
+            if time.monotonic() >= next_purge:
+                # Keeps memory bounded; the purge is sent on to the database like any other write
+                module.purge_old_prices()
+                module.purge_old_advices()
+                next_purge = time.monotonic() + purge_interval
+    finally:
+        if ring.dropped:
+            funcs.logger(f"Fell behind and dropped {ring.dropped} prices.", level='warning', stage='strategy')
+        ring.close()
+
+
+def run_persistence(writes, settings, batch_size=256, core=None, setup=None, retries=3, backoff=0.5):
+    '''
+    Persistence process: applies the writes from the strategy process, taking everything queued (up to `batch_size` transactions)
+    into one commit. Stops at a None message, once everything before it is saved.
+    A commit that fails is retried `retries` times, `backoff` seconds apart and doubling. If it still fails the process exits with an error,
+    since the strategy has already handed out ids for those rows and the database would drift from it (`Pipeline.join()` then stops the rest).
+    '''
+    _start_stage('persistence', core, setup)
+    module = _configure(settings)
+    running = True
+    while running:
+        batches = [writes.get()]
+        while len(batches) < batch_size:
+            try:
+                batches.append(writes.get_nowait())
+            except queue.Empty:
+                break
+        if None in batches:
+            running = False
+            batches = batches[:batches.index(None)]
+        for attempt in range(retries + 1):
+            try:
+                apply(batches, module)
+                break
+            except Exception as e:
+                if attempt == retries:
+                    funcs.logger(f"Failed to save {len(batches)} batches, stopping. Error message: {e!r}", level='critical', stage='persistence')
+                    module.close_connections()
+                    raise
+                funcs.logger(f"Failed to save {len(batches)} batches, retrying. Error message: {e!r}", level='warning', stage='persistence')
+                time.sleep(backoff * 2 ** attempt)
+    module.close_connections()
+
+
+class Pipeline:
+    '''
+    Runs fetching, strategy and persistence in three processes, each pinned to its own core where possible:
+    the fetcher writes prices to a shared-memory PriceRing, the strategy process runs `process()` on them in memory,
+    and the persistence process batches every write into the database.
+
+    :param process:         Called as `process(quotes, window_size, symbols=[symbol], **kwargs)` for every quote, e.g. `demo_main.process`
+                            (must be importable by name, since the processes are spawned)
+    :param symbols:         Trading pairs, as a list of strings
+    :param db_utils:        Module of storage functions that `process()` uses, e.g. demo_db_utils, whose storage must be a SQLiteStorage
+                            on a database file (not ':memory:'), since each process opens it on its own
+    :param window_size:     Number of prices the strategy needs, loaded from the database at startup, as an integer
+    :param kwargs:          Further keyword arguments for `process()`, as a dictionary
+    :param interval:        Seconds between fetches, as a float
+    :param fetch:           Called as `fetch(symbols)` to get a dictionary of PriceQuote (defaults to `funcs.fetch_prices`)
+    :param capacity:        Number of quotes the ring holds, as an integer
+    :param batch_size:      Most transactions saved in one commit, as an integer
+    :param purge_interval:  Seconds between purges, as a float
+    :param pin:             Whether to pin each process to its own core, as a boolean
+    :param setup:           Called as `setup(name)` first in each process ('fetcher', 'strategy' or 'persistence'), e.g. to turn on metrics there
+                            (optional, must be importable by name)
+    '''
+    def __init__(self, process, symbols, db_utils, window_size=57600, kwargs=None, interval=30.0, fetch=None,
+                 capacity=1024, batch_size=256, purge_interval=30.0, pin=True, setup=None):
+        self.process = process
+        self.db_utils = db_utils
+        self.symbols = list(symbols)
+        self.window_size = window_size
+        self.kwargs = kwargs
+        self.interval = interval
+        self.fetch = fetch
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.purge_interval = purge_interval
+        self.pin = pin
+        self.setup = setup
+        self.processes = []
+        self._context = multiprocessing.get_context('spawn')
+        self._ring = None
+
+    def start(self):
+        backend = self.db_utils.get_storage()
+        # Every process opens the database on its own, so they only share data through a file
+        if not isinstance(backend, storage.SQLiteStorage) or backend.database == ":memory:":
+            raise ValueError(f"The pipeline needs a SQLite database file, not {backend!r}")
+        settings = (self.db_utils.__name__, (backend.database, backend.price_backend, backend.price_log_directory, backend.advice_mode))
+        core = (lambda i: i) if self.pin else (lambda i: None)
+        self._ring = PriceRing(self.symbols, self.capacity)
+        self._stop = self._context.Event()
+        self._writes = self._context.Queue()
+        self.processes = [
+            self._context.Process(target=run_persistence, args=(self._writes, settings, self.batch_size, core(2), self.setup), name='persistence'),
+            self._context.Process(
+                target=run_strategy, name='strategy',
+                args=(
+                    self._ring, self._writes, self._stop, settings, self.process, self.symbols, self.window_size, self.kwargs,
+                    self.purge_interval, core(1), self.setup
+                )
+            ),
+            self._context.Process(
+                target=run_fetcher, args=(self._ring, self._stop, self.symbols, self.interval, self.fetch, core(0), self.setup), name='fetcher'
+            )
+        ]
+        for process in self.processes:
+            process.start()
+
+    def stop(self, timeout=30.0):
+        # Fetcher and strategy stop first, then the persistence process saves what they sent and exits
+        if self._ring is None:
+            return
+        self._stop.set()
+        for process in self.processes[:0:-1]:
+            process.join(timeout)
+        self._writes.put(None)
+        self.processes[0].join(timeout)
+        self._ring.close()
+        self._ring = None
+
+    def join(self, timeout=None):
+        '''
+        Waits while the processes run. They only exit by themselves when one of them failed (or was killed);
+        the others are then stopped, and a RuntimeError says which exited.
+
+        :param timeout: Seconds to wait, as a float (None waits until a process exits)
+        '''
+        if self._ring is None:
+            return
+        ready = multiprocessing.connection.wait([x.sentinel for x in self.processes], timeout)
+        exited = [x for x in self.processes if x.sentinel in ready]
+        for process in exited:
+            # The sentinel is ready as the process exits, a moment before its exit code is
+            process.join()
+        if exited:
+            self.stop()
+            raise RuntimeError("Pipeline stopped: " + ", ".join(f"{x.name} exited with code {x.exitcode}" for x in exited))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
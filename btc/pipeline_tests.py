@@ -0,0 +1,151 @@
+import math
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+import unittest
+import storage
+import demo_db_utils
+import demo_main
+from pipeline import *
+
+TICKS = 60
+START = int(time.time() * 1000)
+fetched = 0
+
+
+def fetch_sine(symbols):
+    # Runs in the fetcher process: TICKS prices on a sine wave, then nothing
+    global fetched
+    fetched += 1
+    if fetched > TICKS:
+        return {}
+    price = 30000.0 + 1000.0 * math.sin(fetched / 5)
+    return {x: funcs.PriceQuote(x, price, START + 1000 * fetched, 0.0) for x in symbols}
+
+
+def crash_strategy(name):
+    # Runs first in every stage process
+    if name == 'strategy':
+        raise RuntimeError("Strategy crashed")
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def test_ring(self):
+        ring = PriceRing(['BTCUSDT', 'ETHUSDT'], capacity=4)
+        self.addCleanup(ring.close)
+        self.assertEqual(ring.read(timeout=0), [])
+        ring.write(funcs.PriceQuote('ETHUSDT', 10.0, 1000, 0.5))
+        self.assertEqual(ring.read(timeout=0), [funcs.PriceQuote('ETHUSDT', 10.0, 1000, 0.5)])
+        for i in range(6):
+            ring.write(funcs.PriceQuote('BTCUSDT', float(i), i, 0.0))
+        # The reader fell behind, so the two oldest were overwritten
+        self.assertEqual([x.price for x in ring.read(timeout=0)], [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(ring.dropped, 2)
+
+    def test_queue_storage(self):
+        writes = queue.Queue()
+        recorded = QueueStorage(storage.MemoryStorage(), writes)
+        recorded.create_seed_funds(200.0)
+        with recorded.transaction():
+            recorded.create_prices(iter([(1.0, 1000), (2.0, 2000)]))
+            advice = recorded.create_advice(2.0, 1.0, 1.0, 2.0, 0.0, 'BUY')[0]
+            recorded.create_buy(199.8, advice['id'], 2.0)
+        with self.assertRaises(RuntimeError):
+            with recorded.transaction():
+                recorded.create_price(3.0, 3000)
+                raise RuntimeError()
+        self.assertEqual(recorded.count_prices(), 2)
+        batches = [writes.get_nowait(), writes.get_nowait()]
+        self.assertTrue(writes.empty())
+        self.assertEqual([len(x) for x in batches], [1, 3])
+        # Applied elsewhere, the writes give the same rows
+        database = storage.SQLiteStorage(":memory:")
+        try:
+            database.create_database()
+            apply(batches, database)
+            self.assertEqual(database.count_prices(), 2)
+            self.assertEqual(database.read_last_trade(), recorded.read_last_trade())
+            self.assertEqual(database.read_last_advice(), recorded.read_last_advice())
+        finally:
+            database.close()
+
+    def test_storage(self):
+        # Each process opens the database itself, so one in memory (or not in SQLite) would leave every stage with its own empty copy
+        for backend in [storage.SQLiteStorage(":memory:"), storage.MemoryStorage()]:
+            previous = demo_db_utils.use_storage(backend)
+            try:
+                running = Pipeline(demo_main.process, ['BTCUSDT'], demo_db_utils, fetch=fetch_sine)
+                with self.assertRaises(ValueError):
+                    running.start()
+                self.assertEqual(running.processes, [])
+            finally:
+                demo_db_utils.use_storage(previous)
+
+    def test_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            database = storage.SQLiteStorage(os.path.join(directory, "pipeline.db"))
+            previous = demo_db_utils.use_storage(database)
+            try:
+                database.create_database()
+                database.create_seed_funds(200.0)
+                # Purged rows leave a gap, so ids only line up if the strategy process carries on the database's numbering
+                database.create_advices([(1.0, 1.0, 1.0, 2.0, 0.0, 'HOLD', 0)] * 3)
+                database.purge_old_advices()
+                database.close()
+                running = Pipeline(
+                    demo_main.process, ['BTCUSDT'], demo_db_utils, window_size=10, kwargs={'k': 1}, interval=0.01, fetch=fetch_sine,
+                    purge_interval=3600
+                )
+                running.start()
+                try:
+                    database_file = storage.SQLiteStorage(database.database)
+                    deadline = time.monotonic() + 60
+                    while database_file.count_prices() < TICKS and time.monotonic() < deadline:
+                        time.sleep(0.05)
+                    database_file.close()
+                finally:
+                    running.stop()
+                self.assertTrue(all(x.exitcode == 0 for x in running.processes))
+                self.assertEqual(database.count_prices(), TICKS)
+                trade = database.read_last_trade()[0]
+                self.assertGreater(trade['id'], 0)
+                advice = database.get_connection().execute("SELECT advice, price FROM advice WHERE id = ?", (trade['buy_advice_id'],)).fetchone()
+                self.assertEqual(advice, ('BUY', trade['buy_price']))
+                self.assertEqual(database.read_account_balances(1)[0]['trade_id'], trade['id'])
+            finally:
+                demo_db_utils.use_storage(previous)
+                database.close()
+
+    def test_failures(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # A commit that keeps failing (here there are no tables) stops the persistence process instead of being dropped
+            context = multiprocessing.get_context('spawn')
+            writes = context.Queue()
+            writes.put([(time.time(), 'create_price', (1.0, 1000), {})])
+            settings = ('demo_db_utils', (os.path.join(directory, "empty.db"), 'sqlite', "prices", 'full'))
+            persistence = context.Process(target=run_persistence, args=(writes, settings), kwargs={'retries': 1, 'backoff': 0.01})
+            persistence.start()
+            persistence.join(60)
+            self.assertEqual(persistence.exitcode, 1)
+            # A process that dies stops the pipeline, and join() says which one
+            database = storage.SQLiteStorage(os.path.join(directory, "pipeline.db"))
+            database.create_database()
+            previous = demo_db_utils.use_storage(database)
+            try:
+                running = Pipeline(demo_main.process, ['BTCUSDT'], demo_db_utils, interval=0.01, fetch=fetch_sine, setup=crash_strategy)
+                running.start()
+                self.addCleanup(running.stop)
+                with self.assertRaises(RuntimeError) as raised:
+                    running.join(60)
+                self.assertIn("strategy exited with code 1", str(raised.exception))
+                self.assertTrue(all(x.exitcode is not None for x in running.processes))
+            finally:
+                demo_db_utils.use_storage(previous)
+                database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
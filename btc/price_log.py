@@ -0,0 +1,172 @@
+import datetime
+import os
+import threading
+import numpy as np
+
+# One fixed-width record per price: sequence number, epoch milliseconds, price
+RECORD = np.dtype([('id', '<i8'), ('timestamp', '<i8'), ('price', '<f8')])
+
+DAY_MS = 86400 * 1000
+
+
+def _day(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp // 1000, datetime.UTC).strftime('%Y-%m-%d')
+
+
+def _day_start(day):
+    return int(datetime.datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=datetime.UTC).timestamp()) * 1000
+
+
+class PriceLog:
+    '''
+    Append-only price store for one symbol: one file of fixed-width records per UTC day (`<directory>/YYYY-MM-DD.bin`).
+    Reads memory-map the files, so the last n prices are a slice of the mapped file rather than a query,
+    and retention deletes whole day files. Prices must be appended in chronological order.
+
+    :param directory:   Folder holding the day files, created if missing, as a string
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._file = None
+        self._file_day = None
+        self.days = sorted(x[:-4] for x in os.listdir(directory) if x.endswith('.bin'))
+        self.counts = {day: os.path.getsize(self._path(day)) // RECORD.itemsize for day in self.days}
+        last = self.segment(self.days[-1]) if self.days else np.empty(0, RECORD)
+        self.next_id = int(last['id'][-1]) + 1 if len(last) else 1
+
+    def _path(self, day):
+        return os.path.join(self.directory, f"{day}.bin")
+
+    def _open(self, day):
+        if self._file is not None:
+            self._file.close()
+        path = self._path(day)
+        # A record torn by a crash is cut off so the file stays aligned
+        if os.path.exists(path):
+            os.truncate(path, self.counts.get(day, 0) * RECORD.itemsize)
+        self._file = open(path, 'ab', buffering=0)
+        self._file_day = day
+        if day not in self.counts:
+            self.counts[day] = 0
+            self.days = sorted(self.days + [day])
+
+    def append(self, prices, timestamps):
+        '''
+        Appends prices to their day files.
+
+        :param prices:      Prices, as a sequence of floats
+        :param timestamps:  Epoch milliseconds, as a sequence of integers
+        :rtype:             Sequence number of the last record written, as an integer
+        '''
+        with self._lock:
+            records = np.empty(len(prices), RECORD)
+            records['id'] = np.arange(self.next_id, self.next_id + len(records))
+            records['timestamp'] = timestamps
+            records['price'] = prices
+            days = (records['timestamp'] // DAY_MS).tolist()
+            start = 0
+            while start < len(records):
+                stop = start + 1
+                while stop < len(records) and days[stop] == days[start]:
+                    stop += 1
+                day = _day(int(records['timestamp'][start]))
+                if day != self._file_day:
+                    self._open(day)
+                self._file.write(records[start:stop].tobytes())
+                self.counts[day] += stop - start
+                start = stop
+            self.next_id += len(records)
+            return self.next_id - 1
+
+    def segment(self, day):
+        '''
+        Returns one day's records as a read-only memory-mapped array (remapped only when the file has grown).
+        '''
+        count = self.counts.get(day, 0)
+        cached = self._maps.get(day)
+        if cached is not None and len(cached) == count:
+            return cached
+        if count == 0:
+            return np.empty(0, RECORD)
+        mapped = np.memmap(self._path(day), dtype=RECORD, mode='r', shape=(count,))
+        self._maps[day] = mapped
+        return mapped
+
+    def last(self, n):
+        '''
+        Returns the newest n records in chronological order. A view of the mapped file when they fall in one day.
+
+        :param n:   Number of records, as an integer
+        :rtype:     numpy.ndarray of RECORD
+        '''
+        parts = []
+        remaining = int(n)
+        for day in reversed(self.days):
+            if remaining <= 0:
+                break
+            records = self.segment(day)
+            parts.append(records[max(0, len(records) - remaining):])
+            remaining -= len(parts[-1])
+        if not parts:
+            return np.empty(0, RECORD)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts[::-1])
+
+    def range(self, start, end):
+        '''
+        Returns the records with start <= timestamp < end in chronological order.
+
+        :param start:   Epoch milliseconds, as an integer
+        :param end:     Epoch milliseconds, as an integer
+        :rtype:         numpy.ndarray of RECORD
+        '''
+        parts = []
+        for day in self.days:
+            day_start = _day_start(day)
+            if day_start + DAY_MS <= start or day_start >= end:
+                continue
+            records = self.segment(day)
+            timestamps = records['timestamp']
+            parts.append(records[np.searchsorted(timestamps, start):np.searchsorted(timestamps, end)])
+        if not parts:
+            return np.empty(0, RECORD)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def purge(self, cutoff):
+        '''
+        Deletes every day file that ends at or before the cutoff. Prices in the day the cutoff falls in are kept.
+
+        :param cutoff:  Epoch milliseconds, as an integer
+        :rtype:         Number of records deleted, as an integer
+        '''
+        deleted = 0
+        with self._lock:
+            for day in list(self.days):
+                if _day_start(day) + DAY_MS > cutoff:
+                    break
+                if day == self._file_day:
+                    self._file.close()
+                    self._file = None
+                    self._file_day = None
+                os.remove(self._path(day))
+                self._maps.pop(day, None)
+                deleted += self.counts.pop(day)
+                self.days.remove(day)
+        return deleted
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self._file_day = None
+            self._maps.clear()
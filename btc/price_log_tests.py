@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from price_log import *
+
+
+class PriceLogTestCase(unittest.TestCase):
+
+    def test_append_and_read(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = PriceLog(directory)
+            day = 1704067200000 # 2024-01-01
+            self.assertEqual(len(log.last(5)), 0)
+            self.assertEqual(log.append([1.0, 2.0], [day - 1000, day]), 2)
+            self.assertEqual(log.append([3.0], [day + 1000]), 3)
+            log.append([4.0], [day + DAY_MS])
+            self.assertEqual(log.days, ['2023-12-31', '2024-01-01', '2024-01-02'])
+            self.assertEqual(sorted(os.listdir(directory)), ['2023-12-31.bin', '2024-01-01.bin', '2024-01-02.bin'])
+            self.assertEqual(len(log), 4)
+
+            self.assertEqual(list(log.last(1)['price']), [4.0])
+            self.assertEqual(list(log.last(3)['price']), [2.0, 3.0, 4.0])
+            self.assertEqual(list(log.last(10)['id']), [1, 2, 3, 4])
+            self.assertEqual(list(log.range(day, day + DAY_MS)['price']), [2.0, 3.0])
+            self.assertEqual(list(log.range(day + 1, day + DAY_MS + 1)['price']), [3.0, 4.0])
+
+            # Within one day the result is a view of the mapped file
+            self.assertIsInstance(log.last(1), np.memmap)
+            self.assertFalse(log.last(1).flags.writeable)
+
+            # Reopening picks up where the files left off, ignoring a torn record
+            log.close()
+            with open(os.path.join(directory, '2024-01-02.bin'), 'ab') as f:
+                f.write(b'\0' * 5)
+            log = PriceLog(directory)
+            self.assertEqual(len(log), 4)
+            self.assertEqual(log.append([5.0], [day + DAY_MS + 1000]), 5)
+            self.assertEqual(list(log.last(2)['price']), [4.0, 5.0])
+            self.assertEqual(os.path.getsize(os.path.join(directory, '2024-01-02.bin')), 2 * RECORD.itemsize)
+
+            # Retention removes whole days only
+            self.assertEqual(log.purge(day + 1000), 1)
+            self.assertEqual(log.purge(day + DAY_MS), 2)
+            self.assertEqual(log.days, ['2024-01-02'])
+            self.assertEqual(list(log.last(10)['price']), [4.0, 5.0])
+            log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
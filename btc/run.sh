@@ -1,4 +1,3 @@
-apt install python3-schedule
 apt install python3-requests
 apt install python3-numpy
 
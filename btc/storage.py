@@ -0,0 +1,1466 @@
+import sqlite3
+import datetime
+import threading
+import time
+import bisect
+import contextlib
+import os
+import numpy as np
+from price_log import PriceLog
+
+# Where raw prices are kept: 'sqlite' (the price table) or 'log' (memory-mapped day files, one folder per symbol, see price_log.py)
+# Candles, advices, trades and balances always live in SQLite
+PRICE_BACKEND = 'sqlite'
+PRICE_LOG_DIRECTORY = "prices"
+
+# Trading pair used when none is given
+DEFAULT_SYMBOL = 'BTCUSDT'
+
+# Rows pulled per fetchmany() call when streaming into arrays
+FETCH_SIZE = 4096
+
+PRICE_COLUMNS = {
+    'id': np.int64,
+    'price': np.float64,
+    'timestamp': 'datetime64[ms]'
+}
+
+# Trade and account columns as read into arrays; missing ids are 0, missing prices NaN and missing timestamps NaT
+TRADE_COLUMNS = {
+    'id': np.int64,
+    'amount': np.float64,
+    'buy_advice_id': np.int64,
+    'buy_price': np.float64,
+    'buy_timestamp': 'datetime64[s]',
+    'sell_advice_id': np.int64,
+    'sell_price': np.float64,
+    'sell_timestamp': 'datetime64[s]',
+    'profit_multiplier': np.float64
+}
+
+ACCOUNT_COLUMNS = {
+    'id': np.int64,
+    'trade_id': np.int64,
+    'balance': np.float64,
+    'timestamp': 'datetime64[s]'
+}
+
+# How HOLD advices are stored (BUY and SELL are always stored in full, since trades reference them):
+#   'full'      one row per tick
+#   'changes'   only when the advice changes; repeated HOLDs are not written
+#   'rle'       repeated HOLDs extend the current HOLD row's run_length instead of adding a row (the default, so readers of the
+#               Advice table should weigh HOLD rows by run_length)
+ADVICE_MODE = 'rle'
+ADVICE_MODES = ('full', 'changes', 'rle')
+
+# Candle (OHLC rollup) tables by interval, with the bucket width in milliseconds
+CANDLE_INTERVALS = {
+    '1m': 60 * 1000,
+    '1h': 3600 * 1000,
+    '1d': 86400 * 1000
+}
+
+CANDLE_COLUMNS = {
+    'bucket': np.int64,
+    'open': np.float64,
+    'high': np.float64,
+    'low': np.float64,
+    'close': np.float64,
+    'count': np.int64,
+    'sum': np.float64,
+    'sum_sq': np.float64
+}
+
+# Merges a (partial) candle into the stored one; prices must arrive in chronological order for `close` to be right
+CANDLE_UPSERTS = {
+    interval: f"""
+    INSERT INTO candle_{interval} (symbol, bucket, open, high, low, close, count, sum, sum_sq) VALUES (?,?,?,?,?,?,?,?,?)
+    ON CONFLICT (symbol, bucket) DO UPDATE SET
+        high = max(high, excluded.high),
+        low = min(low, excluded.low),
+        close = excluded.close,
+        count = count + excluded.count,
+        sum = sum + excluded.sum,
+        sum_sq = sum_sq + excluded.sum_sq
+    """
+    for interval in CANDLE_INTERVALS
+}
+
+INDEXES = {
+    'price_timestamp': "price(timestamp)",
+    'price_symbol': "price(symbol, id)",
+    'advice_timestamp': "advice(timestamp)",
+    'advice_symbol': "advice(symbol, id)",
+    'trade_symbol': "trade(symbol, id)",
+    'account_symbol': "account(symbol, id)"
+}
+
+# Rows deleted per statement when purging, so the write lock is only held briefly
+PURGE_BATCH_SIZE = 5000
+
+
+# Returns the current time in seconds since the Unix epoch; every timestamp this module writes, and every purge cutoff, comes from it
+clock = time.time
+
+
+def set_clock(new_clock):
+    '''
+    Replaces the clock, e.g. with a `demo_replay.VirtualClock` to replay recorded prices faster than real time.
+
+    :param new_clock:   Function taking no arguments that returns epoch seconds (None goes back to `time.time`)
+    :rtype:             The clock that was in use before
+    '''
+    global clock
+    previous, clock = clock, (time.time if new_clock is None else new_clock)
+    return previous
+
+
+def now_ms():
+    '''
+    Returns the current time as milliseconds since the Unix epoch (UTC). Used for price and advice timestamps.
+
+    :rtype:     Integer
+    '''
+    return int(clock() * 1000)
+
+
+def _now_text():
+    # Trade and account timestamps are stored as 'YYYY-MM-DD HH:MM:SS' text
+    return datetime.datetime.fromtimestamp(clock(), datetime.UTC).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _symbol(symbol):
+    # Symbols are inlined into some statements and used as folder names, so only allow plain trading pair names
+    symbol = str(symbol)
+    if not symbol.isalnum():
+        raise ValueError(f"Invalid symbol: {symbol}")
+    return symbol
+
+
+def _timestamp_param(value):
+    # Accepts epoch milliseconds, datetimes (naive ones are taken as UTC), numpy.datetime64 or ISO strings
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.UTC)
+        return int(value.timestamp() * 1000)
+    return int(np.datetime64(value, 'ms').astype(np.int64))
+
+
+def _check_order(order):
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+
+def _check_columns(columns, known, kind):
+    for column in columns:
+        if column not in known:
+            raise ValueError(f"Unknown {kind} column: {column}")
+
+
+def _check_advice_mode(mode):
+    if mode not in ADVICE_MODES:
+        raise ValueError(f"Unknown advice mode: {mode}")
+
+
+def _advice_dict(x):
+    return {
+        'id': x[0],
+        'price': x[1],
+        'sma': x[2],
+        'standard_deviation': x[3],
+        'upper_band': x[4],
+        'lower_band': x[5],
+        'advice': x[6],
+        'timestamp': x[7],
+        'symbol': x[8],
+        'run_length': x[9]
+    }
+
+
+def _trade_dict(x):
+    return {
+        'id': x[0],
+        'amount': x[1],
+        'buy_advice_id': x[2],
+        'buy_price': x[3],
+        'buy_timestamp': x[4],
+        'sell_advice_id': x[5],
+        'sell_price': x[6],
+        'sell_timestamp': x[7],
+        'profit_multiplier': x[8],
+        'symbol': x[9]
+    }
+
+
+def _account_dict(x):
+    return {
+        'id': x[0],
+        'trade_id': x[1],
+        'balance': x[2],
+        'timestamp': x[3],
+        'symbol': x[4]
+    }
+
+
+def _candle_rows(prices, timestamps, width):
+    # Aggregates prices into (bucket, open, high, low, close, count, sum, sum_sq) rows, one per bucket, in NumPy
+    order = np.argsort(timestamps, kind='stable')
+    prices = np.asarray(prices, dtype=np.float64)[order]
+    timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+    buckets = timestamps // width * width
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.append(starts[1:], len(buckets))
+    return zip(
+        buckets[starts].tolist(),
+        prices[starts].tolist(),
+        np.maximum.reduceat(prices, starts).tolist(),
+        np.minimum.reduceat(prices, starts).tolist(),
+        prices[ends - 1].tolist(),
+        (ends - starts).tolist(),
+        np.add.reduceat(prices, starts).tolist(),
+        np.add.reduceat(prices * prices, starts).tolist()
+    )
+
+
+def _log_columns(records, columns, reverse):
+    # Column views of price log records; nothing is copied
+    _check_columns(columns, PRICE_COLUMNS, 'price')
+    if reverse:
+        records = records[::-1]
+    return {column: records[column].view(PRICE_COLUMNS[column]) for column in columns}
+
+
+class SQLiteStorage:
+    '''
+    Storage in a SQLite database file, or in memory when the database is ':memory:'.
+    File databases give every thread its own long-lived connection (WAL mode, relaxed fsyncs, cached prepared statements);
+    an in-memory database has a single connection, so use it from one thread at a time.
+
+    :param database:            Database file, or ':memory:', as a string
+    :param price_backend:       'sqlite' to keep raw prices in the price table, 'log' to keep them in memory-mapped day files
+    :param price_log_directory: Folder for the price log files when price_backend is 'log', as a string
+    :param advice_mode:         How repeated HOLD advices are stored (see ADVICE_MODE, which is the default), as a string
+    '''
+    def __init__(self, database=":memory:", price_backend=PRICE_BACKEND, price_log_directory=PRICE_LOG_DIRECTORY, advice_mode=None):
+        if price_backend not in ('sqlite', 'log'):
+            raise ValueError(f"Unknown price backend: {price_backend}")
+        self.database = database
+        self.price_backend = price_backend
+        self.price_log_directory = price_log_directory
+        self.advice_mode = ADVICE_MODE if advice_mode is None else advice_mode
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._price_logs = {}
+        self._shared = None
+
+    def __repr__(self):
+        return f"SQLiteStorage({self.database!r}, {self.price_backend!r}, {self.price_log_directory!r}, {self.advice_mode!r})"
+
+    def _connect(self):
+        con = sqlite3.connect(self.database, timeout=10, cached_statements=256, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA cache_size=-16000")
+        con.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(con)
+        return con
+
+    def get_connection(self):
+        '''
+        Returns this thread's long-lived connection to the database, opening it on first use.
+
+        :rtype:     sqlite3.Connection
+        '''
+        if self.database == ":memory:":
+            if self._shared is None:
+                self._shared = self._connect()
+            return self._shared
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = self._local.con = self._connect()
+        return con
+
+    def close(self):
+        '''
+        Closes every connection and price log opened by this storage. It reopens on next use (an in-memory database starts empty).
+        '''
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+            for log in self._price_logs.values():
+                log.close()
+            self._price_logs.clear()
+            self._local = threading.local()
+            self._shared = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Groups every write made in the block into a single transaction, so a whole tick costs one commit (and one fsync).
+        Rolls back if the block raises. Nested blocks join the outer transaction.
+        With the 'log' price backend, prices are only appended to the price log once the block commits, so reads inside it do not see them.
+
+        :rtype:     sqlite3.Connection
+        '''
+        con = self.get_connection()
+        if getattr(self._local, 'in_transaction', False):
+            yield con
+            return
+        self._local.in_transaction = True
+        try:
+            yield con
+        except BaseException:
+            con.rollback()
+            self._local.pending_prices = []
+            raise
+        else:
+            con.commit()
+            self._append_pending_prices()
+        finally:
+            self._local.in_transaction = False
+
+    def _commit(self, con):
+        # Inside `transaction()` the commit is deferred to the end of the block
+        if not getattr(self._local, 'in_transaction', False):
+            con.commit()
+            self._append_pending_prices()
+
+    def _log_prices(self, symbol, prices, timestamps):
+        # The price log is not part of the SQLite transaction, so prices wait until their candles are committed, and are dropped
+        # if they are rolled back (see `transaction()`); returns the id the last price will get
+        log = self.price_log(symbol)
+        pending = self._local.__dict__.setdefault('pending_prices', [])
+        pending.append((log, prices, timestamps))
+        return log.next_id - 1 + sum(len(x[1]) for x in pending if x[0] is log)
+
+    def _append_pending_prices(self):
+        pending, self._local.pending_prices = getattr(self._local, 'pending_prices', []), []
+        for log, prices, timestamps in pending:
+            log.append(prices, timestamps)
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        '''
+        Speeds up large imports: fsyncs are off and indexes are dropped for the duration of the block, then rebuilt once.
+        '''
+        con = self.get_connection()
+        con.execute("PRAGMA synchronous=OFF")
+        self.drop_indexes()
+        try:
+            yield
+        finally:
+            self.create_indexes()
+            con.execute("PRAGMA synchronous=NORMAL")
+
+    def price_log(self, symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the price log for a symbol when the price backend is 'log', opening it on first use.
+
+        :param symbol:  Trading pair, as a string
+        :rtype:         price_log.PriceLog
+        '''
+        symbol = _symbol(symbol)
+        log = self._price_logs.get(symbol)
+        if log is None:
+            with self._lock:
+                log = self._price_logs.get(symbol)
+                if log is None:
+                    log = self._price_logs[symbol] = PriceLog(os.path.join(self.price_log_directory, symbol))
+        return log
+
+    def _price_log_symbols(self):
+        if not os.path.isdir(self.price_log_directory):
+            return []
+        return sorted(
+            x for x in os.listdir(self.price_log_directory)
+            if os.path.isdir(os.path.join(self.price_log_directory, x))
+        )
+
+    def create_database(self):
+        '''
+        Generates tables for database. Use once.
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS price(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            price REAL,
+            timestamp INTEGER,
+            symbol TEXT NOT NULL DEFAULT 'BTCUSDT'
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS advice(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            price REAL,
+            sma REAL,
+            standard_deviation REAL,
+            upper_band REAL,
+            lower_band REAL,
+            advice TEXT,
+            timestamp INTEGER,
+            symbol TEXT NOT NULL DEFAULT 'BTCUSDT',
+            run_length INTEGER NOT NULL DEFAULT 1
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS trade(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount REAL,
+            buy_advice_id INTEGER,
+            buy_price REAL,
+            buy_timestamp TEXT,
+            sell_advice_id INTEGER,
+            sell_price REAL,
+            sell_timestamp TEXT,
+            profit_multiplier REAL,
+            symbol TEXT NOT NULL DEFAULT 'BTCUSDT'
+        )
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS account(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trade_id INTEGER,
+            balance REAL,
+            timestamp TEXT,
+            symbol TEXT NOT NULL DEFAULT 'BTCUSDT'
+        )
+        """)
+        for interval in CANDLE_INTERVALS:
+            cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS candle_{interval}(
+                symbol TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                count INTEGER,
+                sum REAL,
+                sum_sq REAL,
+                PRIMARY KEY (symbol, bucket)
+            ) WITHOUT ROWID
+            """)
+        self.migrate_database()
+        self.create_indexes()
+
+    def create_indexes(self):
+        '''
+        Creates the timestamp indexes used by range reads and purges, and the per-symbol indexes. Called by `create_database()`.
+        '''
+        cur = self.get_connection().cursor()
+        for name, columns in INDEXES.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+    def drop_indexes(self):
+        '''
+        Drops all indexes. Used to speed up bulk imports; call `create_indexes()` afterwards.
+        '''
+        cur = self.get_connection().cursor()
+        for name in INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def migrate_database(self):
+        '''
+        Converts price and advice timestamps in an existing database from 'YYYY-MM-DD HH:MM:SS' text to epoch milliseconds,
+        adds the symbol column to tables that predate it (existing rows are BTCUSDT), adds the advice run_length column, and backfills empty candle tables from the Price table.
+        Does nothing if the database is already up to date. Called by `create_database()`.
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        for table in ('price', 'advice'):
+            columns = cur.execute(f"PRAGMA table_info({table})").fetchall()
+            if [x[2] for x in columns if x[1] == 'timestamp'] != ['TEXT']:
+                continue
+            names = ', '.join(x[1] for x in columns)
+            definition = cur.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()[0]
+            cur.execute("BEGIN")
+            cur.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+            cur.execute(definition.replace("timestamp TEXT", "timestamp INTEGER"))
+            cur.execute(f"""
+            INSERT INTO {table} ({names})
+            SELECT {names.replace('timestamp', "CAST(strftime('%s', timestamp) AS INTEGER) * 1000")}
+            FROM {table}_old
+            """)
+            cur.execute(f"DROP TABLE {table}_old")
+            con.commit()
+        for table in ('price', 'advice', 'trade', 'account'):
+            columns = cur.execute(f"PRAGMA table_info({table})").fetchall()
+            if 'symbol' not in [x[1] for x in columns]:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN symbol TEXT NOT NULL DEFAULT 'BTCUSDT'")
+        if 'run_length' not in [x[1] for x in cur.execute("PRAGMA table_info(advice)").fetchall()]:
+            cur.execute("ALTER TABLE advice ADD COLUMN run_length INTEGER NOT NULL DEFAULT 1")
+        if cur.execute("SELECT 1 FROM candle_1m LIMIT 1").fetchone() is None and cur.execute("SELECT 1 FROM price LIMIT 1").fetchone():
+            self.rebuild_candles()
+            con.commit()
+
+    def create_price(self, price, timestamp=None, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates an entry in the Price table and updates the 1m / 1h / 1d candles it falls in. Used to record BTC prices.
+
+        :param price:       BTC price, as a float
+        :param timestamp:   When the price was quoted, in epoch milliseconds (defaults to now)
+        :param symbol:      Trading pair, as a string
+        :rtype:             Primary key of the new entry, as an integer
+        '''
+        price = float(price)
+        timestamp = now_ms() if timestamp is None else int(timestamp)
+        con = self.get_connection()
+        cur = con.cursor()
+        if self.price_backend != 'log':
+            cur.execute(
+                "INSERT INTO price (id, price, timestamp, symbol) VALUES (?,?,?,?)",
+                (None, price, timestamp, str(symbol))
+            )
+            price_id = cur.lastrowid
+        for interval, width in CANDLE_INTERVALS.items():
+            cur.execute(
+                CANDLE_UPSERTS[interval],
+                (str(symbol), timestamp // width * width, price, price, price, price, 1, price, price * price)
+            )
+        if self.price_backend == 'log':
+            price_id = self._log_prices(symbol, [price], [timestamp])
+        self._commit(con)
+        return price_id
+
+    def create_prices(self, rows, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates many entries in the Price table with a single statement, and updates the candles with one aggregated row per bucket.
+        Used for bulk imports.
+
+        :param rows:    (price, timestamp in epoch milliseconds) pairs, as an iterable of tuples
+        :param symbol:  Trading pair, as a string
+        :rtype:         Number of entries created, as an integer
+        '''
+        rows = list(rows)
+        if not rows:
+            return 0
+        prices, timestamps = zip(*rows)
+        prices = np.asarray(prices, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        con = self.get_connection()
+        cur = con.cursor()
+        if self.price_backend == 'log':
+            created = len(rows)
+        else:
+            cur.executemany(
+                f"INSERT INTO price (price, timestamp, symbol) VALUES (?,?,'{_symbol(symbol)}')",
+                rows
+            )
+            created = cur.rowcount
+        self._update_candles(cur, symbol, prices, timestamps)
+        if self.price_backend == 'log':
+            self._log_prices(symbol, prices, timestamps)
+        self._commit(con)
+        return created
+
+    def _update_candles(self, cur, symbol, prices, timestamps, intervals=CANDLE_INTERVALS):
+        # Merges one aggregated row per bucket into the stored candles
+        if len(prices) == 0:
+            return 0
+        written = 0
+        for interval, width in intervals.items():
+            rows = [(str(symbol),) + x for x in _candle_rows(prices, timestamps, width)]
+            cur.executemany(CANDLE_UPSERTS[interval], rows)
+            written += len(rows)
+        return written
+
+    def rebuild_candles(self, symbol=None):
+        '''
+        Recomputes the candles from the stored prices (Price table or price log). Used after editing prices by hand or to backfill a database that predates candles.
+        Candles from before the oldest stored price are kept, so history that has already been purged is not lost.
+
+        :param symbol:  Trading pair, as a string (None rebuilds every symbol)
+        :rtype:         Number of candles written, as an integer
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        if symbol is not None:
+            symbols = [str(symbol)]
+        elif self.price_backend == 'log':
+            symbols = self._price_log_symbols()
+        else:
+            symbols = [x[0] for x in cur.execute("SELECT DISTINCT symbol FROM price").fetchall()]
+        written = 0
+        for symbol in symbols:
+            if self.price_backend == 'log':
+                log = self.price_log(symbol)
+                records = log.last(len(log))
+                oldest = int(records['timestamp'][0]) if len(records) else None
+            else:
+                oldest = cur.execute("SELECT min(timestamp) FROM price WHERE symbol = ?", (symbol,)).fetchone()[0]
+            if oldest is None:
+                continue
+            for interval, width in CANDLE_INTERVALS.items():
+                # A stored candle that only partly overlaps the stored prices may hold purged ticks, so it is left alone
+                start = oldest // width * width
+                if start < oldest and cur.execute(
+                    f"SELECT 1 FROM candle_{interval} WHERE symbol = ? AND bucket = ?", (symbol, start)
+                ).fetchone():
+                    start += width
+                cur.execute(f"DELETE FROM candle_{interval} WHERE symbol = ? AND bucket >= ?", (symbol, start))
+                if self.price_backend == 'log':
+                    kept = records[records['timestamp'] >= start]
+                    written += self._update_candles(cur, symbol, kept['price'], kept['timestamp'], {interval: width})
+                    continue
+                cur.execute(f"""
+                INSERT INTO candle_{interval} (symbol, bucket, open, high, low, close, count, sum, sum_sq)
+                SELECT g.symbol, g.bucket, o.price, g.high, g.low, c.price, g.count, g.sum, g.sum_sq
+                FROM (
+                    SELECT symbol, timestamp / {width} * {width} AS bucket, min(id) AS first_id, max(id) AS last_id,
+                        max(price) AS high, min(price) AS low, count(*) AS count, sum(price) AS sum, sum(price * price) AS sum_sq
+                    FROM price WHERE symbol = ? AND timestamp >= ? GROUP BY bucket
+                ) AS g
+                JOIN price AS o ON o.id = g.first_id
+                JOIN price AS c ON c.id = g.last_id
+                """, (symbol, start))
+                written += cur.rowcount
+        self._commit(con)
+        return written
+
+    def read_candles(self, interval, limit, columns=tuple(CANDLE_COLUMNS), order='desc', symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the last n candles of an interval as NumPy arrays, one per column. The newest candle is usually still filling up.
+        Used for long-horizon analysis without scanning raw prices.
+
+        :param interval:    '1m', '1h' or '1d', as a string
+        :param limit:       Number of candles to retrieve, as an integer
+        :param columns:     Any of 'bucket' (start of the candle in epoch milliseconds), 'open', 'high', 'low', 'close', 'count', 'sum', 'sum_sq', as a tuple of strings
+        :param order:       'desc' for reverse chronological order (newest is first) or 'asc' for chronological order, as a string
+        :param symbol:      Trading pair, as a string
+        :rtype:             Dictionary of column name to numpy.ndarray
+        '''
+        if interval not in CANDLE_INTERVALS:
+            raise ValueError(f"Unknown candle interval: {interval}")
+        _check_order(order)
+        _check_columns(columns, CANDLE_COLUMNS, 'candle')
+        cur = self.get_connection().cursor()
+        res = cur.execute(
+            f"SELECT {', '.join(columns)} FROM candle_{interval} WHERE symbol = ? ORDER BY bucket DESC LIMIT ?",
+            (str(symbol), int(limit))
+        )
+        return self._fill_arrays(res, columns, int(limit), reverse=(order == 'asc'), dtypes=CANDLE_COLUMNS)
+
+    def read_last_price_timestamp(self, symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the timestamp of the newest entry in the Price table for a symbol, in epoch milliseconds, or None if there is none.
+        '''
+        if self.price_backend == 'log':
+            records = self.price_log(symbol).last(1)
+            return int(records['timestamp'][0]) if len(records) else None
+        cur = self.get_connection().cursor()
+        row = cur.execute("SELECT timestamp FROM price WHERE symbol = ? ORDER BY id DESC LIMIT 1", (str(symbol),)).fetchone()
+        return row[0] if row else None
+
+    def read_prices(self, limit, symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the last n BTC prices, in reverse chronological order (newest is first). Used to read historical BTC price data.
+
+        :param limit:   Number of entries to retrieve, as an integer
+        :param symbol:  Trading pair, as a string
+        :rtype:         List of dictionaries
+        '''
+        if self.price_backend == 'log':
+            records = self.price_log(symbol).last(limit)[::-1]
+            raw_data = zip(records['id'].tolist(), records['price'].tolist(), records['timestamp'].tolist(), [str(symbol)] * len(records))
+        else:
+            cur = self.get_connection().cursor()
+            res = cur.execute("SELECT * FROM price WHERE symbol = ? ORDER BY id DESC LIMIT ?", (str(symbol), int(limit)))
+            raw_data = res.fetchall()
+        data_list = []
+        for x in raw_data:
+            data_dict = {
+                'id': x[0],
+                'price': x[1],
+                'timestamp': x[2],
+                'symbol': x[3]
+            }
+            data_list.append(data_dict)
+        return data_list
+
+    def count_prices(self, symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the number of entries in the Price table for a symbol.
+
+        :param symbol:  Trading pair, as a string (None counts every symbol)
+        :rtype:         Integer
+        '''
+        if self.price_backend == 'log':
+            symbols = self._price_log_symbols() if symbol is None else [symbol]
+            return sum(len(self.price_log(x)) for x in symbols)
+        cur = self.get_connection().cursor()
+        if symbol is None:
+            return cur.execute("SELECT COUNT(*) FROM price").fetchone()[0]
+        return cur.execute("SELECT COUNT(*) FROM price WHERE symbol = ?", (str(symbol),)).fetchone()[0]
+
+    def _price_query(self, columns):
+        _check_columns(columns, PRICE_COLUMNS, 'price')
+        return f"SELECT {', '.join(columns)} FROM price"
+
+    def _fill_arrays(self, res, columns, size, reverse, dtypes=PRICE_COLUMNS):
+        # Streams a cursor into preallocated arrays; with reverse=True rows are written back to front
+        arrays = {column: np.empty(size, dtype=dtypes[column]) for column in columns}
+        filled = 0
+        while True:
+            rows = res.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            n = len(rows)
+            for column, values in zip(columns, zip(*rows)):
+                if reverse:
+                    arrays[column][size - filled - n:size - filled] = values[::-1]
+                else:
+                    arrays[column][filled:filled + n] = values
+            filled += n
+        if reverse:
+            return {column: array[size - filled:] for column, array in arrays.items()}
+        return {column: array[:filled] for column, array in arrays.items()}
+
+    def read_price_array(self, limit, columns=('price',), order='desc', symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the last n BTC prices as NumPy arrays, one per column. Used instead of `read_prices()` when only the numbers are needed.
+        With the 'log' backend the arrays are read-only views of the mapped price files.
+
+        :param limit:   Number of entries to retrieve, as an integer
+        :param columns: Any of 'id', 'price', 'timestamp', as a tuple of strings
+        :param order:   'desc' for reverse chronological order (newest is first) or 'asc' for chronological order, as a string
+        :param symbol:  Trading pair, as a string
+        :rtype:         Dictionary of column name to numpy.ndarray
+        '''
+        _check_order(order)
+        if self.price_backend == 'log':
+            return _log_columns(self.price_log(symbol).last(limit), columns, reverse=(order == 'desc'))
+        cur = self.get_connection().cursor()
+        res = cur.execute(self._price_query(columns) + " WHERE symbol = ? ORDER BY id DESC LIMIT ?", (str(symbol), int(limit)))
+        return self._fill_arrays(res, columns, int(limit), reverse=(order == 'asc'))
+
+    def read_price_range(self, start, end, columns=('price',), order='asc', symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the BTC prices recorded between two points in time as NumPy arrays, one per column. Used for analysis over a time period.
+
+        :param start:   Start of the period (inclusive), as epoch milliseconds, a datetime or a 'YYYY-MM-DD HH:MM:SS' string
+        :param end:     End of the period (exclusive), as epoch milliseconds, a datetime or a 'YYYY-MM-DD HH:MM:SS' string
+        :param columns: Any of 'id', 'price', 'timestamp', as a tuple of strings
+        :param order:   'asc' for chronological order or 'desc' for reverse chronological order (newest is first), as a string
+        :param symbol:  Trading pair, as a string
+        :rtype:         Dictionary of column name to numpy.ndarray
+        '''
+        _check_order(order)
+        if self.price_backend == 'log':
+            records = self.price_log(symbol).range(_timestamp_param(start), _timestamp_param(end))
+            return _log_columns(records, columns, reverse=(order == 'desc'))
+        cur = self.get_connection().cursor()
+        params = (_timestamp_param(start), _timestamp_param(end), str(symbol))
+        size = cur.execute("SELECT COUNT(*) FROM price WHERE timestamp >= ? AND timestamp < ? AND symbol = ?", params).fetchone()[0]
+        res = cur.execute(
+            self._price_query(columns) + f" WHERE timestamp >= ? AND timestamp < ? AND symbol = ? ORDER BY id {order.upper()}",
+            params
+        )
+        return self._fill_arrays(res, columns, size, reverse=False)
+
+    def create_advice(self, price, sma, standard_deviation, upper_band, lower_band, advice, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates an entry in the Advice table. Used to record calculations and buy/sell recommendations.
+        By default (advice mode 'rle') a HOLD that follows a HOLD does not add a row: it increments that row's run_length
+        and returns it, so there is one row per run of HOLDs rather than one per tick. Use advice mode 'full' for a row every time.
+
+        :param price:               Price of BTC at a given point, as a float.
+        :param sma:                 Simple Moving Average of historic price data, as a float.
+        :param standard_deviation:  Standard deviation of historic price data, as a float.
+        :param upper_band:          Upper Bollinger band for historic price data, as a float.
+        :param lower_band:          Lower Bollinger band for historic price data, as a float.
+        :param advice:              BUY / SELL / HOLD, as a string.
+        :param symbol:              Trading pair, as a string.
+        :rtype:                     The new (or extended) entry, as a list of dictionaries (same as `read_last_advice()`)
+        '''
+        _check_advice_mode(self.advice_mode)
+        con = self.get_connection()
+        cur = con.cursor()
+        if advice == 'HOLD' and self.advice_mode != 'full':
+            # Only touches the newest row for the symbol, and only if it is a HOLD
+            if self.advice_mode == 'rle':
+                res = cur.execute(
+                    "UPDATE advice SET run_length = run_length + 1 "
+                    "WHERE id = (SELECT max(id) FROM advice WHERE symbol = ?) AND advice = 'HOLD' RETURNING *",
+                    (str(symbol),)
+                )
+            else:
+                res = cur.execute(
+                    "SELECT * FROM advice WHERE id = (SELECT max(id) FROM advice WHERE symbol = ?) AND advice = 'HOLD'",
+                    (str(symbol),)
+                )
+            data_list = [_advice_dict(x) for x in res.fetchall()]
+            if data_list:
+                self._commit(con)
+                return data_list
+        res = cur.execute(
+            "INSERT INTO advice (price, sma, standard_deviation, upper_band, lower_band, advice, timestamp, symbol) VALUES (?,?,?,?,?,?,?,?) RETURNING *",
+            (float(price), float(sma), float(standard_deviation), float(upper_band), float(lower_band), str(advice), now_ms(), str(symbol))
+        )
+        data_list = [_advice_dict(x) for x in res.fetchall()]
+        self._commit(con)
+        return data_list
+
+    def create_advices(self, rows, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates many entries in the Advice table with a single statement, one per row whatever the advice mode is. Used for bulk imports and seeding.
+
+        :param rows:    (price, sma, standard_deviation, upper_band, lower_band, advice, timestamp in epoch milliseconds) tuples, as an iterable
+        :param symbol:  Trading pair, as a string
+        :rtype:         Number of entries created, as an integer
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        cur.executemany(
+            f"INSERT INTO advice (price, sma, standard_deviation, upper_band, lower_band, advice, timestamp, symbol) VALUES (?,?,?,?,?,?,?,'{_symbol(symbol)}')",
+            rows
+        )
+        self._commit(con)
+        return cur.rowcount
+
+    def read_last_advice(self, symbol=DEFAULT_SYMBOL):
+        '''
+        Retrieves the last entry from the Advice table. Used to make buy/sell decisions.
+
+        :param symbol:  Trading pair, as a string
+        :rtype:         List of dictionaries
+        '''
+        cur = self.get_connection().cursor()
+        res = cur.execute("SELECT * FROM advice WHERE symbol = ? ORDER BY id DESC LIMIT 1", (str(symbol),))
+        return [_advice_dict(x) for x in res.fetchall()]
+
+    def create_buy(self, amount, buy_advice_id, buy_price, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates a buy entry in the Trades table. Used to simulate buys.
+
+        :param amount:          How much money did we spend on this buy, as a float?
+        :param buy_advice_id:   What is the primary key of the Advice that prompted this buy, as an integer?
+        :param buy_price:       What price did we buy BTC at, as a float?
+        :param symbol:          Which trading pair did we buy, as a string?
+        :rtype:                 The new entry, as a list of dictionaries (same as `read_last_trade()`)
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        res = cur.execute(
+            "INSERT INTO trade VALUES (?,?,?,?,?,?,?,?,?,?) RETURNING *",
+            (None, float(amount), int(buy_advice_id), float(buy_price), _now_text(), None, None, None, None, str(symbol))
+        )
+        data_list = [_trade_dict(x) for x in res.fetchall()]
+        self._commit(con)
+        return data_list
+
+    def read_last_trade(self, symbol=DEFAULT_SYMBOL):
+        '''
+        Retrieves the last entry in the Trade table. Used to get both buy and sell data.
+
+        :param symbol:  Trading pair, as a string
+        :rtype:         List of dictionaries
+        '''
+        cur = self.get_connection().cursor()
+        res = cur.execute("SELECT * FROM trade WHERE symbol = ? ORDER BY id DESC LIMIT 1", (str(symbol),))
+        return [_trade_dict(x) for x in res.fetchall()]
+
+    def create_sell(self, trade_id, sell_advice_id, sell_price, profit_multiplier):
+        '''
+        Creates a sell entry in the Trades table. Used to update buy entries and simulate trades.
+
+        :param trade_id:            What is the primary key of the Trade this is linked to, as an integer? (You need to buy before you can sell.)
+        :param sell_advice_id:      What is the primary key of the Advice that prompted this sell, as an integer?
+        :param sell_price:          How much did we sell at, as a float?
+        :param profit_multiplier:   (Sell price) / (Buy price), as a float.
+        :rtype:                     The updated entry, as a list of dictionaries (same as `read_last_trade()`)
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        res = cur.execute(
+            "UPDATE trade SET sell_advice_id = ?, sell_price = ?, sell_timestamp = ?, profit_multiplier = ? WHERE id = ? RETURNING *",
+            (int(sell_advice_id), float(sell_price), _now_text(), float(profit_multiplier), int(trade_id))
+        )
+        data_list = [_trade_dict(x) for x in res.fetchall()]
+        self._commit(con)
+        return data_list
+
+    def create_seed_funds(self, amount, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates the first entry in the Account table. Used to simulate the initial deposit of money.
+        Each symbol trades from its own balance, so seed every symbol you run.
+
+        :param amount:  Amount of seed money, as a float.
+        :param symbol:  Trading pair the money is for, as a string.
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        cur.execute(
+            "INSERT INTO account VALUES (?,?,?,?,?)",
+            (None, None, float(amount), _now_text(), str(symbol))
+        )
+        self._commit(con)
+
+    def update_funds(self, trade_id, amount, symbol=DEFAULT_SYMBOL):
+        '''
+        Creates a new entry in the Account table as trades are made. Used to simulate money flow with buys and sells.
+
+        :param trade_id:    What is the primary key of the trade that is affecting the balance, as an integer?
+        :param amount:      What is the new amount of money in the account, as a float?
+        :param symbol:      Which trading pair's balance is it, as a string?
+        :rtype:             Primary key of the new entry, as an integer
+        '''
+        con = self.get_connection()
+        cur = con.cursor()
+        cur.execute(
+            "INSERT INTO account VALUES (?,?,?,?,?)",
+            (None, int(trade_id), float(amount), _now_text(), str(symbol))
+        )
+        self._commit(con)
+        return cur.lastrowid
+
+    def read_account_balances(self, limit, symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the last n account balances, in reverse chronological order (newest is first). Used to read historical account data.
+
+        :param limit:   Number of entries to retrieve, as an integer
+        :param symbol:  Trading pair, as a string
+        :rtype:         List of dictionaries
+        '''
+        cur = self.get_connection().cursor()
+        res = cur.execute("SELECT * FROM account WHERE symbol = ? ORDER BY id DESC LIMIT ?", (str(symbol), int(limit)))
+        return [_account_dict(x) for x in res.fetchall()]
+
+    def _table_array(self, table, known, after_id, columns, symbol):
+        _check_columns(columns, known, table)
+        # NULL ids are read as 0 (they cannot go into an integer array); NULL floats and timestamps become NaN / NaT
+        select = ', '.join(f"IFNULL({x}, 0)" if known[x] is np.int64 else x for x in columns)
+        cur = self.get_connection().cursor()
+        params = (int(after_id), str(symbol))
+        size = cur.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ? AND symbol = ?", params).fetchone()[0]
+        res = cur.execute(f"SELECT {select} FROM {table} WHERE id > ? AND symbol = ? ORDER BY id", params)
+        return self._fill_arrays(res, columns, size, reverse=False, dtypes=known)
+
+    def read_trade_array(self, after_id=0, columns=tuple(TRADE_COLUMNS), symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the entries of the Trade table after a given id as NumPy arrays, one per column, in chronological order. Used for analytics.
+        Open trades have a sell_advice_id of 0 and NaN / NaT sell columns.
+
+        :param after_id:    Only entries with a greater id, as an integer (0 for all of them)
+        :param columns:     Any of `TRADE_COLUMNS`, as a tuple of strings
+        :param symbol:      Trading pair, as a string
+        :rtype:             Dictionary of column name to numpy.ndarray
+        '''
+        return self._table_array('trade', TRADE_COLUMNS, after_id, columns, symbol)
+
+    def read_account_array(self, after_id=0, columns=tuple(ACCOUNT_COLUMNS), symbol=DEFAULT_SYMBOL):
+        '''
+        Returns the entries of the Account table after a given id as NumPy arrays, one per column, in chronological order. Used for analytics.
+        The seed funds entry has a trade_id of 0.
+
+        :param after_id:    Only entries with a greater id, as an integer (0 for all of them)
+        :param columns:     Any of `ACCOUNT_COLUMNS`, as a tuple of strings
+        :param symbol:      Trading pair, as a string
+        :rtype:             Dictionary of column name to numpy.ndarray
+        '''
+        return self._table_array('account', ACCOUNT_COLUMNS, after_id, columns, symbol)
+
+    def read_last_ids(self):
+        '''
+        Returns the last primary key handed out in each table (deleted rows included), so another storage can carry on the numbering.
+
+        :rtype:     Dictionary of table name to id, as integers
+        '''
+        cur = self.get_connection().cursor()
+        res = cur.execute("SELECT name, seq FROM sqlite_sequence WHERE name IN ('price', 'advice', 'trade', 'account')")
+        return {'price': 0, 'advice': 0, 'trade': 0, 'account': 0, **dict(res.fetchall())}
+
+    def _purge(self, table, older_than, batch_size):
+        cutoff = now_ms() - int(older_than) * 3600 * 1000
+        con = self.get_connection()
+        cur = con.cursor()
+        deleted = 0
+        while True:
+            cur.execute(
+                f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE timestamp < ? LIMIT ?)",
+                (cutoff, int(batch_size))
+            )
+            self._commit(con)
+            deleted += cur.rowcount
+            if cur.rowcount < batch_size:
+                return deleted
+
+    def purge_old_prices(self, older_than=528, batch_size=PURGE_BATCH_SIZE):
+        '''
+        Deletes all price entries that are over 528 hours (22 days) old, in batches. Used to prevent database from getting too big.
+        With the 'log' backend whole day files are deleted instead, so prices are kept until their whole day has expired.
+
+        :param older_than:      Delete older than x hours, as an integer
+        :param batch_size:      Entries deleted per statement, as an integer
+        :rtype:                 Number of deleted entries, as an integer
+        '''
+        if self.price_backend == 'log':
+            cutoff = now_ms() - int(older_than) * 3600 * 1000
+            return sum(self.price_log(x).purge(cutoff) for x in self._price_log_symbols())
+        return self._purge('price', older_than, batch_size)
+
+    def purge_old_advices(self, older_than=528, batch_size=PURGE_BATCH_SIZE):
+        '''
+        Deletes all advice entries that are over 528 hours (22 days) old, in batches. Used to prevent database from getting too big.
+
+        :param older_than:      Delete older than x hours, as an integer
+        :param batch_size:      Entries deleted per statement, as an integer
+        :rtype:                 Number of deleted entries, as an integer
+        '''
+        return self._purge('advice', older_than, batch_size)
+
+
+class _PriceSeries:
+    # One symbol's prices in growable NumPy arrays; rows [start, stop) are live
+    def __init__(self):
+        self.ids = np.empty(1024, dtype=np.int64)
+        self.prices = np.empty(1024, dtype=np.float64)
+        self.timestamps = np.empty(1024, dtype=np.int64)
+        self.start = 0
+        self.stop = 0
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def append(self, ids, prices, timestamps):
+        n = len(prices)
+        if self.stop + n > len(self.prices):
+            # Grow (and drop purged rows) into new arrays, so views handed out earlier stay valid
+            size = max(2 * (len(self) + n), 1024)
+            for name in ('ids', 'prices', 'timestamps'):
+                old = getattr(self, name)
+                new = np.empty(size, dtype=old.dtype)
+                new[:len(self)] = old[self.start:self.stop]
+                setattr(self, name, new)
+            self.start, self.stop = 0, len(self)
+        self.ids[self.stop:self.stop + n] = ids
+        self.prices[self.stop:self.stop + n] = prices
+        self.timestamps[self.stop:self.stop + n] = timestamps
+        self.stop += n
+
+    def state(self):
+        return self.ids, self.prices, self.timestamps, self.start, self.stop
+
+    def restore(self, state):
+        self.ids, self.prices, self.timestamps, self.start, self.stop = state
+
+    def columns(self, start, stop):
+        # Read-only views of rows [start, stop) relative to the live rows
+        views = {
+            'id': self.ids[self.start + start:self.start + stop],
+            'price': self.prices[self.start + start:self.start + stop],
+            'timestamp': self.timestamps[self.start + start:self.start + stop].view('datetime64[ms]')
+        }
+        for view in views.values():
+            view.flags.writeable = False
+        return views
+
+
+class MemoryStorage:
+    '''
+    Storage kept entirely in this process, with the same methods and results as SQLiteStorage.
+    Nothing touches disk, so tests, backtests and benchmarks can run the production code paths at memory speed.
+    Prices are kept in NumPy arrays (`read_price_array()` returns read-only views); everything is lost when the process exits.
+
+    :param advice_mode: How repeated HOLD advices are stored (see ADVICE_MODE, which is the default), as a string
+    '''
+    def __init__(self, advice_mode=None):
+        self.advice_mode = ADVICE_MODE if advice_mode is None else advice_mode
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._prices = {}
+        self._candles = {interval: {} for interval in CANDLE_INTERVALS}
+        self._advices = {}
+        self._trades = {}
+        self._trades_by_id = {}
+        self._accounts = {}
+        self._ids = {'price': 0, 'advice': 0, 'trade': 0, 'account': 0}
+
+    @classmethod
+    def from_storage(cls, source, symbols=(DEFAULT_SYMBOL,), prices=0):
+        '''
+        Builds a memory copy of the newest state of another storage: the last n prices, advice, trade and balance of each symbol,
+        with their ids, and the id counters and advice mode, so new entries get the same ids they would get in `source`.
+
+        :param source:  Storage to copy from, as a SQLiteStorage or MemoryStorage
+        :param symbols: Trading pairs to copy, as a list of strings
+        :param prices:  Number of prices to copy per symbol, as an integer
+        :rtype:         MemoryStorage
+        '''
+        memory = cls(source.advice_mode)
+        for symbol in symbols:
+            data = source.read_price_array(prices, columns=('price', 'timestamp'), order='asc', symbol=symbol)
+            if len(data['price']):
+                memory._add_prices(data['price'], data['timestamp'].view(np.int64), symbol)
+            memory._advices[str(symbol)] = source.read_last_advice(symbol)
+            memory._accounts[str(symbol)] = source.read_account_balances(1, symbol)
+            memory._trades[str(symbol)] = source.read_last_trade(symbol)
+            for row in memory._trades[str(symbol)]:
+                memory._trades_by_id[row['id']] = row
+        memory._ids.update(source.read_last_ids())
+        return memory
+
+    def __repr__(self):
+        return f"MemoryStorage({self.advice_mode!r})"
+
+    def _changed(self, undo):
+        # Inside `transaction()` every change registers how to revert itself
+        log = getattr(self._local, 'undo', None)
+        if log is not None:
+            log.append(undo)
+
+    def _next_id(self, table, n=1):
+        first = self._ids[table] + 1
+        self._ids[table] += n
+        self._changed(lambda: self._ids.__setitem__(table, first - 1))
+        return first
+
+    def _append(self, rows, row):
+        rows.append(row)
+        self._changed(rows.pop)
+
+    def get_connection(self):
+        raise NotImplementedError("MemoryStorage has no SQL connection")
+
+    def close(self):
+        pass
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''
+        Groups every write made in the block and holds the storage lock until the end. Rolls back if the block raises.
+        Nested blocks join the outer transaction.
+        '''
+        with self._lock:
+            if getattr(self._local, 'undo', None) is not None:
+                yield self
+                return
+            self._local.undo = []
+            try:
+                yield self
+            except BaseException:
+                for undo in reversed(self._local.undo):
+                    undo()
+                raise
+            finally:
+                self._local.undo = None
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        yield
+
+    def create_database(self):
+        pass
+
+    def create_indexes(self):
+        pass
+
+    def drop_indexes(self):
+        pass
+
+    def migrate_database(self):
+        pass
+
+    def _series(self, symbol):
+        series = self._prices.get(str(symbol))
+        if series is None:
+            series = self._prices[str(symbol)] = _PriceSeries()
+        return series
+
+    def _merge_candles(self, symbol, interval, rows):
+        buckets, candles = self._candles[interval].setdefault(str(symbol), ([], {}))
+        for bucket, open_, high, low, close, count, total, total_sq in rows:
+            candle = candles.get(bucket)
+            if candle is None:
+                candles[bucket] = [open_, high, low, close, count, total, total_sq]
+                if not buckets or bucket > buckets[-1]:
+                    buckets.append(bucket)
+                else:
+                    bisect.insort(buckets, bucket)
+                self._changed(lambda bucket=bucket: (candles.pop(bucket), buckets.remove(bucket)))
+            else:
+                self._changed(lambda candle=candle, old=list(candle): candle.__setitem__(slice(None), old))
+                candle[1] = max(candle[1], high)
+                candle[2] = min(candle[2], low)
+                candle[3] = close
+                candle[4] += count
+                candle[5] += total
+                candle[6] += total_sq
+
+    def _add_prices(self, prices, timestamps, symbol):
+        prices = np.asarray(prices, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        with self._lock:
+            first = self._next_id('price', len(prices))
+            series = self._series(symbol)
+            state = series.state()
+            series.append(np.arange(first, first + len(prices)), prices, timestamps)
+            self._changed(lambda: series.restore(state))
+            for interval, width in CANDLE_INTERVALS.items():
+                self._merge_candles(symbol, interval, _candle_rows(prices, timestamps, width))
+            return first + len(prices) - 1
+
+    def create_price(self, price, timestamp=None, symbol=DEFAULT_SYMBOL):
+        timestamp = now_ms() if timestamp is None else int(timestamp)
+        return self._add_prices([float(price)], [timestamp], symbol)
+
+    def create_prices(self, rows, symbol=DEFAULT_SYMBOL):
+        rows = list(rows)
+        if not rows:
+            return 0
+        prices, timestamps = zip(*rows)
+        self._add_prices(prices, timestamps, symbol)
+        return len(rows)
+
+    def rebuild_candles(self, symbol=None):
+        with self._lock:
+            symbols = [str(symbol)] if symbol is not None else sorted(self._prices)
+            written = 0
+            for symbol in symbols:
+                series = self._prices.get(symbol)
+                if not series:
+                    continue
+                columns = series.columns(0, len(series))
+                timestamps = columns['timestamp'].view(np.int64)
+                oldest = int(timestamps.min())
+                for interval, width in CANDLE_INTERVALS.items():
+                    buckets, candles = self._candles[interval].setdefault(symbol, ([], {}))
+                    # A stored candle that only partly overlaps the stored prices may hold purged ticks, so it is left alone
+                    start = oldest // width * width
+                    if start < oldest and start in candles:
+                        start += width
+                    old = (list(buckets), dict(candles))
+                    self._changed(lambda buckets=buckets, candles=candles, old=old: (
+                        buckets.__setitem__(slice(None), old[0]), candles.clear(), candles.update(old[1])
+                    ))
+                    for bucket in buckets[bisect.bisect_left(buckets, start):]:
+                        del candles[bucket]
+                    del buckets[bisect.bisect_left(buckets, start):]
+                    kept = timestamps >= start
+                    rows = list(_candle_rows(columns['price'][kept], timestamps[kept], width)) if kept.any() else []
+                    self._merge_candles(symbol, interval, rows)
+                    written += len(rows)
+            return written
+
+    def read_candles(self, interval, limit, columns=tuple(CANDLE_COLUMNS), order='desc', symbol=DEFAULT_SYMBOL):
+        if interval not in CANDLE_INTERVALS:
+            raise ValueError(f"Unknown candle interval: {interval}")
+        _check_order(order)
+        _check_columns(columns, CANDLE_COLUMNS, 'candle')
+        with self._lock:
+            buckets, candles = self._candles[interval].get(str(symbol), ([], {}))
+            selected = buckets[max(0, len(buckets) - int(limit)):]
+            rows = [[bucket] + candles[bucket] for bucket in selected]
+        if order == 'desc':
+            rows.reverse()
+        names = list(CANDLE_COLUMNS)
+        return {
+            column: np.array([x[names.index(column)] for x in rows], dtype=CANDLE_COLUMNS[column])
+            for column in columns
+        }
+
+    def read_last_price_timestamp(self, symbol=DEFAULT_SYMBOL):
+        series = self._prices.get(str(symbol))
+        if not series:
+            return None
+        return int(series.timestamps[series.stop - 1])
+
+    def read_prices(self, limit, symbol=DEFAULT_SYMBOL):
+        columns = self.read_price_array(limit, columns=('id', 'price', 'timestamp'), symbol=symbol)
+        return [
+            {'id': x[0], 'price': x[1], 'timestamp': x[2], 'symbol': str(symbol)}
+            for x in zip(columns['id'].tolist(), columns['price'].tolist(), columns['timestamp'].view(np.int64).tolist())
+        ]
+
+    def count_prices(self, symbol=DEFAULT_SYMBOL):
+        if symbol is None:
+            return sum(len(x) for x in self._prices.values())
+        series = self._prices.get(str(symbol))
+        return len(series) if series else 0
+
+    def read_price_array(self, limit, columns=('price',), order='desc', symbol=DEFAULT_SYMBOL):
+        _check_order(order)
+        _check_columns(columns, PRICE_COLUMNS, 'price')
+        with self._lock:
+            series = self._series(symbol)
+            views = series.columns(max(0, len(series) - int(limit)), len(series))
+        step = -1 if order == 'desc' else 1
+        return {column: views[column][::step] for column in columns}
+
+    def read_price_range(self, start, end, columns=('price',), order='asc', symbol=DEFAULT_SYMBOL):
+        _check_order(order)
+        _check_columns(columns, PRICE_COLUMNS, 'price')
+        with self._lock:
+            series = self._series(symbol)
+            views = series.columns(0, len(series))
+        timestamps = views['timestamp'].view(np.int64)
+        selected = np.flatnonzero((timestamps >= _timestamp_param(start)) & (timestamps < _timestamp_param(end)))
+        if order == 'desc':
+            selected = selected[::-1]
+        return {column: views[column][selected] for column in columns}
+
+    def create_advice(self, price, sma, standard_deviation, upper_band, lower_band, advice, symbol=DEFAULT_SYMBOL):
+        _check_advice_mode(self.advice_mode)
+        with self._lock:
+            rows = self._advices.setdefault(str(symbol), [])
+            if advice == 'HOLD' and self.advice_mode != 'full' and rows and rows[-1]['advice'] == 'HOLD':
+                if self.advice_mode == 'rle':
+                    row = rows[-1]
+                    row['run_length'] += 1
+                    self._changed(lambda: row.__setitem__('run_length', row['run_length'] - 1))
+                return [dict(rows[-1])]
+            row = {
+                'id': self._next_id('advice'),
+                'price': float(price),
+                'sma': float(sma),
+                'standard_deviation': float(standard_deviation),
+                'upper_band': float(upper_band),
+                'lower_band': float(lower_band),
+                'advice': str(advice),
+                'timestamp': now_ms(),
+                'symbol': str(symbol),
+                'run_length': 1
+            }
+            self._append(rows, row)
+            return [dict(row)]
+
+    def create_advices(self, rows, symbol=DEFAULT_SYMBOL):
+        created = 0
+        with self._lock:
+            stored = self._advices.setdefault(str(symbol), [])
+            for price, sma, standard_deviation, upper_band, lower_band, advice, timestamp in rows:
+                self._append(stored, {
+                    'id': self._next_id('advice'),
+                    'price': float(price),
+                    'sma': float(sma),
+                    'standard_deviation': float(standard_deviation),
+                    'upper_band': float(upper_band),
+                    'lower_band': float(lower_band),
+                    'advice': str(advice),
+                    'timestamp': int(timestamp),
+                    'symbol': str(symbol),
+                    'run_length': 1
+                })
+                created += 1
+        return created
+
+    def read_last_advice(self, symbol=DEFAULT_SYMBOL):
+        rows = self._advices.get(str(symbol))
+        return [dict(rows[-1])] if rows else []
+
+    def create_buy(self, amount, buy_advice_id, buy_price, symbol=DEFAULT_SYMBOL):
+        with self._lock:
+            row = {
+                'id': self._next_id('trade'),
+                'amount': float(amount),
+                'buy_advice_id': int(buy_advice_id),
+                'buy_price': float(buy_price),
+                'buy_timestamp': _now_text(),
+                'sell_advice_id': None,
+                'sell_price': None,
+                'sell_timestamp': None,
+                'profit_multiplier': None,
+                'symbol': str(symbol)
+            }
+            self._append(self._trades.setdefault(str(symbol), []), row)
+            self._trades_by_id[row['id']] = row
+            self._changed(lambda: self._trades_by_id.pop(row['id']))
+            return [dict(row)]
+
+    def read_last_trade(self, symbol=DEFAULT_SYMBOL):
+        rows = self._trades.get(str(symbol))
+        return [dict(rows[-1])] if rows else []
+
+    def create_sell(self, trade_id, sell_advice_id, sell_price, profit_multiplier):
+        with self._lock:
+            row = self._trades_by_id.get(int(trade_id))
+            if row is None:
+                return []
+            old = dict(row)
+            self._changed(lambda: row.update(old))
+            row.update({
+                'sell_advice_id': int(sell_advice_id),
+                'sell_price': float(sell_price),
+                'sell_timestamp': _now_text(),
+                'profit_multiplier': float(profit_multiplier)
+            })
+            return [dict(row)]
+
+    def _add_account(self, trade_id, amount, symbol):
+        with self._lock:
+            row = {
+                'id': self._next_id('account'),
+                'trade_id': trade_id,
+                'balance': float(amount),
+                'timestamp': _now_text(),
+                'symbol': str(symbol)
+            }
+            self._append(self._accounts.setdefault(str(symbol), []), row)
+            return row['id']
+
+    def create_seed_funds(self, amount, symbol=DEFAULT_SYMBOL):
+        self._add_account(None, amount, symbol)
+
+    def update_funds(self, trade_id, amount, symbol=DEFAULT_SYMBOL):
+        return self._add_account(int(trade_id), amount, symbol)
+
+    def read_account_balances(self, limit, symbol=DEFAULT_SYMBOL):
+        rows = self._accounts.get(str(symbol), [])
+        return [dict(x) for x in reversed(rows[max(0, len(rows) - int(limit)):])]
+
+    def _table_array(self, rows, known, after_id, columns, kind):
+        _check_columns(columns, known, kind)
+        with self._lock:
+            rows = [x for x in rows if x['id'] > int(after_id)]
+            return {
+                column: np.array([0 if x[column] is None and known[column] is np.int64 else x[column] for x in rows], dtype=known[column])
+                for column in columns
+            }
+
+    def read_trade_array(self, after_id=0, columns=tuple(TRADE_COLUMNS), symbol=DEFAULT_SYMBOL):
+        return self._table_array(self._trades.get(str(symbol), []), TRADE_COLUMNS, after_id, columns, 'trade')
+
+    def read_account_array(self, after_id=0, columns=tuple(ACCOUNT_COLUMNS), symbol=DEFAULT_SYMBOL):
+        return self._table_array(self._accounts.get(str(symbol), []), ACCOUNT_COLUMNS, after_id, columns, 'account')
+
+    def read_last_ids(self):
+        return dict(self._ids)
+
+    def purge_old_prices(self, older_than=528, batch_size=PURGE_BATCH_SIZE):
+        cutoff = now_ms() - int(older_than) * 3600 * 1000
+        deleted = 0
+        with self._lock:
+            for series in self._prices.values():
+                live = series.columns(0, len(series))
+                keep = live['timestamp'].view(np.int64) >= cutoff
+                if keep.all():
+                    continue
+                state = series.state()
+                self._changed(lambda series=series, state=state: series.restore(state))
+                kept = {column: view[keep] for column, view in live.items()}
+                # Fresh arrays, so views handed out earlier keep their data
+                series.__init__()
+                series.append(kept['id'], kept['price'], kept['timestamp'].view(np.int64))
+                deleted += int((~keep).sum())
+        return deleted
+
+    def purge_old_advices(self, older_than=528, batch_size=PURGE_BATCH_SIZE):
+        cutoff = now_ms() - int(older_than) * 3600 * 1000
+        deleted = 0
+        with self._lock:
+            for symbol, rows in list(self._advices.items()):
+                kept = [x for x in rows if x['timestamp'] >= cutoff]
+                if len(kept) == len(rows):
+                    continue
+                self._changed(lambda symbol=symbol, rows=rows: self._advices.__setitem__(symbol, rows))
+                self._advices[symbol] = kept
+                deleted += len(rows) - len(kept)
+        return deleted
@@ -0,0 +1,199 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from storage import *
+
+
+class StorageTests:
+    # Run against every backend by the subclasses below; `make_storage()` returns a fresh, empty storage
+
+    def setUp(self):
+        self.storage = self.make_storage()
+        self.storage.create_database()
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_prices(self):
+        s = self.storage
+        self.assertEqual(s.create_price(100.0, 1000), 1)
+        self.assertEqual(s.create_prices([(101.0, 2000), (102.0, 61000)]), 2)
+        s.create_price(500.0, 1000, symbol='ETHUSDT')
+        self.assertEqual(s.count_prices(), 3)
+        self.assertEqual(s.count_prices(None), 4)
+        self.assertEqual(s.read_last_price_timestamp(), 61000)
+        self.assertIsNone(s.read_last_price_timestamp('XRPUSDT'))
+        self.assertEqual([x['price'] for x in s.read_prices(2)], [102.0, 101.0])
+        self.assertEqual(s.read_prices(1)[0]['timestamp'], 61000)
+        arrays = s.read_price_array(2, columns=('price', 'timestamp'), order='asc')
+        np.testing.assert_array_equal(arrays['price'], [101.0, 102.0])
+        self.assertEqual(arrays['timestamp'].dtype, np.dtype('datetime64[ms]'))
+        np.testing.assert_array_equal(s.read_price_array(10)['price'], [102.0, 101.0, 100.0])
+        np.testing.assert_array_equal(s.read_price_range(1000, 61000)['price'], [100.0, 101.0])
+        np.testing.assert_array_equal(s.read_price_range(0, 10 ** 6, order='desc')['price'], [102.0, 101.0, 100.0])
+        with self.assertRaises(ValueError):
+            s.read_price_array(1, columns=('volume',))
+
+    def test_candles(self):
+        s = self.storage
+        s.create_prices([(10.0, 0), (12.0, 1000), (9.0, 2000), (11.0, 60000)])
+        s.create_price(13.0, 61000)
+        candles = s.read_candles('1m', 5, order='asc')
+        np.testing.assert_array_equal(candles['bucket'], [0, 60000])
+        np.testing.assert_array_equal(candles['open'], [10.0, 11.0])
+        np.testing.assert_array_equal(candles['high'], [12.0, 13.0])
+        np.testing.assert_array_equal(candles['low'], [9.0, 11.0])
+        np.testing.assert_array_equal(candles['close'], [9.0, 13.0])
+        np.testing.assert_array_equal(candles['count'], [3, 2])
+        hour = s.read_candles('1h', 1, columns=('count', 'sum'))
+        self.assertEqual(hour['count'].tolist(), [5])
+        self.assertEqual(hour['sum'].tolist(), [55.0])
+        self.assertEqual(s.rebuild_candles(), 4)
+        self.assertEqual(s.read_candles('1m', 5, columns=('close',))['close'].tolist(), [13.0, 9.0])
+
+    def test_advices(self):
+        s = self.storage
+        first = s.create_advice(1.0, 1.0, 1.0, 2.0, 0.0, 'HOLD')[0]
+        second = s.create_advice(2.0, 1.0, 1.0, 2.0, 0.0, 'HOLD')[0]
+        self.assertEqual(second['id'], first['id'])
+        self.assertEqual(second['run_length'], 2)
+        buy = s.create_advice(3.0, 1.0, 1.0, 2.0, 0.0, 'BUY')[0]
+        self.assertEqual(s.read_last_advice(), [buy])
+        self.assertEqual(s.read_last_advice('ETHUSDT'), [])
+        self.assertEqual(s.create_advices([(4.0, 1.0, 1.0, 2.0, 0.0, 'HOLD', 0)] * 3), 3)
+        self.assertEqual(s.read_last_advice()[0]['id'], buy['id'] + 3)
+        self.assertEqual(s.purge_old_advices(), 3)
+        self.assertEqual(s.read_last_advice(), [buy])
+
+    def test_trades(self):
+        s = self.storage
+        self.assertEqual(s.read_last_trade(), [])
+        s.create_seed_funds(200.0)
+        trade = s.create_buy(199.8, 1, 5.0)[0]
+        self.assertEqual(trade['buy_price'], 5.0)
+        self.assertIsNone(trade['sell_price'])
+        s.update_funds(trade['id'], 0.0)
+        sold = s.create_sell(trade['id'], 2, 10.0, 2.0)[0]
+        self.assertEqual(sold['id'], trade['id'])
+        self.assertEqual(sold['profit_multiplier'], 2.0)
+        self.assertEqual(s.read_last_trade(), [sold])
+        s.update_funds(trade['id'], 399.2)
+        balances = s.read_account_balances(5)
+        self.assertEqual([x['balance'] for x in balances], [399.2, 0.0, 200.0])
+        self.assertEqual(balances[-1]['trade_id'], None)
+        self.assertEqual(s.read_account_balances(5, symbol='ETHUSDT'), [])
+
+    def test_trade_arrays(self):
+        s = self.storage
+        s.create_seed_funds(200.0)
+        first = s.create_buy(199.8, 1, 5.0)[0]
+        s.create_sell(first['id'], 2, 10.0, 2.0)
+        s.update_funds(first['id'], 399.2)
+        second = s.create_buy(398.8, 3, 8.0)[0]
+        s.create_buy(50.0, 1, 1.0, symbol='ETHUSDT')
+        trades = s.read_trade_array()
+        self.assertEqual(trades['id'].tolist(), [first['id'], second['id']])
+        self.assertEqual(trades['sell_advice_id'].tolist(), [2, 0])
+        self.assertTrue(np.isnan(trades['sell_price'][1]))
+        self.assertTrue(np.isnat(trades['sell_timestamp'][1]))
+        self.assertEqual(trades['buy_timestamp'][0], np.datetime64(first['buy_timestamp'].replace(' ', 'T'), 's'))
+        self.assertEqual(s.read_trade_array(first['id'], columns=('buy_price',))['buy_price'].tolist(), [8.0])
+        accounts = s.read_account_array()
+        self.assertEqual(accounts['trade_id'].tolist(), [0, first['id']])
+        self.assertEqual(accounts['balance'].tolist(), [200.0, 399.2])
+        self.assertEqual(s.read_account_array(10 ** 6)['balance'].tolist(), [])
+        with self.assertRaises(ValueError):
+            s.read_trade_array(columns=('symbol',))
+
+    def test_from_storage(self):
+        s = self.storage
+        s.create_prices([(float(x), 1000 * x) for x in range(1, 11)])
+        s.create_seed_funds(200.0)
+        advice = s.create_advice(3.0, 1.0, 1.0, 2.0, 0.0, 'BUY')[0]
+        trade = s.create_buy(199.8, advice['id'], 3.0)[0]
+        s.update_funds(trade['id'], 0.0)
+        s.create_advices([(4.0, 1.0, 1.0, 2.0, 0.0, 'HOLD', 0)] * 2)
+        s.purge_old_advices()
+        memory = MemoryStorage.from_storage(s, prices=4)
+        self.assertEqual(memory.read_price_array(10)['price'].tolist(), [10.0, 9.0, 8.0, 7.0])
+        self.assertEqual(memory.read_last_trade(), [trade])
+        self.assertEqual(memory.read_account_balances(5), s.read_account_balances(1))
+        self.assertEqual(memory.read_last_ids(), s.read_last_ids())
+        # New entries are numbered as they would be in the source, even after a purge
+        previous = set_clock(lambda: 1600000000.0)
+        try:
+            self.assertEqual(memory.create_advice(5.0, 1.0, 1.0, 2.0, 0.0, 'SELL'), s.create_advice(5.0, 1.0, 1.0, 2.0, 0.0, 'SELL'))
+            self.assertEqual(memory.create_sell(trade['id'], advice['id'] + 3, 5.0, 5 / 3), s.create_sell(trade['id'], advice['id'] + 3, 5.0, 5 / 3))
+        finally:
+            set_clock(previous)
+
+    def test_purge(self):
+        s = self.storage
+        now = now_ms()
+        s.create_prices([(1.0, now - 30 * 86400000), (2.0, now - 29 * 86400000), (3.0, now)])
+        self.assertEqual(s.purge_old_prices(), 2)
+        self.assertEqual(s.purge_old_prices(), 0)
+        np.testing.assert_array_equal(s.read_price_array(5)['price'], [3.0])
+
+    def test_transaction(self):
+        s = self.storage
+        s.create_price(1.0, 1000)
+        with self.assertRaises(RuntimeError):
+            with s.transaction():
+                s.create_price(2.0, 2000)
+                s.create_advice(2.0, 1.0, 1.0, 2.0, 0.0, 'HOLD')
+                s.create_advice(2.0, 1.0, 1.0, 2.0, 0.0, 'HOLD')
+                s.create_seed_funds(200.0)
+                raise RuntimeError()
+        self.assertEqual(s.count_prices(), 1)
+        self.assertEqual(s.read_candles('1m', 5, columns=('count',))['count'].tolist(), [1])
+        self.assertEqual(s.read_last_advice(), [])
+        self.assertEqual(s.read_account_balances(1), [])
+        with s.transaction():
+            with s.transaction():
+                self.assertEqual(s.create_price(2.0, 2000), 2)
+        self.assertEqual(s.count_prices(), 2)
+
+
+class MemorySQLiteStorageTestCase(StorageTests, unittest.TestCase):
+
+    def make_storage(self):
+        return SQLiteStorage(":memory:")
+
+
+class FileSQLiteStorageTestCase(StorageTests, unittest.TestCase):
+
+    def make_storage(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        return SQLiteStorage(os.path.join(self.directory.name, "storage.db"))
+
+
+class LogSQLiteStorageTestCase(StorageTests, unittest.TestCase):
+
+    def make_storage(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        return SQLiteStorage(os.path.join(self.directory.name, "storage.db"), 'log', os.path.join(self.directory.name, "prices"))
+
+
+class MemoryStorageTestCase(StorageTests, unittest.TestCase):
+
+    def make_storage(self):
+        return MemoryStorage()
+
+    def test_views(self):
+        # Arrays handed out before a purge or a resize keep their values
+        s = self.storage
+        s.create_prices([(float(i), i) for i in range(2000)])
+        prices = s.read_price_array(3)['price']
+        self.assertFalse(prices.flags.writeable)
+        s.create_prices([(float(i), i) for i in range(2000, 5000)])
+        s.purge_old_prices()
+        self.assertEqual(prices.tolist(), [1999.0, 1998.0, 1997.0])
+        self.assertEqual(s.count_prices(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,391 @@
+import math
+import storage
+import funcs
+
+
+class EMA:
+    '''
+    Exponential moving average, updated in O(1) per price. Seeded with the SMA of the first n prices.
+
+    :param periods: Number of prices the average spans (smoothing factor 2 / (periods + 1)), as an integer
+    '''
+    def __init__(self, periods):
+        self.periods = int(periods)
+        self.alpha = 2 / (self.periods + 1)
+        self.count = 0
+        self.value = 0.0
+
+    def push(self, price, timestamp=None):
+        price = float(price)
+        self.count += 1
+        if self.count <= self.periods:
+            self.value += (price - self.value) / self.count
+        else:
+            self.value += self.alpha * (price - self.value)
+
+    def is_ready(self):
+        return self.count >= self.periods
+
+
+class EMABollinger:
+    '''
+    Bollinger bands around an exponential moving average, with an exponentially weighted standard deviation.
+    Updated in O(1) per price and reacts faster than the SMA bands, since it keeps no window.
+
+    :param periods: Number of prices the average spans, as an integer
+    :param k:       Width of the bands in standard deviations, as a float
+    '''
+    def __init__(self, periods, k=2):
+        self.periods = int(periods)
+        self.k = k
+        self.alpha = 2 / (self.periods + 1)
+        self.count = 0
+        self.price = 0.0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def push(self, price, timestamp=None):
+        price = float(price)
+        self.count += 1
+        self.price = price
+        if self.count == 1:
+            self.mean = price
+            return
+        delta = price - self.mean
+        self.mean += self.alpha * delta
+        self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+
+    def is_ready(self):
+        return self.count >= self.periods
+
+    def bands(self):
+        '''
+        Returns the current price, EMA, standard deviation and bands, with the same keys as `RollingBollinger.bands()`.
+
+        :rtype:     Dictionary
+        '''
+        standard_deviation = math.sqrt(self.variance)
+        return {
+            'price': self.price,
+            'sma': self.mean,
+            'standard_deviation': standard_deviation,
+            'upper_band': self.mean + (standard_deviation * self.k),
+            'lower_band': self.mean - (standard_deviation * self.k)
+        }
+
+
+class RSI:
+    '''
+    Relative Strength Index with Wilder's smoothing, updated in O(1) per price. Ranges from 0 to 100.
+
+    :param periods: Number of price changes the averages span, as an integer
+    '''
+    def __init__(self, periods=14):
+        self.periods = int(periods)
+        self.count = 0
+        self.last_price = None
+        self.average_gain = 0.0
+        self.average_loss = 0.0
+
+    def push(self, price, timestamp=None):
+        price = float(price)
+        if self.last_price is None:
+            self.last_price = price
+            return
+        change = price - self.last_price
+        self.last_price = price
+        self.count += 1
+        # Plain average over the first n changes, then Wilder's smoothing
+        n = min(self.count, self.periods)
+        self.average_gain += (max(change, 0.0) - self.average_gain) / n
+        self.average_loss += (max(-change, 0.0) - self.average_loss) / n
+
+    def is_ready(self):
+        return self.count >= self.periods
+
+    @property
+    def value(self):
+        if self.average_loss == 0.0:
+            return 100.0 if self.average_gain > 0.0 else 50.0
+        return 100 - 100 / (1 + self.average_gain / self.average_loss)
+
+
+class MACD:
+    '''
+    Moving Average Convergence Divergence: fast EMA minus slow EMA (the MACD line), an EMA of that line (the signal line)
+    and their difference (the histogram). The fast and slow EMAs come from the feed, so they are shared with other indicators.
+
+    :param fast:    Fast EMA, as an EMA
+    :param slow:    Slow EMA, as an EMA
+    :param signal:  Number of MACD values the signal line spans, as an integer
+    '''
+    def __init__(self, fast, slow, signal=9):
+        self.fast = fast
+        self.slow = slow
+        self.signal = EMA(signal)
+        self.value = 0.0
+        self.histogram = 0.0
+        self.previous_histogram = 0.0
+
+    def push(self, price, timestamp=None):
+        # The feed pushes the price into the fast and slow EMAs first
+        if not self.slow.is_ready():
+            return
+        self.value = self.fast.value - self.slow.value
+        self.signal.push(self.value)
+        self.previous_histogram = self.histogram
+        self.histogram = self.value - self.signal.value
+
+    def is_ready(self):
+        return self.slow.is_ready() and self.signal.is_ready()
+
+
+class Feed:
+    '''
+    One symbol's price feed. Indicators are registered once and updated together on each new price,
+    and asking for an indicator that is already registered returns the same instance, so strategies share them.
+
+    :param db_utils:    Where `load()` reads prices from: a storage (see storage.py), or a module of storage functions such as demo_db_utils
+    :param symbol:      Trading pair the prices are for, as a string
+    '''
+    def __init__(self, db_utils, symbol=storage.DEFAULT_SYMBOL):
+        self.db_utils = db_utils
+        self.symbol = symbol
+        self.indicators = {}
+        self.price = None
+
+    def add(self, key, factory):
+        '''
+        Returns the indicator registered under a key, registering `factory()` first if there is none.
+        Indicators are updated in registration order, so register the ones an indicator reads from before it.
+
+        :param key:     Hashable key identifying the indicator and its parameters
+        :param factory: Function taking no arguments that builds the indicator
+        '''
+        indicator = self.indicators.get(key)
+        if indicator is None:
+            indicator = self.indicators[key] = factory()
+        return indicator
+
+    def bollinger(self, window_size, k=2):
+        return self.add(('bollinger', window_size, k), lambda: funcs.RollingBollinger(window_size, k, symbol=self.symbol))
+
+    def ema(self, periods):
+        return self.add(('ema', periods), lambda: EMA(periods))
+
+    def ema_bollinger(self, periods, k=2):
+        return self.add(('ema_bollinger', periods, k), lambda: EMABollinger(periods, k))
+
+    def rsi(self, periods=14):
+        return self.add(('rsi', periods), lambda: RSI(periods))
+
+    def macd(self, fast=12, slow=26, signal=9):
+        fast, slow = self.ema(fast), self.ema(slow)
+        return self.add(('macd', fast.periods, slow.periods, signal), lambda: MACD(fast, slow, signal))
+
+    def push(self, price, timestamp=None):
+        '''
+        Updates every registered indicator with a new price.
+
+        :param price:       Price, as a float
+        :param timestamp:   When the price was recorded, as a numpy.datetime64 (defaults to now)
+        '''
+        self.price = float(price)
+        for indicator in self.indicators.values():
+            indicator.push(price, timestamp)
+
+    def extend(self, prices, timestamps):
+        '''
+        Updates every registered indicator with many prices, in chronological order. Used to warm up the indicators.
+
+        :param prices:      Prices, as a numpy.ndarray
+        :param timestamps:  When the prices were recorded, as a numpy.ndarray of datetime64
+        '''
+        if len(prices) == 0:
+            return
+        self.price = float(prices[-1])
+        # Window indicators load in one go; the rest take the prices one at a time, together, since some read from others
+        stepped = []
+        for indicator in self.indicators.values():
+            if hasattr(indicator, 'extend'):
+                indicator.extend(prices, timestamps)
+            else:
+                stepped.append(indicator)
+        for price in prices.tolist():
+            for indicator in stepped:
+                indicator.push(price)
+
+    def load(self, limit):
+        '''
+        Warms up every registered indicator with the last n prices of the symbol. Used once at startup, after the strategies are built.
+
+        :param limit:   Number of prices, as an integer
+        '''
+        data = self.db_utils.read_price_array(limit, columns=('price', 'timestamp'), order='asc', symbol=self.symbol)
+        self.extend(data['price'], data['timestamp'])
+
+
+class Strategy:
+    '''
+    Base class for strategies. A strategy registers the indicators it needs on a feed when it is built,
+    then turns their current values into BUY / SELL / HOLD advice.
+
+    Subclasses implement `is_ready()`, `values()` and `decide()`.
+    `values()` returns what is stored with the advice, keyed like the Advice table: price, sma, standard_deviation, upper_band, lower_band.
+
+    :param feed:    Price feed of the symbol to trade, as a Feed
+    '''
+    name = None
+
+    def __init__(self, feed):
+        self.feed = feed
+
+    @property
+    def symbol(self):
+        return self.feed.symbol
+
+    def is_ready(self):
+        raise NotImplementedError
+
+    def values(self):
+        raise NotImplementedError
+
+    def decide(self, values):
+        raise NotImplementedError
+
+    def advise(self):
+        '''
+        Returns the values to store with the advice, plus the advice itself under 'advice'.
+
+        :rtype:     Dictionary
+        '''
+        if not self.is_ready():
+            raise ValueError("Insufficient data.")
+        values = self.values()
+        values['advice'] = self.decide(values)
+        return values
+
+
+class BollingerStrategy(Strategy):
+    '''
+    The original strategy: buy at or below the lower SMA Bollinger band, sell at or above the upper one.
+
+    :param window_size: Number of prices in the window, as an integer
+    :param k:           Width of the bands in standard deviations, as a float
+    '''
+    name = 'bollinger'
+
+    def __init__(self, feed, window_size, k=2):
+        super().__init__(feed)
+        self.bollinger = feed.bollinger(window_size, k)
+
+    def is_ready(self):
+        return self.bollinger.is_ready()
+
+    def values(self):
+        return self.bollinger.bands()
+
+    def decide(self, values):
+        return funcs.get_bsh(values['price'], values['upper_band'], values['lower_band'])
+
+
+class EMABollingerStrategy(BollingerStrategy):
+    '''
+    Same rules as BollingerStrategy, with bands around an EMA (see EMABollinger). 'sma' holds the EMA.
+
+    :param window_size: Number of prices the EMA spans, as an integer
+    :param k:           Width of the bands in standard deviations, as a float
+    '''
+    name = 'ema_bollinger'
+
+    def __init__(self, feed, window_size, k=2):
+        Strategy.__init__(self, feed)
+        self.bollinger = feed.ema_bollinger(window_size, k)
+
+
+class RSIStrategy(Strategy):
+    '''
+    Buys when the RSI is at or below the oversold level and sells at or above the overbought level.
+    Stored as: 'sma' is the RSI, 'upper_band' / 'lower_band' are the overbought / oversold levels, 'standard_deviation' is 0.
+
+    :param periods:     RSI periods, as an integer
+    :param oversold:    Buy level, as a float
+    :param overbought:  Sell level, as a float
+    '''
+    name = 'rsi'
+
+    def __init__(self, feed, periods=14, oversold=30, overbought=70):
+        super().__init__(feed)
+        self.rsi = feed.rsi(periods)
+        self.oversold = oversold
+        self.overbought = overbought
+
+    def is_ready(self):
+        return self.rsi.is_ready()
+
+    def values(self):
+        return {
+            'price': self.feed.price,
+            'sma': self.rsi.value,
+            'standard_deviation': 0.0,
+            'upper_band': float(self.overbought),
+            'lower_band': float(self.oversold)
+        }
+
+    def decide(self, values):
+        return funcs.get_bsh(values['sma'], values['upper_band'], values['lower_band'])
+
+
+class MACDStrategy(Strategy):
+    '''
+    Buys when the MACD line crosses above its signal line and sells when it crosses below.
+    Stored as: 'sma' is the MACD line, 'upper_band' and 'lower_band' are the signal line, 'standard_deviation' is the histogram.
+
+    :param fast:    Fast EMA periods, as an integer
+    :param slow:    Slow EMA periods, as an integer
+    :param signal:  Signal line periods, as an integer
+    '''
+    name = 'macd'
+
+    def __init__(self, feed, fast=12, slow=26, signal=9):
+        super().__init__(feed)
+        self.macd = feed.macd(fast, slow, signal)
+
+    def is_ready(self):
+        return self.macd.is_ready()
+
+    def values(self):
+        return {
+            'price': self.feed.price,
+            'sma': self.macd.value,
+            'standard_deviation': self.macd.histogram,
+            'upper_band': self.macd.signal.value,
+            'lower_band': self.macd.signal.value
+        }
+
+    def decide(self, values):
+        if self.macd.previous_histogram <= 0 < self.macd.histogram:
+            return "BUY"
+        if self.macd.previous_histogram >= 0 > self.macd.histogram:
+            return "SELL"
+        return "HOLD"
+
+
+STRATEGIES = {x.name: x for x in (BollingerStrategy, EMABollingerStrategy, RSIStrategy, MACDStrategy)}
+
+
+def build(name, feed, window_size=57600, k=2):
+    '''
+    Builds a strategy by name on a feed. The Bollinger strategies use `window_size` and `k`; RSI and MACD use their usual periods.
+
+    :param name:        'bollinger', 'ema_bollinger', 'rsi' or 'macd', as a string
+    :param feed:        Price feed of the symbol to trade, as a Feed
+    :param window_size: Number of prices in the Bollinger window, as an integer
+    :param k:           Width of the Bollinger bands in standard deviations, as a float
+    :rtype:             Strategy
+    '''
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {name}")
+    if name in ('bollinger', 'ema_bollinger'):
+        return STRATEGIES[name](feed, window_size, k)
+    return STRATEGIES[name](feed)
@@ -0,0 +1,116 @@
+import unittest
+import numpy as np
+from storage import MemoryStorage
+from strategies import *
+
+
+def reference_ema(data, periods):
+    # SMA of the first n prices, then the usual recursion
+    value = float(np.mean(data[:periods]))
+    for price in data[periods:]:
+        value += 2 / (periods + 1) * (price - value)
+    return value
+
+
+class StrategiesTestCase(unittest.TestCase):
+
+    def test_ema(self):
+        data = np.random.default_rng(0).normal(100.0, 5.0, 50).tolist()
+        ema = EMA(10)
+        for i, price in enumerate(data):
+            ema.push(price)
+            self.assertEqual(ema.is_ready(), i >= 9)
+            if ema.is_ready():
+                self.assertAlmostEqual(ema.value, reference_ema(data[:i + 1], 10))
+
+    def test_ema_bollinger(self):
+        bollinger = EMABollinger(5, k=2)
+        for price in [10.0] * 5:
+            bollinger.push(price)
+        bands = bollinger.bands()
+        self.assertTrue(bollinger.is_ready())
+        self.assertEqual((bands['sma'], bands['standard_deviation']), (10.0, 0.0))
+        bollinger.push(16.0)
+        bands = bollinger.bands()
+        # alpha = 1/3: the mean moves a third of the way, variance = (1 - alpha) * alpha * 36
+        self.assertAlmostEqual(bands['sma'], 12.0)
+        self.assertAlmostEqual(bands['standard_deviation'], math.sqrt(8.0))
+        self.assertAlmostEqual(bands['upper_band'], 12.0 + 2 * math.sqrt(8.0))
+
+    def test_rsi(self):
+        rsi = RSI(periods=4)
+        for price in [10.0, 11.0, 12.0, 11.0]:
+            rsi.push(price)
+        self.assertFalse(rsi.is_ready())
+        rsi.push(13.0)
+        # Gains 1, 1, 0, 2 and losses 0, 0, 1, 0
+        self.assertAlmostEqual(rsi.value, 100 - 100 / (1 + 1.0 / 0.25))
+        rsi.push(12.0)
+        # Wilder's smoothing: (avg * 3 + change) / 4
+        self.assertAlmostEqual(rsi.value, 100 - 100 / (1 + 0.75 / 0.4375))
+
+    def test_feed_shares_indicators(self):
+        feed = Feed(MemoryStorage(), 'BTCUSDT')
+        macd = feed.macd(fast=3, slow=6, signal=3)
+        self.assertIs(feed.ema(3), macd.fast)
+        self.assertIs(feed.macd(fast=3, slow=6, signal=3), macd)
+        self.assertEqual(len(feed.indicators), 3)
+        data = [float(x) for x in range(1, 20)]
+        for price in data:
+            feed.push(price)
+        self.assertTrue(macd.is_ready())
+        self.assertAlmostEqual(macd.value, reference_ema(data, 3) - reference_ema(data, 6))
+        # Warming up in one go gives the same state as pushing one by one
+        warmed = Feed(MemoryStorage(), 'BTCUSDT')
+        warmed.macd(fast=3, slow=6, signal=3)
+        warmed.extend(np.array(data), np.zeros(len(data), dtype='datetime64[ms]'))
+        self.assertAlmostEqual(warmed.macd(fast=3, slow=6, signal=3).histogram, macd.histogram)
+        self.assertEqual(warmed.price, 19.0)
+
+    def test_bollinger_strategy(self):
+        # Same bands and advice as make_advice()
+        feed = Feed(MemoryStorage(), 'BTCUSDT')
+        strategy = build('bollinger', feed, window_size=10, k=1)
+        data = [float(x) for x in range(1, 11)]
+        for price in data[:-1]:
+            feed.push(price)
+        with self.assertRaises(ValueError):
+            strategy.advise()
+        feed.push(data[-1])
+        advice = strategy.advise()
+        self.assertAlmostEqual(advice['sma'], 5.5)
+        self.assertAlmostEqual(advice['upper_band'], 8.3722813)
+        self.assertEqual(advice['advice'], "SELL")
+
+    def test_rsi_and_macd_strategies(self):
+        feed = Feed(MemoryStorage(), 'BTCUSDT')
+        rsi = build('rsi', feed)
+        macd = build('macd', feed)
+        # An accelerating sell-off keeps the MACD below its signal line
+        for i in range(40):
+            feed.push(100.0 - 0.05 * i * i)
+        self.assertEqual(rsi.advise()['advice'], "BUY")
+        self.assertEqual(rsi.advise()['sma'], 0.0)
+        self.assertEqual(macd.advise()['advice'], "HOLD")
+        # A sharp rally turns the MACD histogram positive
+        feed.push(120.0)
+        self.assertEqual(macd.advise()['advice'], "BUY")
+        feed.push(121.0)
+        self.assertEqual(macd.advise()['advice'], "HOLD")
+        self.assertEqual(rsi.advise()['advice'], "SELL")
+        with self.assertRaises(ValueError):
+            build('martingale', feed)
+
+    def test_load(self):
+        memory = MemoryStorage()
+        memory.create_prices([(float(x), 1000 * x) for x in range(1, 31)], symbol='ETHUSDT')
+        feed = Feed(memory, 'ETHUSDT')
+        strategy = build('ema_bollinger', feed, window_size=20)
+        feed.load(30)
+        self.assertEqual(feed.price, 30.0)
+        self.assertEqual(strategy.advise()['price'], 30.0)
+        self.assertEqual(strategy.bollinger.count, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,353 @@
+import base64
+import hashlib
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+import storage
+import funcs
+
+# Binance.US market streams; one connection carries every symbol
+STREAM_BASE_URL = 'wss://stream.binance.us:9443'
+
+_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_CONTINUATION, _TEXT, _BINARY, _CLOSE, _PING, _PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def _mask(payload, key):
+    # XOR in one go on big integers instead of byte by byte
+    n = len(payload)
+    mask = int.from_bytes((key * (n // 4 + 1))[:n], 'big')
+    return (int.from_bytes(payload, 'big') ^ mask).to_bytes(n, 'big')
+
+
+class WebSocket:
+    '''
+    Minimal WebSocket client (RFC 6455) on a plain socket: text messages, fragmentation, ping / pong and close.
+    Partially received frames stay buffered when a read times out, so `recv()` can be called again.
+
+    :param url:     ws:// or wss:// URL, as a string
+    :param timeout: Connect and handshake timeout in seconds, as a float
+    '''
+    def __init__(self, url, timeout=10.0):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('ws', 'wss'):
+            raise ValueError(f"Not a WebSocket URL: {url}")
+        port = parts.port or (443 if parts.scheme == 'wss' else 80)
+        sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        if parts.scheme == 'wss':
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self._buffer = bytearray()
+        self._fragments = []
+        self.closed = False
+        try:
+            self._handshake(parts, port)
+        except BaseException:
+            sock.close()
+            raise
+
+    def _handshake(self, parts, port):
+        key = base64.b64encode(os.urandom(16))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        self.sock.sendall(
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.hostname}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key.decode()}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n".encode()
+        )
+        while b'\r\n\r\n' not in self._buffer:
+            self._receive()
+        end = self._buffer.index(b'\r\n\r\n') + 4
+        lines = bytes(self._buffer[:end]).decode('latin-1').split('\r\n')
+        del self._buffer[:end]
+        if lines[0].split(' ')[1:2] != ['101']:
+            raise ConnectionError(f"WebSocket handshake failed: {lines[0]}")
+        headers = {x.split(':', 1)[0].strip().lower(): x.split(':', 1)[1].strip() for x in lines[1:] if ':' in x}
+        accept = base64.b64encode(hashlib.sha1(key + _GUID).digest()).decode()
+        if headers.get('sec-websocket-accept') != accept:
+            raise ConnectionError("WebSocket handshake failed: bad Sec-WebSocket-Accept")
+
+    def _receive(self):
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            self.closed = True
+            raise ConnectionError("WebSocket connection closed")
+        self._buffer += chunk
+
+    def _frame(self):
+        # Returns (fin, opcode, payload) once a whole frame is buffered; nothing is consumed before that
+        while True:
+            buffer = self._buffer
+            if len(buffer) >= 2:
+                length = buffer[1] & 0x7F
+                offset = {126: 4, 127: 10}.get(length, 2)
+                start = offset + (4 if buffer[1] & 0x80 else 0)
+                if len(buffer) >= start:
+                    if offset > 2:
+                        length = int.from_bytes(buffer[2:offset], 'big')
+                    if len(buffer) >= start + length:
+                        payload = bytes(buffer[start:start + length])
+                        if start > offset:
+                            payload = _mask(payload, bytes(buffer[offset:start]))
+                        fin, opcode = buffer[0] & 0x80, buffer[0] & 0x0F
+                        del buffer[:start + length]
+                        return fin, opcode, payload
+            self._receive()
+
+    def send(self, payload, opcode=_TEXT):
+        '''
+        Sends one unfragmented message. Client frames are always masked.
+
+        :param payload: Message, as a string or bytes
+        :param opcode:  Frame type, as an integer (text by default)
+        '''
+        if isinstance(payload, str):
+            payload = payload.encode()
+        n = len(payload)
+        if n < 126:
+            header = bytes([0x80 | opcode, 0x80 | n])
+        elif n < 1 << 16:
+            header = bytes([0x80 | opcode, 0x80 | 126]) + n.to_bytes(2, 'big')
+        else:
+            header = bytes([0x80 | opcode, 0x80 | 127]) + n.to_bytes(8, 'big')
+        key = os.urandom(4)
+        self.sock.sendall(header + key + _mask(payload, key))
+
+    def recv(self, timeout=None):
+        '''
+        Returns the next text message, answering pings on the way.
+
+        :param timeout: Seconds to wait, as a float (None waits forever); raises TimeoutError when it runs out
+        :rtype:         String
+        '''
+        self.sock.settimeout(timeout)
+        while True:
+            fin, opcode, payload = self._frame()
+            if opcode == _PING:
+                self.send(payload, _PONG)
+            elif opcode == _PONG:
+                continue
+            elif opcode == _CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    self.send(payload[:2], _CLOSE)
+                raise ConnectionError("WebSocket closed by server")
+            else:
+                self._fragments.append(payload)
+                if fin:
+                    message = b''.join(self._fragments)
+                    self._fragments = []
+                    return message.decode()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.send((1000).to_bytes(2, 'big'), _CLOSE)
+            except OSError:
+                pass
+        self.sock.close()
+
+
+def stream_url(symbols, stream='trade', base_url=STREAM_BASE_URL):
+    '''
+    Returns the combined-stream URL for a set of symbols.
+
+    :param symbols: Trading pairs, as a list of strings
+    :param stream:  'trade' (every trade) or 'bookTicker' (best bid / ask changes), as a string
+    :param base_url: Stream endpoint, as a string
+    :rtype:         String
+    '''
+    if stream not in ('trade', 'bookTicker'):
+        raise ValueError(f"Unknown stream: {stream}")
+    return f"{base_url}/stream?streams={'/'.join(f'{x.lower()}@{stream}' for x in symbols)}"
+
+
+def parse_update(message):
+    '''
+    Parses a trade or bookTicker stream message (plain or wrapped in a combined-stream envelope).
+    Trades give their price and trade time; book tickers give the bid / ask midpoint, stamped with the time received.
+
+    :param message: Message, as a string
+    :rtype:         (symbol, price, timestamp in epoch milliseconds), or None for anything else (e.g. subscription replies)
+    '''
+    data = json.loads(message)
+    if isinstance(data, dict):
+        data = data.get('data', data)
+    if not isinstance(data, dict) or 's' not in data:
+        return None
+    if 'p' in data:
+        return data['s'], float(data['p']), int(data.get('T') or data.get('E') or storage.now_ms())
+    if 'b' in data and 'a' in data:
+        return data['s'], (float(data['b']) + float(data['a'])) / 2, int(data.get('E') or storage.now_ms())
+    return None
+
+
+class TickAggregator:
+    '''
+    Turns a stream of price updates into one tick per symbol per interval: the last price in the interval, at the time it was seen.
+    Updates that arrive after their interval was closed are dropped.
+
+    :param interval_ms: Tick length in milliseconds, as an integer
+    '''
+    def __init__(self, interval_ms=1000):
+        self.interval_ms = int(interval_ms)
+        self.current = {}   # symbol -> [bucket, price, timestamp, updates]
+        self.closed = {}    # symbol -> last bucket closed
+
+    def add(self, symbol, price, timestamp):
+        '''
+        Adds an update.
+
+        :rtype:     The tick it closed, as a PriceQuote, or None
+        '''
+        bucket = timestamp // self.interval_ms
+        if bucket <= self.closed.get(symbol, bucket - 1):
+            return None
+        current = self.current.get(symbol)
+        if current is None or bucket > current[0]:
+            self.current[symbol] = [bucket, price, timestamp, 1]
+            if current is None:
+                return None
+            self.closed[symbol] = current[0]
+            return self._quote(symbol, current)
+        if bucket == current[0] and timestamp >= current[2]:
+            current[1], current[2] = price, timestamp
+            current[3] += 1
+        return None
+
+    def close_due(self, now_ms):
+        '''
+        Closes every tick whose interval has ended, so quiet symbols still produce ticks on time.
+
+        :param now_ms:  Current time, in epoch milliseconds
+        :rtype:         List of PriceQuote
+        '''
+        closed = []
+        for symbol, current in list(self.current.items()):
+            if (current[0] + 1) * self.interval_ms <= now_ms:
+                closed.append(self._quote(symbol, current))
+                self.closed[symbol] = current[0]
+                del self.current[symbol]
+        return closed
+
+    def _quote(self, symbol, current):
+        # Latency is how far the tick's last update lagged behind it being closed
+        return funcs.PriceQuote(symbol, current[1], current[2], max(storage.now_ms() - current[2], 0) / 1000)
+
+
+class StreamIngestor:
+    '''
+    Streams prices from the exchange WebSocket in a background thread, aggregates them into ticks
+    and saves each batch of ticks with one statement per symbol in one transaction. Reconnects with exponential backoff.
+
+    :param url:             Stream URL (see `stream_url()`), as a string
+    :param db_utils:        Where the ticks are saved: a storage (see storage.py), or a module of storage functions such as demo_db_utils
+    :param interval_ms:     Tick length in milliseconds, as an integer
+    :param flush_interval:  Seconds between batches, as a float
+    :param on_ticks:        Called with each batch of ticks (a list of PriceQuote, oldest first) inside the batch's transaction,
+                            before the batch is saved (optional)
+    :param backoff:         Delay before the first reconnect in seconds, doubled on each failure up to 30 seconds, as a float
+    '''
+    def __init__(self, url, db_utils, interval_ms=1000, flush_interval=0.25, on_ticks=None, backoff=1.0):
+        self.url = url
+        self.db_utils = db_utils
+        self.aggregator = TickAggregator(interval_ms)
+        self.flush_interval = flush_interval
+        self.on_ticks = on_ticks
+        self.backoff = backoff
+        self.updates = 0
+        self.ticks = 0
+        self.batches = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='stream', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        # The stream thread notices within one flush interval, saves what it has and exits
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        '''
+        Streams until `stop()` is called. Any error (connection, parsing, saving or `on_ticks`) is logged and the stream reconnects,
+        so the thread only ends when stopped.
+        '''
+        delay = self.backoff
+        while not self._stop.is_set():
+            try:
+                ws = WebSocket(self.url)
+            except Exception as e:
+                funcs.logger(f"Failed to connect. Error message: {e!r}", stage='stream')
+            else:
+                delay = self.backoff
+                try:
+                    self._stream(ws)
+                except Exception as e:
+                    funcs.logger(f"Disconnected. Error message: {e!r}", stage='stream')
+                finally:
+                    ws.close()
+            self._stop.wait(delay)
+            delay = min(delay * 2, 30.0)
+        try:
+            self.flush(self.aggregator.close_due(2 ** 62))
+        except Exception as e:
+            funcs.logger(f"Failed to save the last ticks. Error message: {e!r}", stage='stream')
+
+    def _stream(self, ws):
+        pending = []
+        next_flush = time.monotonic() + self.flush_interval
+        try:
+            while not self._stop.is_set():
+                try:
+                    update = parse_update(ws.recv(max(next_flush - time.monotonic(), 0.001)))
+                except TimeoutError:
+                    update = None
+                if update is not None:
+                    self.updates += 1
+                    tick = self.aggregator.add(*update)
+                    if tick is not None:
+                        pending.append(tick)
+                if time.monotonic() >= next_flush:
+                    pending.extend(self.aggregator.close_due(storage.now_ms()))
+                    # Taken off `pending` first, so a batch that fails to save is not saved again below
+                    ticks, pending = pending, []
+                    self.flush(ticks)
+                    next_flush = time.monotonic() + self.flush_interval
+        finally:
+            # Ticks closed since the last batch are saved even if the connection dropped
+            self.flush(pending)
+
+    def flush(self, ticks):
+        '''
+        Saves a batch of ticks and hands it to `on_ticks`, in one transaction.
+
+        :param ticks:   Ticks, oldest first, as a list of PriceQuote
+        '''
+        if not ticks:
+            return
+        rows = {}
+        for quote in ticks:
+            rows.setdefault(quote.symbol, []).append((quote.price, quote.timestamp))
+        with self.db_utils.transaction():
+            if self.on_ticks is not None:
+                self.on_ticks(ticks)
+            for symbol, symbol_rows in rows.items():
+                self.db_utils.create_prices(symbol_rows, symbol=symbol)
+        self.ticks += len(ticks)
+        self.batches += 1
@@ -0,0 +1,169 @@
+import base64
+import hashlib
+import json
+import socketserver
+import sqlite3
+import threading
+import time
+import unittest
+from unittest import mock
+import storage
+from stream import *
+
+START = 1577836800000 # 2020-01-01 00:00:00 UTC
+
+
+def trade(symbol, price, timestamp):
+    return json.dumps({'stream': f"{symbol.lower()}@trade", 'data': {'e': 'trade', 's': symbol, 'p': str(price), 'T': timestamp}})
+
+
+class StandInStreamHandler(socketserver.StreamRequestHandler):
+    # Accepts the handshake, plays the scripted frames, then records what the client sends until it hangs up
+    script = []
+    received = []
+
+    def handle(self):
+        request = b''
+        while not request.endswith(b'\r\n\r\n'):
+            request += self.rfile.read(1)
+        key = [x.split(b': ')[1] for x in request.split(b'\r\n') if x.lower().startswith(b'sec-websocket-key')][0]
+        accept = base64.b64encode(hashlib.sha1(key + b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11').digest())
+        self.wfile.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        for frame in self.script:
+            if isinstance(frame, float):
+                time.sleep(frame)
+                continue
+            self.wfile.write(frame)
+        while True:
+            header = self.rfile.read(2)
+            if len(header) < 2:
+                return
+            length = header[1] & 0x7F
+            if length == 126:
+                length = int.from_bytes(self.rfile.read(2), 'big')
+            key = self.rfile.read(4)
+            payload = bytes(b ^ key[i % 4] for i, b in enumerate(self.rfile.read(length)))
+            StandInStreamHandler.received.append((header[0] & 0x0F, payload))
+            if header[0] & 0x0F == 0x8:
+                return
+
+
+def frame(payload, opcode=0x1, fin=True):
+    # Server frames are not masked
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if len(payload) < 126:
+        header = bytes([(0x80 if fin else 0) | opcode, len(payload)])
+    else:
+        header = bytes([(0x80 if fin else 0) | opcode, 126]) + len(payload).to_bytes(2, 'big')
+    return header + payload
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def serve(self, script):
+        StandInStreamHandler.script = script
+        StandInStreamHandler.received = []
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInStreamHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"ws://127.0.0.1:{server.server_address[1]}/stream?streams=btcusdt@trade"
+
+    def test_websocket(self):
+        long_message = 'x' * 300
+        url = self.serve([
+            frame('{"result":null,"id":1}'),
+            frame(b'ping!', opcode=0x9),
+            frame('hel', fin=False),
+            frame('lo', opcode=0x0),
+            frame(long_message),
+            0.3,
+            frame((1000).to_bytes(2, 'big'), opcode=0x8)
+        ])
+        ws = WebSocket(url)
+        self.assertEqual(ws.recv(timeout=5), '{"result":null,"id":1}')
+        self.assertEqual(ws.recv(timeout=5), 'hello')
+        self.assertEqual(ws.recv(timeout=5), long_message)
+        # Nothing else arrives in time, then the server closes
+        with self.assertRaises(TimeoutError):
+            ws.recv(timeout=0.05)
+        with self.assertRaises(ConnectionError):
+            ws.recv(timeout=5)
+        ws.close()
+        time.sleep(0.1)
+        self.assertEqual(StandInStreamHandler.received[0], (0xA, b'ping!'))
+        self.assertEqual(StandInStreamHandler.received[-1][0], 0x8)
+
+    def test_parse_update(self):
+        self.assertEqual(parse_update(trade('BTCUSDT', 30000.5, START)), ('BTCUSDT', 30000.5, START))
+        self.assertEqual(parse_update('{"u":1,"s":"ETHUSDT","b":"10.0","B":"1","a":"12.0","A":"1","E":5}'), ('ETHUSDT', 11.0, 5))
+        self.assertIsNone(parse_update('{"result":null,"id":1}'))
+        self.assertEqual(stream_url(['BTCUSDT', 'ETHUSDT'], 'bookTicker', 'ws://x'), 'ws://x/stream?streams=btcusdt@bookTicker/ethusdt@bookTicker')
+
+    def test_aggregator(self):
+        aggregator = TickAggregator(1000)
+        self.assertIsNone(aggregator.add('BTCUSDT', 1.0, START))
+        self.assertIsNone(aggregator.add('BTCUSDT', 2.0, START + 500))
+        self.assertIsNone(aggregator.add('BTCUSDT', 9.0, START + 100))
+        tick = aggregator.add('BTCUSDT', 3.0, START + 1200)
+        self.assertEqual((tick.symbol, tick.price, tick.timestamp), ('BTCUSDT', 2.0, START + 500))
+        # Late updates for a closed interval are dropped
+        self.assertIsNone(aggregator.add('BTCUSDT', 7.0, START + 900))
+        self.assertEqual(aggregator.close_due(START + 1999), [])
+        self.assertEqual([x.price for x in aggregator.close_due(START + 2000)], [3.0])
+        # Including once the interval was closed by close_due(), when there is no open tick left to compare with
+        self.assertIsNone(aggregator.add('BTCUSDT', 8.0, START + 1900))
+        self.assertIsNone(aggregator.add('BTCUSDT', 4.0, START + 2200))
+        self.assertEqual([x.timestamp for x in aggregator.close_due(START + 3000)], [START + 2200])
+
+    def test_ingestor(self):
+        script = [frame(trade('BTCUSDT', 100.0 + i, START + 250 * i)) for i in range(10)]
+        script += [frame(trade('ETHUSDT', 10.0, START + 100)), 1.0]
+        url = self.serve(script)
+        batches = []
+        memory = storage.MemoryStorage()
+        ingestor = StreamIngestor(url, memory, interval_ms=1000, flush_interval=0.05, on_ticks=batches.append)
+        ingestor.start()
+        deadline = time.monotonic() + 5
+        while ingestor.ticks < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        ingestor.stop()
+        self.assertEqual(ingestor.updates, 11)
+        # One tick per second per symbol: the last price in each second
+        prices = memory.read_price_array(10, columns=('price', 'timestamp'), order='asc')
+        self.assertEqual(prices['price'].tolist(), [103.0, 107.0, 109.0])
+        self.assertEqual(memory.read_price_array(10, symbol='ETHUSDT')['price'].tolist(), [10.0])
+        self.assertEqual(memory.read_candles('1m', 1, columns=('count',))['count'].tolist(), [3])
+        self.assertEqual(sum(len(x) for x in batches), 4)
+
+    def test_ingestor_errors(self):
+        # A batch that fails to save is logged and the stream reconnects, instead of the thread dying
+        url = self.serve([frame(trade('BTCUSDT', 100.0 + i, START + 1000 * i)) for i in range(3)] + [1.0])
+        calls = []
+
+        def on_ticks(ticks):
+            calls.append(ticks)
+            if len(calls) == 1:
+                # The failed batch is dropped, so the stream carries on with newer prices after reconnecting
+                StandInStreamHandler.script = [frame(trade('BTCUSDT', 200.0 + i, START + 10000 + 1000 * i)) for i in range(3)] + [1.0]
+                raise sqlite3.OperationalError("database is locked")
+
+        with mock.patch('funcs.logger') as logger:
+            ingestor = StreamIngestor(url, storage.MemoryStorage(), interval_ms=1000, flush_interval=0.05, on_ticks=on_ticks, backoff=0.05)
+            ingestor.start()
+            deadline = time.monotonic() + 5
+            while ingestor.batches < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(ingestor._thread.is_alive())
+            ingestor.stop()
+        self.assertGreaterEqual(ingestor.batches, 1)
+        # The failed batch is not handed out again
+        self.assertFalse([x for later in calls[1:] for x in later if x in calls[0]])
+        self.assertIn("database is locked", logger.call_args_list[0].args[0])
+        self.assertEqual(logger.call_args_list[0].kwargs['stage'], 'stream')
+
+
+if __name__ == '__main__':
+    unittest.main()